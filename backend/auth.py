@@ -1,22 +1,125 @@
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from fastapi import HTTPException, Security
+from fastapi import Depends, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict
+import asyncio
+import hmac
+import time
+import uuid
 import os
 
+from metrics import METRICS_TOKEN, cache_lookups, password_hash_latency, password_queue_wait, waiting_on
+from revocation import revocation_list
+
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production-12345')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing pool: bcrypt is deliberately slow, so it runs on a bounded
+# worker pool instead of the event loop. PASSWORD_POOL is "thread" (bcrypt
+# releases the GIL) or "process".
+PASSWORD_POOL = os.environ.get('PASSWORD_POOL', 'thread')
+PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', min(4, os.cpu_count() or 1)))
+PASSWORD_POOL_MAX_QUEUE = int(os.environ.get('PASSWORD_POOL_MAX_QUEUE', PASSWORD_POOL_WORKERS * 8))
+PASSWORD_POOL_RETRY_AFTER = 1
+
+# Verified token payloads are cached so repeat requests skip the signature check.
+# Entries never outlive the token's own exp claim.
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 300))
+
+# passlib (with bcrypt) and jose (with its crypto backends) are imported on
+# first use rather than at worker boot; preload() pulls them in off the
+# startup path
+_pwd_context = None
 security = HTTPBearer()
 
+_password_executor = None
+_password_pending = 0
+_token_cache = OrderedDict()
+
+def _get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+def preload():
+    """Import the deferred auth dependencies, e.g. from a background thread
+    once the worker is serving"""
+    _get_pwd_context()
+    import jose.jwt  # noqa: F401
+
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return _get_pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return _get_pwd_context().verify(plain_password, hashed_password)
+
+def _get_password_executor():
+    global _password_executor
+    if _password_executor is None:
+        if PASSWORD_POOL == "process":
+            _password_executor = ProcessPoolExecutor(max_workers=PASSWORD_POOL_WORKERS)
+        else:
+            _password_executor = ThreadPoolExecutor(
+                max_workers=PASSWORD_POOL_WORKERS, thread_name_prefix="password"
+            )
+    return _password_executor
+
+def _timed_call(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, started, time.perf_counter() - started
+
+async def _run_in_password_pool(func, *args):
+    """Run a bcrypt call on the worker pool, shedding load with 503 once the
+    number of running plus queued calls reaches PASSWORD_POOL_MAX_QUEUE."""
+    global _password_pending
+    if _password_pending >= PASSWORD_POOL_MAX_QUEUE:
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, please retry",
+            headers={"Retry-After": str(PASSWORD_POOL_RETRY_AFTER)}
+        )
+    _password_pending += 1
+    submitted = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        with waiting_on("cpu", func.__name__):
+            result, started, duration = await loop.run_in_executor(
+                _get_password_executor(), _timed_call, func, *args
+            )
+    finally:
+        _password_pending -= 1
+    operation = func.__name__
+    password_hash_latency.observe(duration, operation)
+    # perf_counter is system-wide on Linux, so the worker's start time is
+    # comparable even when the pool runs in another process
+    password_queue_wait.observe(max(started - submitted, 0), operation)
+    return result
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_password_pool(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_password_pool(verify_password, plain_password, hashed_password)
+
+def password_pool_stats():
+    return {
+        "pool": PASSWORD_POOL,
+        "workers": PASSWORD_POOL_WORKERS,
+        "maxQueue": PASSWORD_POOL_MAX_QUEUE,
+        "pending": _password_pending
+    }
+
+def shutdown_password_pool():
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=True)
+        _password_executor = None
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -24,31 +127,66 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    # jti names the token for revocation; iat is fractional so a token issued
+    # right after a per-user revocation is not caught by it
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def decode_token(token: str):
+    now = time.time()
+    cached = _token_cache.get(token)
+    if cached is not None:
+        payload, expires_at = cached
+        if expires_at > now:
+            _token_cache.move_to_end(token)
+            cache_lookups.inc("token", "hit")
+            return payload
+        del _token_cache[token]
+    cache_lookups.inc("token", "miss")
+
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
-    token = credentials.credentials
+    expires_at = min(now + TOKEN_CACHE_TTL, payload.get("exp", now))
+    if expires_at > now:
+        _token_cache[token] = (payload, expires_at)
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return payload
+
+def clear_token_cache():
+    _token_cache.clear()
+
+async def authenticate(token: str):
+    """Decode a bearer token and reject it if it has been revoked"""
     payload = decode_token(token)
+    await revocation_list.check(payload)
+    return payload
+
+async def get_token_payload(credentials: HTTPAuthorizationCredentials = Security(security)):
+    return await authenticate(credentials.credentials)
+
+async def get_current_user(payload: dict = Depends(get_token_payload)):
     user_id = payload.get("sub")
     role = payload.get("role")
     if user_id is None:
         raise HTTPException(status_code=401, detail="Invalid token")
     return {"id": user_id, "role": role}
 
-async def get_current_admin(credentials: HTTPAuthorizationCredentials = Security(security)):
-    token = credentials.credentials
-    payload = decode_token(token)
+async def get_current_admin(payload: dict = Depends(get_token_payload)):
     user_id = payload.get("sub")
     role = payload.get("role")
     if role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
-    return {"id": user_id, "role": role}
\ No newline at end of file
+    return {"id": user_id, "role": role}
+
+async def get_metrics_reader(credentials: HTTPAuthorizationCredentials = Security(security)):
+    """A scraper presenting METRICS_TOKEN, or an admin"""
+    if METRICS_TOKEN and hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        return {"id": None, "role": "metrics"}
+    return await get_current_admin(await authenticate(credentials.credentials))
\ No newline at end of file
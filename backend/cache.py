@@ -0,0 +1,195 @@
+from fastapi import Request, Response
+from pymongo.errors import PyMongoError
+
+from responses import dumps
+import asyncio
+import hashlib
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Safety net for multi-worker deployments without change streams: a write on
+# one worker becomes visible on the others after at most this many seconds.
+PUBLIC_CACHE_TTL = float(os.environ.get('PUBLIC_CACHE_TTL', 300))
+CACHE_CHANGE_STREAMS = os.environ.get('CACHE_CHANGE_STREAMS', 'false').lower() == 'true'
+
+# Lets browsers and CDNs reuse public responses briefly, then keep serving the
+# stale copy while they revalidate in the background.
+PUBLIC_MAX_AGE = int(os.environ.get('PUBLIC_MAX_AGE', 60))
+PUBLIC_STALE_WHILE_REVALIDATE = int(os.environ.get('PUBLIC_STALE_WHILE_REVALIDATE', 600))
+PUBLIC_CACHE_CONTROL = f"public, max-age={PUBLIC_MAX_AGE}, stale-while-revalidate={PUBLIC_STALE_WHILE_REVALIDATE}"
+
+def serialize_json(value) -> bytes:
+    return dumps(value)
+
+def version_etag(docs) -> str:
+    """Strong ETag derived from the id and updatedAt of each document.
+
+    Any create, update (which bumps updatedAt) or delete changes the tag, and
+    it can be computed from a projection without building the response body.
+    """
+    digest = hashlib.sha1()
+    for doc in sorted(docs, key=lambda d: str(d.get("id", d.get("_id")))):
+        updated_at = doc.get("updatedAt")
+        digest.update(str(doc.get("id", doc.get("_id"))).encode())
+        digest.update(b"@")
+        digest.update((updated_at.isoformat() if updated_at else "").encode())
+        digest.update(b";")
+    return '"' + digest.hexdigest() + '"'
+
+def body_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+class CachedBody:
+    """A pre-serialized JSON body together with its strong ETag"""
+
+    def __init__(self, body: bytes, etag: str, expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+
+class ResponseCache:
+    """Read-through cache of serialized JSON bodies, invalidated on writes"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries = {}
+        self._locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self.hits += 1
+            return entry
+        return None
+
+    async def get_or_load(self, key: str, loader):
+        """Return the cached body for key, calling loader() on a miss.
+
+        loader returns (object to serialize, etag), or None for "not found",
+        which is not cached. Concurrent misses on the same key share one load.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self.get(key)
+            if entry is not None:
+                return entry
+            self.misses += 1
+            return self._store(key, await loader())
+
+    async def refill(self, key: str, loader):
+        """Replace the entry for key with a fresh load.
+
+        Called right after a write with a loader that reads the primary: a
+        reader missing the cache meanwhile would load from a secondary, which
+        may not have the write yet, and cache the old version for the whole
+        TTL. Taking the key's lock lets such a load finish first and then
+        overwrites it. If the load fails the entry is just left invalidated.
+        """
+        self.invalidate(key)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            try:
+                return self._store(key, await loader())
+            except Exception as e:
+                self.invalidate(key)
+                logger.warning("Could not refill cache entry %s: %r", key, e)
+                return None
+
+    def _store(self, key: str, loaded):
+        if loaded is None:
+            self._entries.pop(key, None)
+            return None
+        value, etag = loaded
+        entry = CachedBody(serialize_json(value), etag, time.monotonic() + self.ttl)
+        self._entries[key] = entry
+        return entry
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    def invalidate_prefix(self, prefix: str):
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / total if total else 0.0
+        }
+
+public_cache = ResponseCache(PUBLIC_CACHE_TTL)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Evaluate If-None-Match (a list of tags, possibly weak, or *)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in header.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+def not_modified(etag: str):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": PUBLIC_CACHE_CONTROL})
+
+def cached_json_response(request: Request, entry: CachedBody):
+    """Send a cached body, or 304 when the client already holds this version"""
+    if etag_matches(request, entry.etag):
+        return not_modified(entry.etag)
+    return Response(
+        content=entry.body,
+        media_type="application/json",
+        headers={"ETag": entry.etag, "Cache-Control": PUBLIC_CACHE_CONTROL}
+    )
+
+async def conditional_json_response(request: Request, key: str, loader, probe):
+    """Serve a public, cacheable JSON document with conditional GET support.
+
+    On a cache miss, probe() returns the current ETag (or None for "not
+    found") from a cheap projection, so a revalidating client gets its 304
+    without the full documents being loaded or serialized. Returns None
+    when the resource does not exist.
+    """
+    entry = public_cache.get(key)
+    if entry is None:
+        etag = await probe()
+        if etag is None:
+            return None
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        entry = await public_cache.get_or_load(key, loader)
+        if entry is None:
+            return None
+    return cached_json_response(request, entry)
+
+async def watch_invalidations(db, prefixes: dict, callbacks=()):
+    """Invalidate cache prefixes when their collection changes in any worker.
+
+    prefixes maps collection name to the cache key prefix built from it.
+    Change streams need a replica set; on a standalone mongod this logs a
+    warning and returns, leaving PUBLIC_CACHE_TTL as the only bound.
+    """
+    pipeline = [{"$match": {"ns.coll": {"$in": list(prefixes)}}}]
+    try:
+        async with db.watch(pipeline) as stream:
+            async for change in stream:
+                public_cache.invalidate_prefix(prefixes[change["ns"]["coll"]])
+                for callback in callbacks:
+                    callback()
+    except PyMongoError as e:
+        logger.warning("Cache change stream unavailable: %s", e)
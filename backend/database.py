@@ -1,8 +1,18 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReadPreference
+from pymongo.errors import DuplicateKeyError
+from pymongo.monitoring import ConnectionPoolListener
+import asyncio
+import hashlib
+import json
 import os
-from datetime import datetime
+import socket
+import uuid
+import logging
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
+from metrics import instrument_collection, registry
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -10,38 +20,415 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
+
+# Connection pool settings (per worker process)
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 10))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000))
+# Connections opened concurrently at startup so first requests skip the handshake
+MONGO_WARMUP_CONNECTIONS = int(os.environ.get('MONGO_WARMUP_CONNECTIONS', MONGO_MIN_POOL_SIZE))
+# Read preference for read-mostly collections (pricing, SEO, history listing).
+# Credit updates and everything else stay on the primary.
+MONGO_READ_MOSTLY_PREFERENCE = os.environ.get('MONGO_READ_MOSTLY_PREFERENCE', 'secondaryPreferred')
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+class PoolMetricsListener(ConnectionPoolListener):
+    """Tracks open and checked-out connections per server for /metrics.
+
+    pymongo calls these hooks from its own threads; each update is a single
+    dict write, which is safe under the GIL.
+    """
+
+    def __init__(self):
+        self.open = {}
+        self.in_use = {}
+        self.checkout_failures = {}
+
+    def _adjust(self, counts, address, delta):
+        key = f"{address[0]}:{address[1]}"
+        counts[key] = max(counts.get(key, 0) + delta, 0)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        key = f"{event.address[0]}:{event.address[1]}"
+        self.open.pop(key, None)
+        self.in_use.pop(key, None)
+
+    def connection_created(self, event):
+        self._adjust(self.open, event.address, 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._adjust(self.open, event.address, -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        key = (f"{event.address[0]}:{event.address[1]}", str(event.reason))
+        self.checkout_failures[key] = self.checkout_failures.get(key, 0) + 1
+
+    def connection_checked_out(self, event):
+        self._adjust(self.in_use, event.address, 1)
+
+    def connection_checked_in(self, event):
+        self._adjust(self.in_use, event.address, -1)
+
+    def stats(self):
+        return {
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+            "open": dict(self.open),
+            "inUse": dict(self.in_use),
+            "checkoutFailures": sum(self.checkout_failures.values())
+        }
+
+pool_listener = PoolMetricsListener()
+
+def create_client(url: str = mongo_url):
+    return AsyncIOMotorClient(
+        url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        event_listeners=[pool_listener],
+    )
+
+client = create_client()
 db = client[os.environ.get('DB_NAME', 'insightssnap')]
+read_mostly_preference = READ_PREFERENCES[MONGO_READ_MOSTLY_PREFERENCE]
 
-# Collections
-users_collection = db.users
-pricing_plans_collection = db.pricing_plans
-search_history_collection = db.search_history
-payment_settings_collection = db.payment_settings
-seo_settings_collection = db.seo_settings
-admins_collection = db.admins
+def read_mostly(name: str):
+    """A collection handle whose reads may be served by a secondary"""
+    return instrument_collection(db.get_collection(name, read_preference=read_mostly_preference))
 
-async def init_database():
-    """Initialize database with default data"""
+registry.gauge(
+    "mongo_pool_open_connections", "Open connections per server",
+    lambda: {(address,): count for address, count in pool_listener.open.items()},
+    ("address",)
+)
+registry.gauge(
+    "mongo_pool_in_use_connections", "Checked-out connections per server",
+    lambda: {(address,): count for address, count in pool_listener.in_use.items()},
+    ("address",)
+)
+registry.gauge(
+    "mongo_pool_utilization", "Checked-out connections over maxPoolSize per server",
+    lambda: {(address,): count / MONGO_MAX_POOL_SIZE for address, count in pool_listener.in_use.items()},
+    ("address",)
+)
+registry.gauge(
+    "mongo_pool_checkout_failures", "Failed connection checkouts since startup",
+    lambda: {key: count for key, count in pool_listener.checkout_failures.items()},
+    ("address", "reason")
+)
+
+# Collections (wrapped so every operation is timed per collection)
+users_collection = instrument_collection(db.users)
+pricing_plans_collection = instrument_collection(db.pricing_plans)
+search_history_collection = instrument_collection(db.search_history)
+payment_settings_collection = instrument_collection(db.payment_settings)
+seo_settings_collection = instrument_collection(db.seo_settings)
+admins_collection = instrument_collection(db.admins)
+search_cache_collection = instrument_collection(db.search_cache)
+search_results_collection = instrument_collection(db.search_results)
+export_jobs_collection = instrument_collection(db.export_jobs)
+rate_limits_collection = instrument_collection(db.rate_limits)
+migrations_collection = instrument_collection(db.migrations)
+bootstrap_collection = instrument_collection(db.bootstrap)
+revoked_tokens_collection = instrument_collection(db.revoked_tokens)
+
+# Read-mostly handles; only use them where slightly stale data is acceptable
+pricing_plans_read_collection = read_mostly("pricing_plans")
+seo_settings_read_collection = read_mostly("seo_settings")
+search_history_read_collection = read_mostly("search_history")
+
+logger = logging.getLogger(__name__)
+
+# Optional retention for search history; unset keeps history forever
+SEARCH_HISTORY_TTL_DAYS = os.environ.get('SEARCH_HISTORY_TTL_DAYS')
+
+def _index_declarations():
+    """Indexes every collection should have, keyed by collection name"""
+    search_history_indexes = [
+        IndexModel(
+            [("userId", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="userId_timestamp_id"
+        ),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ]
+    if SEARCH_HISTORY_TTL_DAYS:
+        search_history_indexes.append(IndexModel(
+            [("timestamp", ASCENDING)], name="timestamp_ttl",
+            expireAfterSeconds=int(SEARCH_HISTORY_TTL_DAYS) * 86400
+        ))
+
+    return {
+        users_collection: [
+            IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+            IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+            IndexModel([("plan", ASCENDING), ("_id", ASCENDING)], name="plan_id"),
+            # Admin listings filtered by email prefix or signup window page in
+            # (field, _id) order, see repositories.user_sort_field
+            IndexModel([("email", ASCENDING), ("_id", ASCENDING)], name="email_id"),
+            IndexModel([("createdAt", ASCENDING), ("_id", ASCENDING)], name="createdAt_id"),
+        ],
+        pricing_plans_collection: [
+            IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+            IndexModel([("isActive", ASCENDING)], name="isActive"),
+        ],
+        seo_settings_collection: [
+            IndexModel([("page", ASCENDING)], name="page_unique", unique=True),
+        ],
+        admins_collection: [
+            IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        ],
+        payment_settings_collection: [
+            IndexModel([("gateway", ASCENDING)], name="gateway_unique", unique=True),
+        ],
+        search_history_collection: search_history_indexes,
+        search_cache_collection: [
+            IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+        ],
+        rate_limits_collection: [
+            IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+        ],
+        export_jobs_collection: [
+            IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+            IndexModel([("status", ASCENDING), ("createdAt", ASCENDING)], name="status_createdAt"),
+            IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+        ],
+        revoked_tokens_collection: [
+            IndexModel([("revokedAt", ASCENDING)], name="revokedAt"),
+            IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+        ],
+    }
+
+def _index_options(spec: dict):
+    options = {k: v for k, v in spec.items() if k not in ("v", "ns", "name", "background")}
+    options["key"] = [tuple(field) for field in spec["key"]]
+    return options
+
+async def ensure_indexes():
+    """Create declared indexes, rebuilding any whose definition has changed.
+
+    Safe to run on every startup: indexes that already match are left alone.
+    """
+    for collection, models in _index_declarations().items():
+        existing = await collection.index_information()
+        stale = []
+        for model in models:
+            wanted = dict(model.document)
+            name = wanted["name"]
+            wanted["key"] = wanted["key"].items()
+            if name in existing and _index_options(existing[name]) != _index_options(wanted):
+                stale.append(name)
+        for name in stale:
+            logger.info("Rebuilding index %s.%s", collection.name, name)
+            await collection.drop_index(name)
+        await collection.create_indexes(models)
+
+# ==================== Migrations ====================
+
+async def _backfill_ids():
+    """Give seeded pricing plans and SEO settings an application-level id"""
+    for collection in (pricing_plans_collection, seo_settings_collection):
+        async for doc in collection.find({"id": {"$exists": False}}, {"_id": 1}):
+            await collection.update_one({"_id": doc["_id"]}, {"$set": {"id": str(uuid.uuid4())}})
+
+# Entries rewritten per round trip by the content-hash migration
+DEDUPE_BATCH_SIZE = int(os.environ.get('DEDUPE_BATCH_SIZE', 1000))
+
+async def _dedupe_search_history():
+    """Move inline search_history results into the content-addressed store.
+
+    Works in _id order, in batches, and records the last _id done on the
+    migration record, so a worker that takes the migration over resumes
+    where the previous one stopped instead of starting again.
+    """
+    from pymongo import UpdateOne
+    from repositories import repos
+    from result_store import result_document
+
+    record = await migrations_collection.find_one({"_id": 2}, {"checkpoint": 1})
+    checkpoint = (record or {}).get("checkpoint")
+    moved = 0
+    while True:
+        query = {"results": {"$exists": True}}
+        if checkpoint is not None:
+            query["_id"] = {"$gt": checkpoint}
+        batch = await search_history_collection.find(query, {"results": 1}).sort("_id", 1).limit(
+            DEDUPE_BATCH_SIZE
+        ).to_list(DEDUPE_BATCH_SIZE)
+        if not batch:
+            break
+        docs = {}
+        updates = []
+        for entry in batch:
+            doc = result_document(entry["results"])
+            docs[doc["_id"]] = doc
+            updates.append(UpdateOne(
+                {"_id": entry["_id"]},
+                {"$set": {"resultHash": doc["_id"]}, "$unset": {"results": ""}}
+            ))
+        # Results first: an entry never points at a hash that is not stored
+        await repos.history.put_results(list(docs.values()))
+        await search_history_collection.bulk_write(updates, ordered=False)
+        checkpoint = batch[-1]["_id"]
+        moved += len(batch)
+        await migrations_collection.update_one({"_id": 2}, {"$set": {"checkpoint": checkpoint}})
+        logger.info("Moved results of %d search history entries to the result store", moved)
+
+async def _drop_history_timestamp_index():
+    """Superseded by userId_timestamp_id, which also covers keyset pagination"""
+    if "userId_timestamp" in await search_history_collection.index_information():
+        await search_history_collection.drop_index("userId_timestamp")
+
+# Append-only: (version, description, coroutine function). Migrations must be
+# idempotent, since a worker can die after running one but before recording it.
+MIGRATIONS = [
+    (1, "backfill id on pricing_plans and seo_settings", _backfill_ids),
+    (2, "store search_history results by content hash", _dedupe_search_history),
+    (3, "drop search_history userId_timestamp index", _drop_history_timestamp_index),
+]
+
+# A "running" migration record whose heartbeat is older than this belongs to
+# a dead worker and may be claimed again
+MIGRATION_LEASE_SECONDS = int(os.environ.get('MIGRATION_LEASE_SECONDS', 120))
+MIGRATION_WAIT_SECONDS = int(os.environ.get('MIGRATION_WAIT_SECONDS', 600))
+MIGRATION_POLL_SECONDS = 0.5
+
+async def _claim_migration(version: int, description: str, owner: str, reclaim: bool = False) -> bool:
+    """Create the migration record, or take over one whose owner stopped
+    heartbeating. False while it is applied or another live worker runs it.
+
+    With reclaim, any record that is not applied is taken over; only safe
+    when the caller already excludes other workers.
+    """
+    now = datetime.utcnow()
+    claimable = {"_id": version, "status": {"$ne": "applied"}}
+    if not reclaim:
+        # Records written before heartbeats existed have none
+        claimable["$or"] = [
+            {"heartbeatAt": {"$exists": False}},
+            {"heartbeatAt": {"$lt": now - timedelta(seconds=MIGRATION_LEASE_SECONDS)}}
+        ]
+    try:
+        await migrations_collection.find_one_and_update(
+            claimable,
+            {"$set": {
+                "description": description,
+                "status": "running",
+                "owner": owner,
+                "startedAt": now,
+                "heartbeatAt": now
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def _migration_heartbeat(version: int, owner: str):
+    while True:
+        await asyncio.sleep(MIGRATION_LEASE_SECONDS / 3)
+        await migrations_collection.update_one(
+            {"_id": version, "owner": owner, "status": "running"},
+            {"$set": {"heartbeatAt": datetime.utcnow()}}
+        )
+
+async def _run_migration(version: int, description: str, migration, owner: str):
+    heartbeat = asyncio.create_task(_migration_heartbeat(version, owner))
+    try:
+        await migration()
+    except Exception:
+        # Leave the record claimable at once rather than after the lease
+        await migrations_collection.update_one(
+            {"_id": version, "owner": owner},
+            {"$set": {"status": "failed"}, "$unset": {"heartbeatAt": ""}}
+        )
+        raise
+    finally:
+        heartbeat.cancel()
+    await migrations_collection.update_one(
+        {"_id": version},
+        {"$set": {"status": "applied", "appliedAt": datetime.utcnow()}}
+    )
+    logger.info("Applied migration %s: %s", version, description)
+
+async def run_migrations(reclaim: bool = False):
+    """Apply pending migrations in version order.
+
+    Only "applied" records count as done. Each version is claimed through its
+    record, so when several workers start together one runs it and the others
+    wait for it to be applied before moving on; a claim whose owner died is
+    taken over once its heartbeat lapses. Under the bootstrap lock, pass
+    reclaim=True to re-run anything left unapplied straight away.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    applied = {
+        doc["_id"] async for doc in migrations_collection.find({"status": "applied"}, {"_id": 1})
+    }
+    for version, description, migration in MIGRATIONS:
+        deadline = asyncio.get_running_loop().time() + MIGRATION_WAIT_SECONDS
+        while version not in applied:
+            if await _claim_migration(version, description, owner, reclaim):
+                await _run_migration(version, description, migration, owner)
+                break
+            if await migrations_collection.find_one({"_id": version, "status": "applied"}, {"_id": 1}):
+                break
+            if asyncio.get_running_loop().time() > deadline:
+                raise RuntimeError(f"Timed out waiting for another worker to apply migration {version}")
+            await asyncio.sleep(MIGRATION_POLL_SECONDS)
+
+async def _seed_defaults():
+    """Insert the default admin, pricing plans and SEO settings where missing"""
+    from repositories import repos
     
     # Create default admin if not exists
-    admin_exists = await admins_collection.find_one({"username": "admin"})
+    admin_exists = await repos.admins.get_by_username("admin")
     if not admin_exists:
-        from auth import hash_password
+        from auth import hash_password_async
         admin = {
             "username": "admin",
-            "password": hash_password("admin123"),
+            "password": await hash_password_async("admin123"),
             "role": "admin",
             "createdAt": datetime.utcnow()
         }
-        await admins_collection.insert_one(admin)
+        await repos.admins.create(admin)
         print("✓ Default admin created (username: admin, password: admin123)")
     
     # Create default pricing plans if not exists
-    plans_count = await pricing_plans_collection.count_documents({})
+    plans_count = await repos.plans.count()
     if plans_count == 0:
         default_plans = [
             {
+                "id": str(uuid.uuid4()),
                 "name": "Free",
                 "description": "Perfect for getting started",
                 "price": 0,
@@ -64,6 +451,7 @@ async def init_database():
                 "updatedAt": datetime.utcnow()
             },
             {
+                "id": str(uuid.uuid4()),
                 "name": "Standard",
                 "description": "For growing creators",
                 "price": 6.99,
@@ -87,6 +475,7 @@ async def init_database():
                 "updatedAt": datetime.utcnow()
             },
             {
+                "id": str(uuid.uuid4()),
                 "name": "Pro",
                 "description": "For serious content creators",
                 "price": 14.99,
@@ -111,14 +500,15 @@ async def init_database():
                 "updatedAt": datetime.utcnow()
             }
         ]
-        await pricing_plans_collection.insert_many(default_plans)
+        await repos.plans.create_many(default_plans)
         print("✓ Default pricing plans created")
     
     # Create default SEO settings if not exists
-    seo_count = await seo_settings_collection.count_documents({})
+    seo_count = await repos.settings.count_seo()
     if seo_count == 0:
         default_seo = [
             {
+                "id": str(uuid.uuid4()),
                 "page": "home",
                 "title": "InsightsSnap - Discover What Your Audience Really Wants",
                 "description": "Uncover pain points, trending ideas, and content opportunities from millions of conversations across Reddit, X, and YouTube in real-time.",
@@ -128,6 +518,7 @@ async def init_database():
                 "updatedAt": datetime.utcnow()
             },
             {
+                "id": str(uuid.uuid4()),
                 "page": "pricing",
                 "title": "Pricing - InsightsSnap",
                 "description": "Choose the perfect plan for your content creation needs. Start free and upgrade as you grow.",
@@ -136,6 +527,7 @@ async def init_database():
                 "updatedAt": datetime.utcnow()
             },
             {
+                "id": str(uuid.uuid4()),
                 "page": "dashboard",
                 "title": "Dashboard - InsightsSnap",
                 "description": "Search for audience insights and discover what content resonates.",
@@ -144,8 +536,139 @@ async def init_database():
                 "updatedAt": datetime.utcnow()
             }
         ]
-        await seo_settings_collection.insert_many(default_seo)
+        await repos.settings.create_seo_many(default_seo)
         print("✓ Default SEO settings created")
+    
+
+# ==================== Bootstrap ====================
+
+# Bump when the default documents in _seed_defaults change
+SEED_VERSION = 1
+BOOTSTRAP_ID = "bootstrap"
+BOOTSTRAP_LOCK_SECONDS = int(os.environ.get('BOOTSTRAP_LOCK_SECONDS', 120))
+BOOTSTRAP_WAIT_SECONDS = int(os.environ.get('BOOTSTRAP_WAIT_SECONDS', 300))
+BOOTSTRAP_POLL_SECONDS = 0.5
+
+def bootstrap_version() -> str:
+    """Fingerprint of everything bootstrap applies: seeds, migrations and
+    index declarations. A change to any of them makes workers bootstrap again."""
+    spec = {
+        "seed": SEED_VERSION,
+        "migrations": [version for version, _, _ in MIGRATIONS],
+        "indexes": {
+            collection.name: [model.document for model in models]
+            for collection, models in _index_declarations().items()
+        },
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+async def _acquire_bootstrap_lock(owner: str) -> bool:
+    """Take the bootstrap lease unless another live worker holds it"""
+    now = datetime.utcnow()
+    try:
+        await bootstrap_collection.find_one_and_update(
+            {"_id": BOOTSTRAP_ID, "$or": [
+                {"lockedUntil": {"$exists": False}},
+                {"lockedUntil": {"$lt": now}}
+            ]},
+            {"$set": {
+                "lockedBy": owner,
+                "lockedUntil": now + timedelta(seconds=BOOTSTRAP_LOCK_SECONDS)
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The document exists and its lease is live: someone else is seeding
+        return False
+    return True
+
+async def _extend_bootstrap_lock(owner: str):
+    while True:
+        await asyncio.sleep(BOOTSTRAP_LOCK_SECONDS / 3)
+        await bootstrap_collection.update_one(
+            {"_id": BOOTSTRAP_ID, "lockedBy": owner},
+            {"$set": {"lockedUntil": datetime.utcnow() + timedelta(seconds=BOOTSTRAP_LOCK_SECONDS)}}
+        )
+
+async def _run_bootstrap(owner: str, version: str):
+    heartbeat = asyncio.create_task(_extend_bootstrap_lock(owner))
+    try:
+        await _seed_defaults()
+        # Bring existing data up to date, then make sure indexes exist. The
+        # lease already excludes other workers, so a migration a dead owner
+        # left unapplied is re-run rather than waited on.
+        await run_migrations(reclaim=True)
+        versions = [version for version, _, _ in MIGRATIONS]
+        applied = await migrations_collection.count_documents(
+            {"_id": {"$in": versions}, "status": "applied"}
+        )
+        if applied != len(versions):
+            raise RuntimeError(f"Only {applied} of {len(versions)} migrations are applied")
+        await ensure_indexes()
+    finally:
+        heartbeat.cancel()
+        await bootstrap_collection.update_one(
+            {"_id": BOOTSTRAP_ID, "lockedBy": owner},
+            {"$unset": {"lockedBy": "", "lockedUntil": ""}}
+        )
+    await bootstrap_collection.update_one(
+        {"_id": BOOTSTRAP_ID},
+        {
+            "$set": {"version": version, "completedAt": datetime.utcnow(), "completedBy": owner},
+            "$addToSet": {"versions": version}
+        }
+    )
+    logger.info("Bootstrap %s applied by %s", version, owner)
+
+async def init_database():
+    """Seed defaults, run migrations and build indexes, once per bootstrap
+    version across all workers.
+
+    A worker whose database is already at the current version pays a single
+    find_one. Otherwise one worker takes a lease on the bootstrap document
+    and does the work while the others wait for the version to appear; a
+    lease left by a crashed worker expires and is taken over.
+    """
+    from repositories import repos
+    if repos.backend != "mongo":
+        await _seed_defaults()
+        return
+
+    version = bootstrap_version()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    deadline = asyncio.get_running_loop().time() + BOOTSTRAP_WAIT_SECONDS
+    while True:
+        # Every applied version is kept, so during a rolling deploy workers of
+        # the previous release do not bootstrap their version again
+        if await bootstrap_collection.find_one({"_id": BOOTSTRAP_ID, "versions": version}, {"_id": 1}):
+            return
+        if await _acquire_bootstrap_lock(owner):
+            await _run_bootstrap(owner, version)
+            return
+        if asyncio.get_running_loop().time() > deadline:
+            raise RuntimeError(f"Timed out waiting for another worker to bootstrap {version}")
+        await asyncio.sleep(BOOTSTRAP_POLL_SECONDS)
+
+async def warm_up_pool(connections: int = MONGO_WARMUP_CONNECTIONS):
+    """Open pool connections ahead of traffic.
+
+    Concurrent pings each need their own connection, so the pool grows to
+    roughly `connections` on the primary and on a read-mostly member.
+    """
+    if connections <= 0:
+        return
+    pings = [db.command("ping") for _ in range(connections)]
+    if read_mostly_preference != ReadPreference.PRIMARY:
+        pings += [
+            db.command("ping", read_preference=read_mostly_preference)
+            for _ in range(connections)
+        ]
+    results = await asyncio.gather(*pings, return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        logger.warning("Pool warm-up: %d of %d pings failed: %r", len(failures), len(results), failures[0])
+    else:
+        logger.info("Pool warm-up opened %d connections", len(results))
 
 async def close_database():
     client.close()
\ No newline at end of file
@@ -0,0 +1,225 @@
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import time
+import uuid
+import zipfile
+import os
+
+from database import export_jobs_collection
+from repositories import repos
+from exporter import EXPORT_CACHE_DIR, cache_path, csv_chunks, build_pdf, refund_exports
+from result_store import history_results
+from models import ExportJobResponse
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 2))
+EXPORT_JOB_MAX_SEARCHES = int(os.environ.get('EXPORT_JOB_MAX_SEARCHES', 100))
+EXPORT_JOB_POLL_INTERVAL = float(os.environ.get('EXPORT_JOB_POLL_INTERVAL', 1))
+# A running job whose lease lapses (its worker died) is picked up again
+EXPORT_JOB_LEASE_SECONDS = int(os.environ.get('EXPORT_JOB_LEASE_SECONDS', 120))
+# Finished jobs and their bundles are kept this long
+EXPORT_JOB_RETENTION_HOURS = int(os.environ.get('EXPORT_JOB_RETENTION_HOURS', 24))
+
+JOB_DIR = EXPORT_CACHE_DIR / "jobs"
+
+def bundle_path(job_id: str):
+    return JOB_DIR / f"{job_id}.zip"
+
+def job_response(job: dict):
+    return ExportJobResponse(
+        jobId=job["id"],
+        status=job["status"],
+        total=job["total"],
+        completed=job.get("completed", 0),
+        downloadUrl=f"/api/insights/export/jobs/{job['id']}/download" if job["status"] == "done" else None,
+        error=job.get("error")
+    )
+
+async def enqueue_job(user_id: str, search_ids: list, fmt: str, charged_ids: list = ()):
+    """Queue a bundle of search_ids; charged_ids are the searches the request
+    paid for, refunded if the job cannot deliver them"""
+    now = datetime.utcnow()
+    job = {
+        "id": str(uuid.uuid4()),
+        "userId": user_id,
+        "searchIds": search_ids,
+        "chargedIds": list(charged_ids),
+        "format": fmt,
+        "status": "queued",
+        "total": len(search_ids),
+        "completed": 0,
+        "createdAt": now,
+        "updatedAt": now
+    }
+    await export_jobs_collection.insert_one(job)
+    return job
+
+async def find_job(job_id: str, user_id: str):
+    job = await export_jobs_collection.find_one({"id": job_id, "userId": user_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+async def _claim_job(worker_id: str):
+    """Atomically take the oldest queued job, or one whose lease has lapsed"""
+    now = datetime.utcnow()
+    return await export_jobs_collection.find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "leaseExpiresAt": {"$lt": now}}
+            ]
+        },
+        {
+            "$set": {
+                "status": "running",
+                "workerId": worker_id,
+                "leaseExpiresAt": now + timedelta(seconds=EXPORT_JOB_LEASE_SECONDS),
+                "updatedAt": now
+            }
+        },
+        sort=[("createdAt", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def _add_csv(bundle: zipfile.ZipFile, name: str, results: dict):
+    with bundle.open(name, "w") as member:
+        for chunk in csv_chunks(results):
+            member.write(chunk)
+
+async def _process_job(job: dict, worker_id: str) -> list:
+    """Build the job's zip bundle on disk one search at a time.
+
+    Returns the ids of searches that no longer exist and were left out.
+    """
+    JOB_DIR.mkdir(parents=True, exist_ok=True)
+    final_path = bundle_path(job["id"])
+    tmp_path = final_path.with_suffix(f".{worker_id}.tmp")
+    try:
+        missing = await _write_bundle(job, worker_id, tmp_path)
+        os.replace(tmp_path, final_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return missing
+
+async def _write_bundle(job: dict, worker_id: str, tmp_path) -> list:
+    fmt = job["format"]
+    missing = []
+
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        for index, search_id in enumerate(job["searchIds"]):
+            entry = await repos.history.get(search_id, job["userId"])
+            results = await history_results(entry) if entry else None
+            if results is None:
+                missing.append(search_id)
+            else:
+                name = f"{index + 1:03d}-{search_id}.{fmt}"
+                if fmt == "csv":
+                    await asyncio.to_thread(_add_csv, bundle, name, results)
+                else:
+                    pdf_path = cache_path(search_id, fmt)
+                    if not pdf_path.exists():
+                        await build_pdf(entry["query"], results, pdf_path)
+                    await asyncio.to_thread(bundle.write, pdf_path, name)
+
+            now = datetime.utcnow()
+            await export_jobs_collection.update_one(
+                {"id": job["id"], "workerId": worker_id},
+                {"$set": {
+                    "completed": index + 1,
+                    "leaseExpiresAt": now + timedelta(seconds=EXPORT_JOB_LEASE_SECONDS),
+                    "updatedAt": now
+                }}
+            )
+
+    return missing
+
+async def _finish_job(job: dict, worker_id: str, status: str, error: str = None) -> bool:
+    """Record the outcome; False when the job was taken over by another worker
+    after this one's lease lapsed, which then finishes it instead"""
+    now = datetime.utcnow()
+    result = await export_jobs_collection.update_one(
+        {"id": job["id"], "workerId": worker_id},
+        {
+            "$set": {
+                "status": status,
+                "error": error,
+                "updatedAt": now,
+                "expiresAt": now + timedelta(hours=EXPORT_JOB_RETENTION_HOURS)
+            },
+            "$unset": {"leaseExpiresAt": ""}
+        }
+    )
+    return result.modified_count > 0
+
+async def _refund_undelivered(job: dict, search_ids):
+    """Refund the searches among search_ids that this job's request paid for"""
+    undelivered = set(search_ids)
+    charged = [search_id for search_id in job.get("chargedIds", []) if search_id in undelivered]
+    try:
+        await refund_exports(job["userId"], charged, job["format"])
+    except Exception:
+        logger.exception("Could not refund %d exports for job %s", len(charged), job["id"])
+
+async def _worker(worker_id: str):
+    while True:
+        try:
+            job = await _claim_job(worker_id)
+        except Exception as e:
+            logger.error("Export worker %s could not claim a job: %r", worker_id, e)
+            job = None
+        if job is None:
+            await asyncio.sleep(EXPORT_JOB_POLL_INTERVAL)
+            continue
+
+        try:
+            missing = await _process_job(job, worker_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Export job %s failed", job["id"])
+            if await _finish_job(job, worker_id, "failed", str(e)):
+                await _refund_undelivered(job, job["searchIds"])
+        else:
+            if await _finish_job(job, worker_id, "done") and missing:
+                await _refund_undelivered(job, missing)
+
+class ExportWorkerPool:
+    """Background workers that drain the export_jobs collection.
+
+    Jobs are claimed with an atomic update, so any number of API workers can
+    run a pool against the same collection without an external broker.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._tasks = []
+
+    def start(self):
+        self.prune_bundles()
+        prefix = uuid.uuid4().hex[:8]
+        self._tasks = [
+            asyncio.create_task(_worker(f"{prefix}-{i}")) for i in range(self.size)
+        ]
+
+    def prune_bundles(self):
+        """Delete bundles whose job has outlived the retention period"""
+        if not JOB_DIR.exists():
+            return
+        cutoff = time.time() - EXPORT_JOB_RETENTION_HOURS * 3600
+        for path in JOB_DIR.iterdir():
+            if path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+export_workers = ExportWorkerPool(EXPORT_JOB_WORKERS)
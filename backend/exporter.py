@@ -0,0 +1,298 @@
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import asyncio
+import csv
+import io
+import itertools
+import logging
+import re
+import tempfile
+import time
+import uuid
+import os
+
+from repositories import repos
+from history_writer import history_writer
+from ledger import consume_credit, refund_credit
+from result_store import history_results
+from metrics import waiting_on
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {"csv": "text/csv", "pdf": "application/pdf"}
+# Rendered exports are kept here, keyed by search id and format, so repeat
+# downloads are served straight from disk.
+EXPORT_CACHE_DIR = Path(os.environ.get('EXPORT_CACHE_DIR', Path(tempfile.gettempdir()) / "insightssnap-exports"))
+EXPORT_PDF_WORKERS = int(os.environ.get('EXPORT_PDF_WORKERS', 2))
+# Cached exports unused for this long are deleted, and beyond EXPORT_CACHE_MAX_MB
+# the least recently used go first. Job bundles in jobs/ have their own retention.
+EXPORT_CACHE_TTL_HOURS = float(os.environ.get('EXPORT_CACHE_TTL_HOURS', 24))
+EXPORT_CACHE_MAX_MB = float(os.environ.get('EXPORT_CACHE_MAX_MB', 1024))
+EXPORT_CACHE_PRUNE_SECONDS = float(os.environ.get('EXPORT_CACHE_PRUNE_SECONDS', 300))
+
+CSV_HEADER = ["category", "platform", "title", "content", "engagement", "trendScore", "source"]
+
+SEARCH_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+
+_pdf_executor = None
+_last_prune = 0.0
+
+def normalize_format(fmt: str) -> str:
+    fmt = fmt.lower()
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be CSV or PDF")
+    return fmt
+
+def cache_path(search_id: str, fmt: str) -> Path:
+    return EXPORT_CACHE_DIR / f"{search_id}.{fmt}"
+
+async def find_search(search_id: str, user_id: str):
+    """Return the caller's search_history entry, including one still being written"""
+    if not SEARCH_ID_PATTERN.match(search_id):
+        raise HTTPException(status_code=404, detail="Search not found")
+    if history_writer.is_pending(search_id):
+        await history_writer.flush()
+    entry = await repos.history.get(search_id, user_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Search not found")
+    return entry
+
+async def charge_exports(user_id: str, search_ids: list, fmt: str):
+    """Charge one export credit for each of search_ids not yet exported in fmt.
+
+    Credits are taken first, so a user who cannot pay claims nothing. The
+    claim only marks searches that are still unmarked: when concurrent
+    requests race to export the same search, the losers are refunded.
+    Returns the ids this call paid for.
+    """
+    await consume_credit(user_id, "exports", amount=len(search_ids))
+    claimed = []
+    try:
+        claimed = await repos.history.claim_exports(search_ids, user_id, fmt)
+    finally:
+        if len(claimed) < len(search_ids):
+            await refund_credit(user_id, "exports", amount=len(search_ids) - len(claimed))
+    return claimed
+
+async def refund_exports(user_id: str, search_ids: list, fmt: str):
+    """Give back the credits charge_exports took for searches that were not
+    delivered, and unmark them so exporting them again is charged"""
+    if not search_ids:
+        return
+    await repos.history.release_exports(search_ids, user_id, fmt)
+    await refund_credit(user_id, "exports", amount=len(search_ids))
+
+def export_rows(results: dict):
+    """Yield one flat row per insight or content idea"""
+    for category in ("painPoints", "trendingIdeas"):
+        for item in results.get(category, []):
+            yield [
+                category, item.get("platform", ""), "", item.get("content", ""),
+                item.get("engagement") if item.get("engagement") is not None else "",
+                item.get("trendScore") if item.get("trendScore") is not None else "",
+                item.get("source", "")
+            ]
+    for idea in results.get("contentIdeas", []):
+        yield [
+            "contentIdeas", ", ".join(idea.get("platforms", [])), idea.get("title", ""),
+            idea.get("description", ""), "", "", ""
+        ]
+
+def _csv_line(row) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
+
+def csv_chunks(results: dict):
+    """Yield the CSV export one encoded row at a time"""
+    for row in itertools.chain((CSV_HEADER,), export_rows(results)):
+        yield _csv_line(row).encode("utf-8")
+
+async def _stream_csv(results: dict, path: Path):
+    """Stream CSV rows to the client while writing the same bytes to the cache"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as cache_file:
+        try:
+            for chunk in csv_chunks(results):
+                cache_file.write(chunk)
+                yield chunk
+        except BaseException:
+            cache_file.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+    os.replace(tmp_path, path)
+
+# ==================== PDF rendering ====================
+
+PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT = 612, 792
+PDF_MARGIN = 50
+PDF_FONT_SIZE = 10
+PDF_LEADING = 14
+PDF_WRAP = 95
+
+def _pdf_text(text: str) -> str:
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _wrap(text: str, width: int):
+    words, line = text.split(), ""
+    for word in words:
+        if line and len(line) + 1 + len(word) > width:
+            yield line
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        yield line
+
+def render_pdf(query: str, results: dict, path: str):
+    """Write a plain text PDF of the results. Runs in a worker process."""
+    lines = [f"InsightsSnap export: {query}", ""]
+    for row in export_rows(results):
+        category, platform, title, content, engagement, trend, source = row
+        heading = f"[{category}] {platform}" + (f" - {source}" if source else "")
+        metrics = ", ".join(
+            label for label in (f"engagement {engagement}" if engagement != "" else "",
+                                f"trend {trend}" if trend != "" else "") if label
+        )
+        lines.append(heading + (f" ({metrics})" if metrics else ""))
+        for text in (title, content):
+            lines.extend("    " + part for part in _wrap(text, PDF_WRAP))
+        lines.append("")
+
+    per_page = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+    pages = [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and a content stream per page
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    }
+    kids = []
+    for index, page_lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * index, 5 + 2 * index
+        kids.append(f"{page_id} 0 R")
+        text = [f"BT /F1 {PDF_FONT_SIZE} Tf {PDF_LEADING} TL {PDF_MARGIN} {PDF_PAGE_HEIGHT - PDF_MARGIN} Td"]
+        text.extend(f"({_pdf_text(line)}) '" for line in page_lines)
+        text.append("ET")
+        stream = "\n".join(text).encode("latin-1")
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PDF_PAGE_WIDTH} {PDF_PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n" % obj_id + objects[obj_id] + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for obj_id in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[obj_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_at)
+
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+    os.replace(tmp_path, path)
+
+def _get_pdf_executor():
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(max_workers=EXPORT_PDF_WORKERS)
+    return _pdf_executor
+
+def shutdown_export_pool():
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=True)
+        _pdf_executor = None
+
+async def build_pdf(query: str, results: dict, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    with waiting_on("cpu", "render_pdf"):
+        await loop.run_in_executor(_get_pdf_executor(), render_pdf, query, results, str(path))
+
+# ==================== Cache eviction ====================
+
+def prune_export_cache(now: float = None):
+    """Delete cached exports that have expired or that overflow the size cap.
+
+    A file's mtime is its last use (see export_response), so files are kept
+    newest first until EXPORT_CACHE_MAX_MB is reached. Temporary files are
+    still being written; they only go once older than the TTL, as leftovers
+    of a crashed worker. Returns the number of files deleted.
+    """
+    now = now or time.time()
+    cutoff = now - EXPORT_CACHE_TTL_HOURS * 3600
+    budget = EXPORT_CACHE_MAX_MB * 1024 * 1024
+    if not EXPORT_CACHE_DIR.exists():
+        return 0
+
+    files = []
+    for path in EXPORT_CACHE_DIR.iterdir():
+        try:
+            if path.is_file():
+                files.append((path, path.stat()))
+        except FileNotFoundError:
+            continue
+
+    used, removed = 0, 0
+    for path, stat in sorted(files, key=lambda item: item[1].st_mtime, reverse=True):
+        if path.suffix == ".tmp":
+            expired = stat.st_mtime < cutoff
+        else:
+            used += stat.st_size
+            expired = stat.st_mtime < cutoff or used > budget
+        if expired:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+def _log_prune_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Export cache pruning failed", exc_info=future.exception())
+
+def schedule_cache_prune():
+    """Prune the export cache in a thread, at most every EXPORT_CACHE_PRUNE_SECONDS"""
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < EXPORT_CACHE_PRUNE_SECONDS:
+        return
+    _last_prune = now
+    asyncio.get_running_loop().run_in_executor(None, prune_export_cache).add_done_callback(_log_prune_failure)
+
+# ==================== Responses ====================
+
+async def export_response(entry: dict, fmt: str):
+    """Serve an export from the disk cache, or render it on first request"""
+    path = cache_path(entry["id"], fmt)
+    filename = f"insights-{entry['id']}.{fmt}"
+    try:
+        # Mark the file as just used, so pruning evicts it last
+        os.utime(path)
+        return FileResponse(path, media_type=EXPORT_FORMATS[fmt], filename=filename)
+    except FileNotFoundError:
+        pass
+
+    schedule_cache_prune()
+    results = await history_results(entry)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Search results not found")
+
+    if fmt == "csv":
+        return StreamingResponse(
+            _stream_csv(results, path),
+            media_type=EXPORT_FORMATS[fmt],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+
+    await build_pdf(entry["query"], results, path)
+    return FileResponse(path, media_type=EXPORT_FORMATS[fmt], filename=filename)
@@ -0,0 +1,291 @@
+from bson import json_util
+from collections import Counter
+from pathlib import Path
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, PyMongoError, WriteConcernError
+import asyncio
+import fcntl
+import logging
+import time
+import uuid
+import os
+
+from repositories import repos
+from result_store import result_document
+
+logger = logging.getLogger(__name__)
+
+# Flush when this many records are waiting, or every interval, whichever first
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 200))
+HISTORY_FLUSH_INTERVAL = float(os.environ.get('HISTORY_FLUSH_INTERVAL', 0.5))
+# Upper bound on buffered records; searches wait for space beyond this
+HISTORY_BUFFER_LIMIT = int(os.environ.get('HISTORY_BUFFER_LIMIT', 10000))
+# When set, buffered records are also appended to a spool file in this
+# directory and replayed on the next start if the worker dies before flushing.
+# Records that can never be written are appended to dead-letter-<pid>.jsonl
+# there instead of being retried forever.
+HISTORY_SPOOL_DIR = os.environ.get('HISTORY_SPOOL_DIR')
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a failed write is worth retrying as is: the database was
+    unreachable or slow, rather than the records being unwritable"""
+    if isinstance(error, (ConnectionFailure, ExecutionTimeout, WriteConcernError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, PyMongoError) and error.has_error_label("RetryableWriteError")
+
+class HistoryWriter:
+    """Write-behind buffer for search history.
+
+    Searches hand their history record to add() and return immediately; a
+    background task batches records into insert_many calls. Result payloads
+    are written to the content-addressed store in the same flush. A record
+    that fails for any reason but an unreachable database is dead-lettered,
+    so it cannot hold up the records queued behind it.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, buffer_limit: int, spool_dir: str = None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer_limit = buffer_limit
+        self.spool_dir = Path(spool_dir) if spool_dir else None
+        self._buffer = []
+        self._pending_ids = set()
+        self._pending_users = Counter()
+        self._segments = []
+        self._spool = None
+        self._spool_path = None
+        self._has_data = asyncio.Event()
+        self._has_space = asyncio.Event()
+        self._has_space.set()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._closed = False
+        self.flushed = 0
+        self.flushes = 0
+        self.errors = 0
+        self.dead_lettered = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    # ---------- lifecycle ----------
+
+    async def start(self):
+        if self.spool_dir:
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            await self._replay_orphaned_spools()
+            self._open_spool()
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting records and flush everything still buffered"""
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # Spool segments stay on disk and are replayed on the next start
+            logger.error("Could not drain %d search history records: %r", len(self._buffer), e)
+        for _, handle in self._segments:
+            handle.close()
+        self._segments = []
+        if self._spool:
+            self._spool.close()
+            self._spool = None
+            self._spool_path.unlink(missing_ok=True)
+
+    # ---------- producer side ----------
+
+    async def add(self, entry: dict, results: dict):
+        """Queue a history entry and its result payload for writing"""
+        if self._closed:
+            raise RuntimeError("history writer is stopped")
+        while len(self._buffer) >= self.buffer_limit:
+            self._has_space.clear()
+            await self._has_space.wait()
+
+        record = {"entry": entry, "results": results}
+        # Spool and buffer together with no await in between, so a spool
+        # segment always holds exactly the records taken by one flush.
+        if self._spool:
+            self._spool.write(json_util.dumps(record) + "\n")
+            self._spool.flush()
+        self._buffer.append(record)
+        self._pending_ids.add(entry["id"])
+        self._pending_users[entry["userId"]] += 1
+        if len(self._buffer) >= self.batch_size:
+            self._has_data.set()
+
+    def is_pending(self, entry_id: str) -> bool:
+        return entry_id in self._pending_ids
+
+    def has_pending_for(self, user_id: str) -> bool:
+        return self._pending_users[user_id] > 0
+
+    # ---------- consumer side ----------
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._has_data.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._has_data.clear()
+            if self._buffer:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    logger.error("Search history flush failed, will retry: %r", e)
+                    await asyncio.sleep(self.flush_interval)
+
+    async def flush(self):
+        """Write every buffered record now"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            records, self._buffer = self._buffer, []
+            self._rotate_spool()
+            self._has_space.set()
+
+            started = time.perf_counter()
+            try:
+                await self._write_records(records)
+            except Exception:
+                self.errors += 1
+                self._buffer = records + self._buffer
+                raise
+
+            elapsed = time.perf_counter() - started
+            self.flushes += 1
+            self.flushed += len(records)
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            for record in records:
+                self._pending_ids.discard(record["entry"]["id"])
+                self._pending_users[record["entry"]["userId"]] -= 1
+                if self._pending_users[record["entry"]["userId"]] <= 0:
+                    del self._pending_users[record["entry"]["userId"]]
+            for segment, handle in self._segments:
+                segment.unlink(missing_ok=True)
+                handle.close()
+            self._segments = []
+
+    async def _write_records(self, records):
+        """Write records in batches, raising only if the database is unreachable.
+
+        A batch that fails otherwise is retried record by record, and the
+        records that fail alone are dead-lettered. Rewriting the rest is
+        harmless: result documents and entries are both written idempotently.
+        """
+        for i in range(0, len(records), self.batch_size):
+            batch = records[i:i + self.batch_size]
+            try:
+                await self._write_batch(batch)
+                continue
+            except Exception as e:
+                if _is_transient(e):
+                    raise
+            for record in batch:
+                try:
+                    await self._write_batch([record])
+                except Exception as e:
+                    if _is_transient(e):
+                        raise
+                    self._dead_letter(record, e)
+
+    def _dead_letter(self, record, error: Exception):
+        self.dead_lettered += 1
+        entry_id = record.get("entry", {}).get("id")
+        logger.error("Dropping search history record %s, it cannot be written: %r", entry_id, error)
+        if not self.spool_dir:
+            return
+        try:
+            line = json_util.dumps({"error": repr(error), "record": record})
+        except Exception:
+            line = json_util.dumps({"error": repr(error), "record": repr(record)})
+        with open(self.spool_dir / f"dead-letter-{os.getpid()}.jsonl", "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    async def _write_batch(self, records):
+        blobs = {}
+        entries = []
+        for record in records:
+            if record["results"] is not None:
+                doc = result_document(record["results"])
+                blobs[doc["_id"]] = doc
+                record["entry"]["resultHash"] = doc["_id"]
+            entries.append(record["entry"])
+
+        await repos.history.put_results(list(blobs.values()))
+        # Entries replayed from a spool may already have been written; the
+        # repository skips those
+        await repos.history.insert_many(entries)
+
+    # ---------- spool files ----------
+
+    def _open_spool(self):
+        name = f"history-{os.getpid()}-{uuid.uuid4().hex[:8]}.spool"
+        # Locked under a name replay ignores, so no other worker ever sees it
+        # unlocked; the lock follows the file through renames
+        staging = self.spool_dir / f".{name}"
+        self._spool = open(staging, "a", encoding="utf-8")
+        fcntl.flock(self._spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._spool_path = staging.rename(self.spool_dir / name)
+
+    def _rotate_spool(self):
+        """Seal the current spool file as a segment for the records being flushed.
+
+        The segment stays open, and so locked, until its records are written:
+        a flush that fails keeps retrying them, and another worker starting
+        up must not replay them meanwhile.
+        """
+        if not self._spool:
+            return
+        segment = self._spool_path.rename(self._spool_path.with_suffix(".segment"))
+        self._segments.append((segment, self._spool))
+        self._open_spool()
+
+    async def _replay_orphaned_spools(self):
+        """Write records left behind by workers that exited without flushing.
+
+        Live workers hold a lock on their spool and segment files, so only
+        orphans are replayed, each under its lock. Duplicate entries are
+        ignored by the unique id index.
+        """
+        for path in sorted(self.spool_dir.glob("history-*")):
+            try:
+                f = open(path, "r", encoding="utf-8")
+            except FileNotFoundError:
+                # Rotated or replayed since the directory was listed
+                continue
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                records = [json_util.loads(line) for line in f if line.strip()]
+                await self._write_records(records)
+                path.unlink(missing_ok=True)
+            logger.info("Replayed %d search history records from %s", len(records), path.name)
+
+    def stats(self):
+        return {
+            "queueDepth": len(self._buffer),
+            "bufferLimit": self.buffer_limit,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "deadLettered": self.dead_lettered,
+            "lastFlushSeconds": self.last_flush_seconds,
+            "maxFlushSeconds": self.max_flush_seconds,
+            "spooled": self._spool is not None
+        }
+
+history_writer = HistoryWriter(
+    HISTORY_BATCH_SIZE, HISTORY_FLUSH_INTERVAL, HISTORY_BUFFER_LIMIT, HISTORY_SPOOL_DIR
+)
@@ -0,0 +1,212 @@
+from fastapi import HTTPException
+from datetime import datetime
+import time
+import os
+
+from principals import cache_user, invalidate_user
+from repositories import repos
+
+# Credit kinds map to (remaining field, usage counter field) on the user document.
+# A remaining value of -1 means unlimited, as used by the Pro plan.
+CREDIT_FIELDS = {
+    "searches": ("searchesRemaining", "searchesUsedToday"),
+    "aiGenerations": ("aiGenerationsRemaining", "aiGenerationsUsedToday"),
+    "exports": ("exportsRemaining", "exportsUsedThisMonth"),
+}
+
+UNLIMITED = -1
+
+# Plan limit fields that refill each credit kind, and the window they refill on.
+# AI generations are not refilled here: the Free plan grants them for the
+# lifetime of the account.
+PLAN_LIMIT_FIELDS = {
+    "searches": ("searchesPerDay", "day"),
+    "exports": ("exportsPerMonth", "month"),
+}
+
+# Used when a user's plan no longer exists in pricing_plans
+DEFAULT_PLAN_LIMITS = {"searchesPerDay": 5, "aiGenerations": 3, "exportsPerMonth": 3, "resultsPerCategory": 3}
+
+NEVER_RESET = datetime(1970, 1, 1)
+
+PLAN_LIMITS_TTL = float(os.environ.get('PLAN_LIMITS_TTL', 60))
+
+CREDIT_ERRORS = {
+    "searches": "No search credits remaining",
+    "aiGenerations": "No AI generation credits remaining",
+    "exports": "No export credits remaining",
+}
+
+_plan_limits = None
+_plan_limits_expires_at = 0.0
+
+async def get_plan_limits():
+    """Return {plan name: limits} for every plan, cached for PLAN_LIMITS_TTL"""
+    global _plan_limits, _plan_limits_expires_at
+    now = time.monotonic()
+    if _plan_limits is None or _plan_limits_expires_at <= now:
+        plans = await repos.plans.limits()
+        _plan_limits = {plan["name"]: plan for plan in plans}
+        _plan_limits_expires_at = now + PLAN_LIMITS_TTL
+    return _plan_limits
+
+def invalidate_plan_limits():
+    global _plan_limits
+    _plan_limits = None
+
+def _window_starts(now: datetime):
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {"day": day_start, "month": day_start.replace(day=1)}
+
+def _window_passed(window_start: datetime):
+    return {"$lt": [{"$ifNull": ["$credits.lastResetDate", NEVER_RESET]}, window_start]}
+
+def _plan_limit(plans: dict, field: str):
+    return {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": ["$plan", name]}, "then": limits.get(field, DEFAULT_PLAN_LIMITS[field])}
+                for name, limits in plans.items()
+            ],
+            "default": DEFAULT_PLAN_LIMITS[field]
+        }
+    } if plans else DEFAULT_PLAN_LIMITS[field]
+
+def _effective(kind: str, plans: dict, starts: dict):
+    """Expression for the balance of `kind` after any due window reset"""
+    remaining, _ = CREDIT_FIELDS[kind]
+    limit_field, window = PLAN_LIMIT_FIELDS[kind]
+    return {
+        "$cond": [
+            _window_passed(starts[window]),
+            _plan_limit(plans, limit_field),
+            f"$credits.{remaining}"
+        ]
+    }
+
+def _reset_stage(plans: dict, now: datetime):
+    """Lazily refill credits whose window has rolled over since lastResetDate.
+
+    Resets happen inside the same update that spends a credit, so only users
+    who are actually active pay for them and no nightly sweep is needed.
+    """
+    starts = _window_starts(now)
+    day_passed = _window_passed(starts["day"])
+    month_passed = _window_passed(starts["month"])
+    return {
+        "$set": {
+            "credits.searchesRemaining": _effective("searches", plans, starts),
+            "credits.exportsRemaining": _effective("exports", plans, starts),
+            "credits.searchesUsedToday": {"$cond": [day_passed, 0, "$credits.searchesUsedToday"]},
+            "credits.aiGenerationsUsedToday": {"$cond": [day_passed, 0, "$credits.aiGenerationsUsedToday"]},
+            "credits.exportsUsedThisMonth": {"$cond": [month_passed, 0, "$credits.exportsUsedThisMonth"]},
+            "credits.lastResetDate": {"$cond": [day_passed, now, "$credits.lastResetDate"]}
+        }
+    }
+
+def effective_credits(user: dict, plans: dict, now: datetime = None):
+    """Apply due window resets to a user's credits without writing them back"""
+    credits = dict(user["credits"])
+    now = now or datetime.utcnow()
+    starts = _window_starts(now)
+    last_reset = credits.get("lastResetDate") or NEVER_RESET
+    limits = plans.get(user.get("plan"), DEFAULT_PLAN_LIMITS)
+
+    if last_reset < starts["day"]:
+        credits["searchesRemaining"] = limits.get("searchesPerDay", DEFAULT_PLAN_LIMITS["searchesPerDay"])
+        credits["searchesUsedToday"] = 0
+        credits["aiGenerationsUsedToday"] = 0
+        credits["lastResetDate"] = now
+    if last_reset < starts["month"]:
+        credits["exportsRemaining"] = limits.get("exportsPerMonth", DEFAULT_PLAN_LIMITS["exportsPerMonth"])
+        credits["exportsUsedThisMonth"] = 0
+    return credits
+
+def _adjust_stage(kind: str, amount: int):
+    remaining, used = CREDIT_FIELDS[kind]
+    remaining_path = f"$credits.{remaining}"
+    return {
+        "$set": {
+            f"credits.{remaining}": {
+                "$cond": [
+                    {"$eq": [remaining_path, UNLIMITED]},
+                    UNLIMITED,
+                    {"$subtract": [remaining_path, amount]}
+                ]
+            },
+            f"credits.{used}": {"$add": [{"$ifNull": [f"$credits.{used}", 0]}, amount]}
+        }
+    }
+
+def credit_update(kind: str, amount: int, plans: dict, now: datetime):
+    """Mongo filter and update pipeline that spend amount credits of kind.
+
+    The filter only matches when the user has at least `amount` credits left
+    (or is unlimited) once any due daily/monthly reset is applied, so
+    concurrent requests can never drive the balance below zero.
+    """
+    remaining, _ = CREDIT_FIELDS[kind]
+    if kind in PLAN_LIMIT_FIELDS:
+        balance = _effective(kind, plans, _window_starts(now))
+        credit_filter = {
+            "$expr": {
+                "$or": [
+                    {"$eq": [balance, UNLIMITED]},
+                    {"$gte": [balance, amount]}
+                ]
+            }
+        }
+    else:
+        credit_filter = {
+            "$or": [
+                {f"credits.{remaining}": {"$gte": amount}},
+                {f"credits.{remaining}": UNLIMITED}
+            ]
+        }
+    return credit_filter, [_reset_stage(plans, now), _adjust_stage(kind, amount)]
+
+def refund_pipeline(kind: str, amount: int):
+    return [_adjust_stage(kind, -amount)]
+
+def _adjust(credits: dict, kind: str, amount: int):
+    remaining, used = CREDIT_FIELDS[kind]
+    if credits.get(remaining) != UNLIMITED:
+        credits[remaining] = credits.get(remaining, 0) - amount
+    credits[used] = (credits.get(used) or 0) + amount
+    return credits
+
+def spend_credits(user: dict, kind: str, amount: int, plans: dict, now: datetime):
+    """In-process equivalent of credit_update: the user's credits after any
+    due reset and the spend, or None if they cannot cover amount"""
+    remaining, _ = CREDIT_FIELDS[kind]
+    credits = effective_credits(user, plans, now)
+    balance = credits.get(remaining, 0)
+    if balance != UNLIMITED and balance < amount:
+        return None
+    return _adjust(credits, kind, amount)
+
+def refund_credits(credits: dict, kind: str, amount: int):
+    return _adjust(dict(credits), kind, -amount)
+
+async def consume_credit(user_id: str, kind: str, amount: int = 1):
+    """Atomically check and deduct credits in a single round trip.
+
+    Returns the updated user document; raises 403 when the user cannot
+    cover amount.
+    """
+    plans = await get_plan_limits()
+    user = await repos.users.consume_credit(user_id, kind, amount, plans, datetime.utcnow())
+    if user is None:
+        # Only the failure path pays for a second lookup
+        if not await repos.users.exists(user_id):
+            raise HTTPException(status_code=404, detail="User not found")
+        invalidate_user(user_id)
+        raise HTTPException(status_code=403, detail=CREDIT_ERRORS[kind])
+
+    cache_user(user)
+    return user
+
+async def refund_credit(user_id: str, kind: str, amount: int = 1):
+    """Give back credits taken by consume_credit when the operation failed"""
+    await repos.users.refund_credit(user_id, kind, amount)
+    invalidate_user(user_id)
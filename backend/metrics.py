@@ -0,0 +1,320 @@
+from fastapi import Request, Response
+import asyncio
+import bisect
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+# Static bearer token for Prometheus scrapers; admins can always read /metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get('EVENT_LOOP_LAG_INTERVAL', 0.5))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(self.label_names, labels, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.label_names, labels, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {count}"
+
+class Gauge:
+    """A gauge whose samples are read from a callback at scrape time.
+
+    The callback returns a number, or a dict of {label values tuple: number}.
+    """
+
+    def __init__(self, name: str, help_text: str, callback, labels=()):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.label_names = tuple(labels)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning("Gauge %s failed: %r", self.name, e)
+            return
+        samples = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, sample in samples:
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(sample)}"
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._metrics.get(name) or self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._metrics.get(name) or self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, callback, labels=()):
+        return self.register(Gauge(name, help_text, callback, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+http_latency = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+mongo_latency = registry.histogram(
+    "mongo_operation_duration_seconds", "MongoDB operation latency", ("collection", "operation")
+)
+mongo_errors = registry.counter(
+    "mongo_operation_errors_total", "MongoDB operations that raised", ("collection", "operation")
+)
+password_hash_latency = registry.histogram(
+    "password_hash_duration_seconds", "bcrypt hash/verify time on the worker pool",
+    ("operation",), buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2, 5)
+)
+password_queue_wait = registry.histogram(
+    "password_pool_wait_seconds", "Time bcrypt calls wait for a pool worker", ("operation",)
+)
+cache_lookups = registry.counter(
+    "cache_lookups_total", "Cache lookups by cache and outcome", ("cache", "outcome")
+)
+revocation_checks = registry.counter(
+    "token_revocation_checks_total",
+    "Revocation checks: clear (Bloom filter miss), confirmed_clear (hit, not revoked) or revoked",
+    ("outcome",)
+)
+event_loop_lag = registry.histogram(
+    "event_loop_lag_seconds", "How late the event loop runs a scheduled wake-up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+# ==================== Task wait tracking ====================
+
+# What each asyncio task is currently blocked on, read by the profiler's task
+# dump. Keyed by task; entries only live for the duration of the wait.
+_task_waits = {}
+
+class waiting_on:
+    """Mark the current task as waiting on kind ("mongo", "cpu", ...) for the
+    duration of the block"""
+
+    __slots__ = ("kind", "detail", "task")
+
+    def __init__(self, kind: str, detail: str):
+        self.kind = kind
+        self.detail = detail
+
+    def __enter__(self):
+        self.task = asyncio.current_task()
+        if self.task is not None:
+            _task_waits[self.task] = (self.kind, self.detail, time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        if self.task is not None:
+            _task_waits.pop(self.task, None)
+        return False
+
+def task_wait(task):
+    """Return (kind, detail, seconds waited) for task, or None"""
+    wait = _task_waits.get(task)
+    if wait is None:
+        return None
+    kind, detail, started = wait
+    return kind, detail, time.perf_counter() - started
+
+# ==================== Mongo instrumentation ====================
+
+# Motor methods that return awaitables
+_ASYNC_OPERATIONS = {
+    "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "count_documents", "estimated_document_count",
+    "bulk_write", "distinct", "create_index", "create_indexes", "drop_index",
+    "index_information",
+}
+# Motor methods that return a cursor synchronously
+_CURSOR_OPERATIONS = {"find", "aggregate"}
+
+class InstrumentedCursor:
+    """Cursor proxy timing to_list and async iteration; chained modifiers
+    keep the proxy"""
+
+    def __init__(self, cursor, collection: str, operation: str):
+        self._cursor = cursor
+        self._collection = collection
+        self._operation = operation
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if name == "to_list":
+            return self._timed_to_list
+        if callable(attr):
+            def chained(*args, **kwargs):
+                result = attr(*args, **kwargs)
+                return self if result is self._cursor else result
+            return chained
+        return attr
+
+    async def _timed_to_list(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with waiting_on("mongo", f"{self._collection}.{self._operation}"):
+                return await self._cursor.to_list(*args, **kwargs)
+        except Exception:
+            mongo_errors.inc(self._collection, self._operation)
+            raise
+        finally:
+            mongo_latency.observe(time.perf_counter() - started, self._collection, self._operation)
+
+    def __aiter__(self):
+        return self._timed_iteration()
+
+    async def _timed_iteration(self):
+        """Yield the cursor's documents, recording the time spent waiting on
+        Mongo across the whole iteration as one operation. Time the consumer
+        spends between documents is not counted."""
+        iterator = self._cursor.__aiter__()
+        waited = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    with waiting_on("mongo", f"{self._collection}.{self._operation}"):
+                        document = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception:
+                    mongo_errors.inc(self._collection, self._operation)
+                    raise
+                finally:
+                    waited += time.perf_counter() - started
+                yield document
+        finally:
+            mongo_latency.observe(waited, self._collection, self._operation)
+
+class InstrumentedCollection:
+    """Motor collection proxy recording per-operation latency"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._name = collection.name
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in _ASYNC_OPERATIONS:
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    with waiting_on("mongo", f"{self._name}.{name}"):
+                        return await attr(*args, **kwargs)
+                except Exception:
+                    mongo_errors.inc(self._name, name)
+                    raise
+                finally:
+                    mongo_latency.observe(time.perf_counter() - started, self._name, name)
+            return timed
+        if name in _CURSOR_OPERATIONS:
+            def cursor(*args, **kwargs):
+                return InstrumentedCursor(attr(*args, **kwargs), self._name, name)
+            return cursor
+        return attr
+
+def instrument_collection(collection):
+    return InstrumentedCollection(collection) if METRICS_ENABLED else collection
+
+# ==================== HTTP and event loop ====================
+
+async def metrics_middleware(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        http_latency.observe(time.perf_counter() - started, request.method, route_path)
+        http_requests.inc(request.method, route_path, str(status))
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL):
+    """Sleep for interval and record how late the wake-up was.
+
+    Anything blocking the loop (CPU work, sync I/O) shows up as lag.
+    """
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(time.perf_counter() - started - interval, 0))
+
+def metrics_response():
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
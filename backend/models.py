@@ -55,6 +55,7 @@ class PricingPlanBase(BaseModel):
     aiGenerations: int
     exportsPerMonth: int
     resultsPerCategory: int
+    requestsPerMinute: Optional[int] = None  # API rate limit; None uses the server default
     isPopular: bool = False
     isActive: bool = True
 
@@ -85,10 +86,25 @@ class SearchResult(BaseModel):
     painPoints: List[InsightItem]
     trendingIdeas: List[InsightItem]
     contentIdeas: List[ContentIdea]
+    partial: bool = False  # True when some platforms failed or timed out
+    failedSources: List[str] = []
+    searchId: Optional[str] = None  # search_history id, used for exports
 
 class SearchRequest(BaseModel):
     query: str
 
+class SearchHistoryItem(BaseModel):
+    id: str
+    query: str
+    timestamp: datetime
+
+class SearchHistoryPage(BaseModel):
+    items: List[SearchHistoryItem]
+    nextCursor: Optional[str] = None
+
+class SearchHistoryDetail(SearchHistoryItem):
+    results: SearchResult
+
 class SearchHistory(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     userId: str
@@ -105,6 +121,18 @@ class ExportResponse(BaseModel):
     downloadUrl: str
     success: bool
 
+class BulkExportRequest(BaseModel):
+    searchIds: List[str]
+    format: str  # CSV or PDF
+
+class ExportJobResponse(BaseModel):
+    jobId: str
+    status: str  # queued, running, done or failed
+    total: int
+    completed: int = 0
+    downloadUrl: Optional[str] = None
+    error: Optional[str] = None
+
 # Admin Models
 class AdminLogin(BaseModel):
     username: str
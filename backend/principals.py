@@ -0,0 +1,59 @@
+from fastapi import Depends, HTTPException
+from collections import OrderedDict
+import time
+import os
+
+from auth import get_current_user
+from repositories import repos
+from metrics import cache_lookups
+
+# Short-lived, process-wide cache of user documents keyed by user id. Writes
+# that change a user document must call invalidate_user().
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 5))
+
+_user_cache = OrderedDict()
+
+async def get_user(user_id: str):
+    """Return the user document for user_id, served from cache when fresh"""
+    now = time.monotonic()
+    cached = _user_cache.get(user_id)
+    if cached is not None:
+        user, expires_at = cached
+        if expires_at > now:
+            _user_cache.move_to_end(user_id)
+            cache_lookups.inc("user", "hit")
+            return user
+        del _user_cache[user_id]
+    cache_lookups.inc("user", "miss")
+
+    user = await repos.users.get(user_id)
+    if user is not None:
+        _user_cache[user_id] = (user, now + USER_CACHE_TTL)
+        if len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+    return user
+
+def cache_user(user: dict):
+    """Store a freshly written user document, e.g. one returned by find_one_and_update"""
+    _user_cache[user["id"]] = (user, time.monotonic() + USER_CACHE_TTL)
+    _user_cache.move_to_end(user["id"])
+    if len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
+
+def invalidate_user(user_id: str):
+    _user_cache.pop(user_id, None)
+
+def clear_user_cache():
+    _user_cache.clear()
+
+async def get_current_user_doc(current_user: dict = Depends(get_current_user)):
+    """Resolve the authenticated user's document once per request.
+
+    FastAPI caches dependency results within a request, so every consumer of
+    this dependency shares a single lookup.
+    """
+    user = await get_user(current_user["id"])
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
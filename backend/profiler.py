@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from metrics import task_wait
+
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 60))
+PROFILE_DEFAULT_INTERVAL = 0.005
+TASK_STACK_LIMIT = 12
+
+# One profile at a time per worker; overlapping samplers would skew each other
+_profile_lock = asyncio.Lock()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_qualname}"
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+def sample_stacks(seconds: float, interval: float):
+    """Sample every thread's stack for seconds, returning (collapsed stack
+    counts, number of sampling rounds).
+
+    Runs on its own thread and reads sys._current_frames(), so the sampled
+    threads (including the event loop) are never interrupted.
+    """
+    own_id = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = Counter()
+    rounds = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            thread_name = names.get(thread_id) or f"thread-{thread_id}"
+            stacks[f"{thread_name};{_collapse(frame)}"] += 1
+        rounds += 1
+        time.sleep(interval)
+    return stacks, rounds
+
+def collapsed_text(stacks: Counter) -> str:
+    """Render stack counts in the collapsed format flamegraph.pl and
+    speedscope read: one "frame;frame;frame count" line per stack"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def _coroutine_frames(task):
+    """Frames of a task's await chain, outermost first"""
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None and len(frames) < TASK_STACK_LIMIT:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(_frame_label(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+    return frames
+
+def dump_tasks():
+    """Describe every pending asyncio task and what it is blocked on.
+
+    Waits are classified as mongo, cpu (executor work such as bcrypt or PDF
+    rendering) or http (insight providers) when the awaiting code marked them
+    via metrics.waiting_on; anything else is reported as running (the task
+    taking this dump) or other.
+    """
+    current = asyncio.current_task()
+    tasks = []
+    summary = Counter()
+    for task in asyncio.all_tasks():
+        wait = task_wait(task)
+        if task is current:
+            kind, detail, waited = "running", None, None
+        elif wait is not None:
+            kind, detail, waited = wait
+        else:
+            kind, detail, waited = "other", None, None
+        summary[kind] += 1
+        tasks.append({
+            "name": task.get_name(),
+            "state": kind,
+            "waitingOn": detail,
+            "waitedSeconds": round(waited, 6) if waited is not None else None,
+            "stack": _coroutine_frames(task)
+        })
+    tasks.sort(key=lambda t: t["waitedSeconds"] or 0, reverse=True)
+    return {"summary": dict(summary), "tasks": tasks}
+
+async def profile(seconds: float, interval: float = PROFILE_DEFAULT_INTERVAL):
+    """Sample this worker for seconds and dump its asyncio tasks.
+
+    Returns None if another profile is already running.
+    """
+    if _profile_lock.locked():
+        return None
+    async with _profile_lock:
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        sampling = asyncio.create_task(asyncio.to_thread(sample_stacks, seconds, interval))
+        # Let the window start before snapshotting tasks, so the dump shows
+        # the same period the samples cover
+        await asyncio.sleep(min(seconds / 2, 1.0))
+        tasks = dump_tasks()
+        stacks, rounds = await sampling
+        return {
+            "seconds": seconds,
+            "interval": interval,
+            "samples": rounds,
+            "collapsed": collapsed_text(stacks),
+            "asyncio": tasks
+        }
@@ -0,0 +1,361 @@
+from datetime import datetime, timezone
+import asyncio
+import logging
+import re
+import time
+import os
+
+import httpx
+
+from models import InsightItem, ContentIdea, SearchResult
+from metrics import waiting_on
+
+logger = logging.getLogger(__name__)
+
+# Per-provider request budget; a slow platform is dropped from the response
+# rather than holding it up.
+PROVIDER_TIMEOUT = float(os.environ.get('PROVIDER_TIMEOUT', 4))
+# Consecutive failures before a provider is skipped, and how long it stays
+# skipped before a single trial request is let through.
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', 30))
+
+REDDIT_API_URL = os.environ.get('REDDIT_API_URL', 'https://www.reddit.com')
+X_API_URL = os.environ.get('X_API_URL', 'https://api.twitter.com')
+X_BEARER_TOKEN = os.environ.get('X_BEARER_TOKEN')
+YOUTUBE_API_URL = os.environ.get('YOUTUBE_API_URL', 'https://www.googleapis.com')
+YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY')
+
+USER_AGENT = "InsightsSnap/1.0"
+
+# Phrases that mark a post as someone describing a problem. Matched against
+# lowercased text: on large candidate batches this check dominates ranking,
+# and it runs about twice as fast without re.IGNORECASE.
+PAIN_PATTERN = re.compile(
+    r"\b(struggl\w*|how (do|can|should) i|help|problem|issue|hate|annoy\w*|frustrat\w*|"
+    r"can'?t|cannot|won'?t|stuck|confus\w*|difficult|hard to|tired of|exhaust\w*|why (is|does))\b|\?"
+)
+
+def is_pain_point(text: str) -> bool:
+    return PAIN_PATTERN.search(text.lower()) is not None
+
+class ProviderUnavailable(Exception):
+    pass
+
+class CircuitBreaker:
+    """Skip a provider after repeated failures, then probe it again later"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a request that gave no verdict, e.g. one that was cancelled,
+        so a half-open breaker can let the next trial through"""
+        self.trial_in_flight = False
+
+def _candidate(platform, native_id, content, source, engagement, created_at):
+    return {
+        "id": f"{platform.lower()}:{native_id}",
+        "platform": platform,
+        "content": " ".join(content.split()),
+        "source": source,
+        "engagement": int(engagement or 0),
+        "createdAt": created_at,
+    }
+
+def _parse_time(value: str):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+class InsightProvider:
+    """A platform adapter returning candidate posts for a query"""
+
+    platform = ""
+
+    def __init__(self, timeout: float = PROVIDER_TIMEOUT):
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+
+    def enabled(self) -> bool:
+        return True
+
+    async def fetch(self, client: httpx.AsyncClient, query: str, limit: int):
+        raise NotImplementedError
+
+class RedditProvider(InsightProvider):
+    platform = "Reddit"
+
+    def __init__(self, base_url: str = REDDIT_API_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    async def fetch(self, client, query, limit):
+        response = await client.get(
+            f"{self.base_url}/search.json",
+            params={"q": query, "limit": limit, "sort": "relevance", "t": "month"},
+            headers={"User-Agent": USER_AGENT}
+        )
+        response.raise_for_status()
+        posts = [child["data"] for child in response.json()["data"]["children"]]
+        return [
+            _candidate(
+                self.platform, post["id"],
+                post.get("title", "") + (". " + post["selftext"] if post.get("selftext") else ""),
+                f"r/{post.get('subreddit', '')}",
+                post.get("score", 0) + post.get("num_comments", 0),
+                post.get("created_utc", time.time())
+            )
+            for post in posts
+        ]
+
+class XProvider(InsightProvider):
+    platform = "X"
+
+    def __init__(self, base_url: str = X_API_URL, bearer_token: str = X_BEARER_TOKEN, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.bearer_token = bearer_token
+
+    def enabled(self):
+        return bool(self.bearer_token)
+
+    async def fetch(self, client, query, limit):
+        response = await client.get(
+            f"{self.base_url}/2/tweets/search/recent",
+            params={
+                "query": f"{query} -is:retweet lang:en",
+                "max_results": min(max(limit, 10), 100),
+                "tweet.fields": "public_metrics,created_at",
+                "expansions": "author_id",
+                "user.fields": "username"
+            },
+            headers={"Authorization": f"Bearer {self.bearer_token}", "User-Agent": USER_AGENT}
+        )
+        response.raise_for_status()
+        payload = response.json()
+        authors = {u["id"]: u["username"] for u in payload.get("includes", {}).get("users", [])}
+        candidates = []
+        for tweet in payload.get("data", []):
+            metrics = tweet.get("public_metrics", {})
+            candidates.append(_candidate(
+                self.platform, tweet["id"], tweet.get("text", ""),
+                f"@{authors.get(tweet.get('author_id'), 'unknown')}",
+                sum(metrics.get(k, 0) for k in ("like_count", "retweet_count", "reply_count", "quote_count")),
+                _parse_time(tweet["created_at"]) if tweet.get("created_at") else time.time()
+            ))
+        return candidates
+
+class YouTubeProvider(InsightProvider):
+    platform = "YouTube"
+
+    def __init__(self, base_url: str = YOUTUBE_API_URL, api_key: str = YOUTUBE_API_KEY, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.api_key = api_key
+
+    def enabled(self):
+        return bool(self.api_key)
+
+    async def fetch(self, client, query, limit):
+        response = await client.get(
+            f"{self.base_url}/youtube/v3/search",
+            params={
+                "part": "snippet", "q": query, "type": "video",
+                "order": "relevance", "maxResults": min(limit, 50), "key": self.api_key
+            }
+        )
+        response.raise_for_status()
+        items = [item for item in response.json().get("items", []) if item.get("id", {}).get("videoId")]
+        if not items:
+            return []
+
+        stats_response = await client.get(
+            f"{self.base_url}/youtube/v3/videos",
+            params={
+                "part": "statistics",
+                "id": ",".join(item["id"]["videoId"] for item in items),
+                "key": self.api_key
+            }
+        )
+        stats_response.raise_for_status()
+        stats = {v["id"]: v.get("statistics", {}) for v in stats_response.json().get("items", [])}
+
+        candidates = []
+        for item in items:
+            video_id = item["id"]["videoId"]
+            snippet = item.get("snippet", {})
+            video_stats = stats.get(video_id, {})
+            candidates.append(_candidate(
+                self.platform, video_id,
+                snippet.get("title", "") + (". " + snippet["description"] if snippet.get("description") else ""),
+                snippet.get("channelTitle", "YouTube"),
+                int(video_stats.get("likeCount", 0)) + int(video_stats.get("commentCount", 0)),
+                _parse_time(snippet["publishedAt"]) if snippet.get("publishedAt") else time.time()
+            ))
+        return candidates
+
+provider_registry = [RedditProvider(), XProvider(), YouTubeProvider()]
+
+_client = None
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(follow_redirects=True)
+    return _client
+
+async def close_providers():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def _fetch_with_budget(provider: InsightProvider, query: str, limit: int):
+    try:
+        with waiting_on("http", provider.platform):
+            candidates = await asyncio.wait_for(
+                provider.fetch(_get_client(), query, limit), timeout=provider.timeout
+            )
+    except Exception as e:
+        provider.breaker.record_failure()
+        logger.warning("%s provider failed: %r", provider.platform, e)
+        raise ProviderUnavailable(provider.platform) from e
+    except BaseException:
+        # Cancelled along with the search: says nothing about the provider
+        provider.breaker.release()
+        raise
+    provider.breaker.record_success()
+    return candidates
+
+async def fetch_candidates(query: str, per_platform: int):
+    """Query every enabled provider concurrently.
+
+    Returns (candidates by platform, platforms that failed or were skipped).
+    A provider that times out, errors or has an open circuit only removes its
+    own platform from the result.
+    """
+    active = [p for p in provider_registry if p.enabled()]
+    failed = [p.platform for p in active if not p.breaker.allow()]
+    calling = [p for p in active if p.platform not in failed]
+
+    # Over-fetch so pain points and trending ideas both have enough to pick from
+    limit = max(per_platform * 4, 10)
+    outcomes = await asyncio.gather(
+        *(_fetch_with_budget(p, query, limit) for p in calling),
+        return_exceptions=True
+    )
+
+    by_platform = {}
+    for provider, outcome in zip(calling, outcomes):
+        if isinstance(outcome, BaseException):
+            failed.append(provider.platform)
+        else:
+            by_platform[provider.platform] = outcome
+    return by_platform, failed
+
+def _snippet(text: str, length: int = 140):
+    return text if len(text) <= length else text[:length - 1].rsplit(" ", 1)[0] + "…"
+
+# Content idea descriptions mention the searcher's query. Results are cached
+# and shared by every query that normalizes alike, so search_platforms builds
+# them with this slot in place of the query and render_for_query fills it in
+# per request.
+QUERY_SLOT = "{query}"
+
+def render_for_query(result: SearchResult, query: str) -> SearchResult:
+    """Copy of a (possibly cached) result with query in its content ideas"""
+    return result.model_copy(update={"contentIdeas": [
+        idea.model_copy(update={"description": idea.description.replace(QUERY_SLOT, query)})
+        for idea in result.contentIdeas
+    ]})
+
+def build_search_result(query: str, by_platform: dict, results_per_category: int, failed=()):
+    """Split candidates into pain points, trending ideas and content ideas.
+
+    Each category gets at most results_per_category items, spread evenly
+    across the platforms that answered. Ranking is vectorized (see
+    ranking.py); only the winners become response models.
+    """
+    from ranking import rank
+    pain_points, trending, ideas = rank(by_platform, results_per_category, is_pain_point, time.time())
+
+    return SearchResult(
+        painPoints=[_insight(c, engagement=True) for c in pain_points],
+        trendingIdeas=[_insight(c, engagement=False) for c in trending],
+        contentIdeas=[_content_idea(query, c) for c in ideas],
+        partial=bool(failed),
+        failedSources=list(failed)
+    )
+
+def preload():
+    """Import NumPy for ranking, e.g. from a background thread once the
+    worker is serving"""
+    import ranking  # noqa: F401
+
+def _insight(candidate: dict, engagement: bool):
+    return InsightItem(
+        id=candidate["id"],
+        platform=candidate["platform"],
+        content=_snippet(candidate["content"]),
+        engagement=candidate["engagement"] if engagement else None,
+        trendScore=None if engagement else candidate["trendScore"],
+        source=candidate["source"]
+    )
+
+def _content_idea(query: str, candidate: dict):
+    if is_pain_point(candidate["content"]):
+        title = f"Answering: {_snippet(candidate['content'], 80)}"
+        description = f"A {query} problem people raise on {candidate['platform']} ({candidate['source']})"
+    else:
+        title = f"Your take on: {_snippet(candidate['content'], 80)}"
+        description = f"A {query} topic gaining traction on {candidate['platform']} ({candidate['source']})"
+    return ContentIdea(
+        id=f"idea:{candidate['id']}",
+        title=title,
+        description=description,
+        platforms=[candidate["platform"]]
+    )
+
+async def search_platforms(query: str, results_per_category: int):
+    """Fan out to all platforms and assemble a SearchResult.
+
+    The result is shareable between queries: content ideas carry QUERY_SLOT
+    rather than query, so pass it through render_for_query before use.
+    """
+    enabled = sum(1 for p in provider_registry if p.enabled())
+    per_platform = max(results_per_category // max(enabled, 1), 1)
+    by_platform, failed = await fetch_candidates(query, per_platform)
+    if not by_platform:
+        raise ProviderUnavailable(", ".join(failed) or "no providers configured")
+    return build_search_result(QUERY_SLOT, by_platform, results_per_category, failed)
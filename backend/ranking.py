@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+
+def _parse_weights(value: str):
+    weights = {}
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        platform, _, weight = pair.partition("=")
+        weights[platform.strip()] = float(weight)
+    return weights
+
+# Relative weight of each signal in the ranking scores
+RANK_ENGAGEMENT_WEIGHT = float(os.environ.get('RANK_ENGAGEMENT_WEIGHT', 1.0))
+RANK_TREND_WEIGHT = float(os.environ.get('RANK_TREND_WEIGHT', 1.0))
+RANK_RECENCY_WEIGHT = float(os.environ.get('RANK_RECENCY_WEIGHT', 0.25))
+RANK_RECENCY_HALF_LIFE_HOURS = float(os.environ.get('RANK_RECENCY_HALF_LIFE_HOURS', 72))
+# "Platform=weight" pairs, e.g. "Reddit=1.2,X=0.8"; unlisted platforms weigh 1
+RANK_PLATFORM_WEIGHTS = _parse_weights(os.environ.get('RANK_PLATFORM_WEIGHTS', ''))
+
+class CandidateColumns:
+    """Candidates from every platform laid out as parallel arrays.
+
+    Platforms occupy contiguous slices (see `segments`), so per-platform work
+    is slicing rather than masking.
+    """
+
+    def __init__(self, by_platform: dict, is_pain):
+        self.platforms = list(by_platform)
+        self.candidates = [c for candidates in by_platform.values() for c in candidates]
+        count = len(self.candidates)
+        sizes = [len(candidates) for candidates in by_platform.values()]
+        bounds = np.cumsum([0] + sizes)
+        self.segments = list(zip(bounds[:-1], bounds[1:]))
+        self.platform = np.repeat(np.arange(len(sizes)), sizes)
+        self.engagement = np.fromiter((c["engagement"] for c in self.candidates), np.float64, count)
+        self.created_at = np.fromiter((c["createdAt"] for c in self.candidates), np.float64, count)
+        self.is_pain = np.fromiter(
+            (is_pain(c["content"]) for c in self.candidates), bool, count
+        )
+
+def _segment_max(values, columns: CandidateColumns):
+    """Per-candidate maximum of values within its platform, 1 where that is 0"""
+    maxima = np.ones(len(columns.segments))
+    for platform, (start, end) in enumerate(columns.segments):
+        if end > start:
+            maxima[platform] = values[start:end].max() or 1
+    return maxima[columns.platform]
+
+def score(columns: CandidateColumns, now: float):
+    """Return (trend scores 0-100, pain ranking score, trend ranking score).
+
+    Trend scores are engagement velocity scaled within each platform, as
+    shown to users. Engagement is log-scaled within each platform too, so a
+    platform with larger raw counts does not crowd out the others.
+    """
+    age_hours = (now - columns.created_at) / 3600
+    velocity = columns.engagement / np.power(np.maximum(age_hours, 1), 0.8)
+    trend = np.rint(100 * velocity / _segment_max(velocity, columns))
+
+    recency = np.power(0.5, np.maximum(age_hours, 0) / RANK_RECENCY_HALF_LIFE_HOURS)
+    engagement = np.log1p(np.maximum(columns.engagement, 0))
+    engagement /= _segment_max(engagement, columns)
+    weights = np.array([RANK_PLATFORM_WEIGHTS.get(p, 1.0) for p in columns.platforms])[columns.platform]
+
+    pain_rank = weights * (RANK_ENGAGEMENT_WEIGHT * engagement + RANK_RECENCY_WEIGHT * recency)
+    trend_rank = weights * (RANK_TREND_WEIGHT * trend / 100 + RANK_RECENCY_WEIGHT * recency)
+    return trend, pain_rank, trend_rank
+
+def top_k(indices, scores, k: int):
+    """The k indices with the highest scores, best first.
+
+    argpartition finds the winners in linear time; only those k are sorted.
+    Ties go to the earlier candidate, including ties at the cut-off, which
+    argpartition would otherwise break arbitrarily.
+    """
+    if k <= 0 or len(indices) == 0:
+        return indices[:0]
+    values = scores[indices]
+    if len(indices) > k:
+        cutoff = -np.partition(-values, k - 1)[k - 1]
+        # Everything above the cut-off wins; the remaining places go to the
+        # earliest candidates scoring exactly the cut-off
+        above = values > cutoff
+        tied = np.flatnonzero(values == cutoff)
+        tied = tied[np.argsort(indices[tied], kind="stable")][:k - np.count_nonzero(above)]
+        winners = np.concatenate((np.flatnonzero(above), tied))
+        indices, values = indices[winners], values[winners]
+    return indices[np.lexsort((indices, -values))]
+
+def rank(by_platform: dict, results_per_category: int, is_pain, now: float):
+    """Pick pain points, trending ideas and content idea sources.
+
+    is_pain(content) says whether a post describes a problem. Each platform
+    contributes at most results_per_category / platforms items per category.
+    Returns three lists of candidate dicts, best first; only these winners
+    are copied, with their trendScore set.
+    """
+    columns = CandidateColumns(by_platform, is_pain)
+    if not columns.candidates:
+        return [], [], []
+    per_platform = max(results_per_category // max(len(columns.segments), 1), 1)
+    trend, pain_rank, trend_rank = score(columns, now)
+
+    pains, trends, ideas = [], [], []
+    for start, end in columns.segments:
+        platform_pains = top_k(start + np.flatnonzero(columns.is_pain[start:end]), pain_rank, per_platform)
+        rest = np.ones(end - start, bool)
+        rest[platform_pains - start] = False
+        platform_trends = top_k(start + np.flatnonzero(rest), trend_rank, per_platform)
+        pains.append(platform_pains)
+        trends.append(platform_trends)
+        ideas.append(np.concatenate((platform_pains[:1], platform_trends[:max(per_platform - 1, 0)])))
+
+    def materialize(indices):
+        return [dict(columns.candidates[i], trendScore=int(trend[i])) for i in indices]
+
+    return (
+        materialize(top_k(np.concatenate(pains), pain_rank, results_per_category)),
+        materialize(top_k(np.concatenate(trends), trend_rank, results_per_category)),
+        materialize(np.concatenate(ideas)[:results_per_category]),
+    )
@@ -0,0 +1,173 @@
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import logging
+import time
+import zlib
+import os
+
+from auth import decode_token
+from database import rate_limits_collection
+from ledger import get_plan_limits
+from principals import get_user
+from responses import fast_response
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# "memory" keeps buckets per worker; "mongo" shares them across workers
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+# Requests per minute for signed-in users whose plan sets no requestsPerMinute
+RATE_LIMIT_USER_PER_MINUTE = int(os.environ.get('RATE_LIMIT_USER_PER_MINUTE', 120))
+# Requests per minute for anonymous clients, by IP
+RATE_LIMIT_IP_PER_MINUTE = int(os.environ.get('RATE_LIMIT_IP_PER_MINUTE', 60))
+# Password endpoints are expensive (bcrypt), so they get their own tight bucket
+RATE_LIMIT_AUTH_PER_MINUTE = int(os.environ.get('RATE_LIMIT_AUTH_PER_MINUTE', 10))
+# Only trust X-Forwarded-For behind a proxy that sets it. Behind a proxy or
+# CDN this must be on for per-IP limits to mean anything: otherwise every
+# client is seen as the proxy's address and they all share one bucket.
+RATE_LIMIT_TRUST_PROXY = os.environ.get('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true'
+# Anonymous GETs of the cacheable public pages are answered from the public
+# cache (or the CDN in front of it) and are not limited per IP, since a few
+# CDN edge addresses carry every visitor's requests. Set to true to limit them.
+RATE_LIMIT_PUBLIC_GETS = os.environ.get('RATE_LIMIT_PUBLIC_GETS', 'false').lower() == 'true'
+
+AUTH_PATHS = {"/api/auth/login", "/api/auth/register", "/api/admin/auth/login"}
+PUBLIC_PATHS = {"/api/", "/api/pricing/plans"}
+PUBLIC_PATH_PREFIXES = ("/api/seo-settings/",)
+
+class MemoryBucketStore:
+    """Token buckets held in this process, split across LRU shards.
+
+    Each shard evicts its least recently used buckets past max_keys, so
+    memory stays bounded however many clients show up.
+    """
+
+    def __init__(self, shards: int = 16, max_keys: int = 100000):
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._max_per_shard = max(max_keys // shards, 1)
+
+    async def take(self, key: str, capacity: float, rate: float, cost: float = 1):
+        shard = self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+        now = time.monotonic()
+        tokens, updated_at = shard.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        shard[key] = (tokens, now)
+        shard.move_to_end(key)
+        if len(shard) > self._max_per_shard:
+            shard.popitem(last=False)
+        return allowed, tokens
+
+class MongoBucketStore:
+    """Token buckets shared by all workers, updated atomically in one round trip"""
+
+    async def take(self, key: str, capacity: float, rate: float, cost: float = 1):
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updatedAt", now]}]}, 1000]}
+        bucket = await rate_limits_collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "refilled": {"$min": [
+                        capacity,
+                        {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed, rate]}]}
+                    ]}
+                }},
+                {"$set": {
+                    "allowed": {"$gte": ["$refilled", cost]},
+                    "tokens": {"$cond": [
+                        {"$gte": ["$refilled", cost]},
+                        {"$subtract": ["$refilled", cost]},
+                        "$refilled"
+                    ]},
+                    "updatedAt": now,
+                    # Idle buckets are full again after this, so the TTL index can drop them
+                    "expiresAt": now + timedelta(seconds=capacity / rate)
+                }},
+                {"$unset": "refilled"}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return bucket["allowed"], bucket["tokens"]
+
+bucket_store = MongoBucketStore() if RATE_LIMIT_STORE == "mongo" else MemoryBucketStore()
+
+def _is_public_get(request: Request) -> bool:
+    if request.method not in ("GET", "HEAD") or "authorization" in request.headers:
+        return False
+    path = request.url.path
+    return path in PUBLIC_PATHS or path.startswith(PUBLIC_PATH_PREFIXES)
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def _principal_limit(request: Request):
+    """Return (bucket key, requests per minute) for the caller.
+
+    Signed-in users are limited per user id at their plan's rate; anything
+    else, including an invalid token, is limited per IP.
+    """
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            payload = decode_token(authorization[7:])
+        except HTTPException:
+            payload = None
+        if payload and payload.get("sub"):
+            if payload.get("role") == "admin":
+                return None, None
+            user = await get_user(payload["sub"])
+            if user:
+                plan = (await get_plan_limits()).get(user.get("plan"), {})
+                return f"user:{user['id']}", plan.get("requestsPerMinute") or RATE_LIMIT_USER_PER_MINUTE
+    return f"ip:{client_ip(request)}", RATE_LIMIT_IP_PER_MINUTE
+
+def _too_many_requests(limit: int, tokens: float, rate: float):
+    retry_after = max(1, int((1 - tokens) / rate + 0.999))
+    return fast_response(
+        {"detail": "Too many requests"},
+        status_code=429,
+        headers={
+            "Retry-After": str(retry_after),
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": "0"
+        }
+    )
+
+async def rate_limit_middleware(request: Request, call_next):
+    if not RATE_LIMIT_ENABLED or request.method == "OPTIONS" or not request.url.path.startswith("/api"):
+        return await call_next(request)
+    if not RATE_LIMIT_PUBLIC_GETS and _is_public_get(request):
+        return await call_next(request)
+
+    try:
+        if request.url.path in AUTH_PATHS:
+            key, per_minute = f"auth:{client_ip(request)}", RATE_LIMIT_AUTH_PER_MINUTE
+        else:
+            key, per_minute = await _principal_limit(request)
+        if key is None:
+            return await call_next(request)
+
+        rate = per_minute / 60
+        allowed, tokens = await bucket_store.take(key, per_minute, rate)
+    except Exception as e:
+        # Fail open: an unavailable limiter must not take the API down with it
+        logger.warning("Rate limiter unavailable: %r", e)
+        return await call_next(request)
+
+    if not allowed:
+        return _too_many_requests(per_minute, tokens, rate)
+
+    response = await call_next(request)
+    response.headers["X-RateLimit-Limit"] = str(per_minute)
+    response.headers["X-RateLimit-Remaining"] = str(int(tokens))
+    return response
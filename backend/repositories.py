@@ -0,0 +1,695 @@
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from collections import defaultdict
+from datetime import datetime
+import asyncio
+import bisect
+import copy
+import os
+import re
+import uuid
+
+from database import (
+    users_collection, pricing_plans_collection, search_history_collection,
+    search_results_collection, payment_settings_collection, seo_settings_collection,
+    admins_collection, pricing_plans_read_collection, seo_settings_read_collection,
+    search_history_read_collection, revoked_tokens_collection
+)
+
+# "mongo" (default) or "memory", which keeps every repository in process
+# memory for load tests and CI. Export jobs, the shared search cache and the
+# Mongo rate-limit store are not covered and still need a database.
+REPOSITORY_BACKEND = os.environ.get('REPOSITORY_BACKEND', 'mongo')
+
+USER_PROJECTION = {"_id": 0, "password": 0}
+PLAN_LIMITS_PROJECTION = {
+    "_id": 0, "name": 1, "searchesPerDay": 1, "aiGenerations": 1, "exportsPerMonth": 1,
+    "resultsPerCategory": 1, "requestsPerMinute": 1
+}
+HISTORY_LIST_FIELDS = ("id", "query", "timestamp")
+ADMIN_USER_FIELDS = ("_id", "id", "name", "email", "plan", "credits", "createdAt")
+
+DUPLICATE_KEY = 11000
+
+def user_sort_field(email_prefix=None, created_from=None, created_to=None, **_):
+    """The field admin user listings are ordered by before _id.
+
+    A range filter is served from its (field, _id) index in that order, so
+    Mongo neither scans the whole _id index nor sorts in memory: email for a
+    prefix, createdAt for a window, and None (plain _id order) otherwise.
+    The keyset cursor `after` is then (value, _id) rather than an _id.
+    """
+    if email_prefix:
+        return "email"
+    if created_from or created_to:
+        return "createdAt"
+    return None
+
+def _user_sort(**filters):
+    field = user_sort_field(**filters)
+    return [(field, 1), ("_id", 1)] if field else [("_id", 1)]
+
+def _user_filter(after=None, plan=None, created_from=None, created_to=None, email_prefix=None):
+    query = {}
+    field = user_sort_field(email_prefix, created_from, created_to)
+    if after is not None and field:
+        value, _id = after
+        query["$or"] = [{field: {"$gt": value}}, {field: value, "_id": {"$gt": _id}}]
+    elif after is not None:
+        query["_id"] = {"$gt": after}
+    if plan:
+        query["plan"] = plan
+    if created_from or created_to:
+        query["createdAt"] = {}
+        if created_from:
+            query["createdAt"]["$gte"] = created_from
+        if created_to:
+            query["createdAt"]["$lt"] = created_to
+    if email_prefix:
+        # Anchored, case-sensitive prefix so the email index can be used
+        query["email"] = {"$regex": "^" + re.escape(email_prefix)}
+    return query
+
+def _projection(fields):
+    projection = {field: 1 for field in fields}
+    projection.setdefault("_id", 0)
+    return projection
+
+# ==================== Motor implementations ====================
+
+class MotorUserRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, user_id: str):
+        """The user document without its password hash"""
+        return await self.collection.find_one({"id": user_id}, USER_PROJECTION)
+
+    async def get_by_email(self, email: str):
+        """The full user document, password hash included, for login"""
+        return await self.collection.find_one({"email": email})
+
+    async def exists(self, user_id: str) -> bool:
+        return await self.collection.count_documents({"id": user_id}, limit=1) > 0
+
+    async def create(self, user: dict):
+        # Copy, because insert_one adds _id to the document it is given
+        await self.collection.insert_one(dict(user))
+
+    async def set_fields(self, user_id: str, fields: dict) -> bool:
+        """$set fields (dotted paths allowed); False if the user is missing"""
+        result = await self.collection.update_one({"id": user_id}, {"$set": fields})
+        return result.matched_count > 0
+
+    async def consume_credit(self, user_id: str, kind: str, amount: int, plans: dict, now: datetime):
+        """Apply due resets and spend amount credits in one atomic update.
+
+        Returns the updated document, or None if the user is missing or short
+        of credits.
+        """
+        import ledger
+        credit_filter, pipeline = ledger.credit_update(kind, amount, plans, now)
+        return await self.collection.find_one_and_update(
+            {"id": user_id, **credit_filter},
+            pipeline,
+            projection=USER_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def refund_credit(self, user_id: str, kind: str, amount: int):
+        import ledger
+        await self.collection.update_one({"id": user_id}, ledger.refund_pipeline(kind, amount))
+
+    def iterate(self, fields=ADMIN_USER_FIELDS, batch_size: int = 1000, **filters):
+        """Users matching filters in user_sort_field order, as an async iterator"""
+        return self.collection.find(_user_filter(**filters), _projection(fields)).sort(
+            _user_sort(**filters)
+        ).batch_size(batch_size)
+
+    async def list_page(self, limit: int, fields=ADMIN_USER_FIELDS, **filters):
+        return await self.collection.find(_user_filter(**filters), _projection(fields)).sort(
+            _user_sort(**filters)
+        ).limit(limit).to_list(limit)
+
+class MotorPlanRepository:
+    def __init__(self, collection, read_collection):
+        self.collection = collection
+        self.read_collection = read_collection
+
+    async def list(self, active_only: bool = False, read_mostly: bool = False):
+        collection = self.read_collection if read_mostly else self.collection
+        return await collection.find({"isActive": True} if active_only else {}).to_list(100)
+
+    async def versions(self, active_only: bool = True):
+        """id and updatedAt of each plan, for ETags; served read-mostly"""
+        return await self.read_collection.find(
+            {"isActive": True} if active_only else {}, {"id": 1, "updatedAt": 1}
+        ).to_list(100)
+
+    async def limits(self):
+        return await self.collection.find({}, PLAN_LIMITS_PROJECTION).to_list(100)
+
+    async def get(self, plan_id: str):
+        return await self.collection.find_one({"id": plan_id})
+
+    async def count(self) -> int:
+        return await self.collection.count_documents({})
+
+    async def create(self, plan: dict):
+        await self.collection.insert_one(dict(plan))
+
+    async def create_many(self, plans):
+        await self.collection.insert_many([dict(plan) for plan in plans])
+
+    async def update(self, plan_id: str, fields: dict) -> bool:
+        result = await self.collection.update_one({"id": plan_id}, {"$set": fields})
+        return result.matched_count > 0
+
+    async def delete(self, plan_id: str) -> bool:
+        result = await self.collection.delete_one({"id": plan_id})
+        return result.deleted_count > 0
+
+class MotorHistoryRepository:
+    def __init__(self, collection, read_collection, results_collection):
+        self.collection = collection
+        self.read_collection = read_collection
+        self.results_collection = results_collection
+
+    async def insert_many(self, entries):
+        """Insert entries, skipping ids that were already written"""
+        try:
+            # Copies, because insert_many adds _id to the documents it is given
+            await self.collection.insert_many([dict(e) for e in entries], ordered=False)
+        except BulkWriteError as e:
+            # Entries replayed from a spool may already have been written
+            if any(err["code"] != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                raise
+
+    async def get(self, search_id: str, user_id: str):
+        return await self.collection.find_one({"id": search_id, "userId": user_id})
+
+    async def find_many(self, search_ids, user_id: str):
+        """id and exports of the user's searches among search_ids"""
+        return await self.collection.find(
+            {"id": {"$in": list(search_ids)}, "userId": user_id},
+            {"id": 1, "exports": 1}
+        ).to_list(len(search_ids))
+
+    async def list_page(self, user_id: str, limit: int, before=None, read_mostly: bool = True):
+        """Newest-first entries older than before=(timestamp, id)"""
+        query = {"userId": user_id}
+        if before:
+            timestamp, search_id = before
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "id": {"$lt": search_id}}
+            ]
+        collection = self.read_collection if read_mostly else self.collection
+        return await collection.find(query, _projection(HISTORY_LIST_FIELDS)).sort(
+            [("timestamp", -1), ("id", -1)]
+        ).limit(limit).to_list(limit)
+
+    async def claim_exports(self, search_ids, user_id: str, fmt: str) -> list:
+        """Mark the user's searches as exported in fmt; returns the ids that
+        were not marked yet. Concurrent claims on one search count it once."""
+        results = await asyncio.gather(*(
+            self.collection.update_one(
+                {"id": search_id, "userId": user_id, "exports": {"$ne": fmt}},
+                {"$addToSet": {"exports": fmt}}
+            )
+            for search_id in search_ids
+        ))
+        return [search_id for search_id, result in zip(search_ids, results) if result.modified_count]
+
+    async def release_exports(self, search_ids, user_id: str, fmt: str):
+        """Undo claim_exports for searches whose export was refunded"""
+        await self.collection.update_many(
+            {"id": {"$in": list(search_ids)}, "userId": user_id},
+            {"$pull": {"exports": fmt}}
+        )
+
+    async def put_results(self, docs):
+        """Store content-addressed result documents, keeping existing ones"""
+        if not docs:
+            return
+        await self.results_collection.bulk_write(
+            [UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": doc}, upsert=True) for doc in docs],
+            ordered=False
+        )
+
+    async def get_results(self, hash_: str):
+        return await self.results_collection.find_one({"_id": hash_})
+
+class MotorSettingsRepository:
+    def __init__(self, seo_collection, seo_read_collection, payment_collection):
+        self.seo_collection = seo_collection
+        self.seo_read_collection = seo_read_collection
+        self.payment_collection = payment_collection
+
+    async def list_seo(self):
+        return await self.seo_collection.find({}).to_list(100)
+
+    async def get_seo(self, page: str, read_mostly: bool = False):
+        collection = self.seo_read_collection if read_mostly else self.seo_collection
+        return await collection.find_one({"page": page})
+
+    async def seo_version(self, page: str):
+        return await self.seo_read_collection.find_one({"page": page}, {"id": 1, "updatedAt": 1})
+
+    async def count_seo(self) -> int:
+        return await self.seo_collection.count_documents({})
+
+    async def create_seo_many(self, settings):
+        await self.seo_collection.insert_many([dict(s) for s in settings])
+
+    async def upsert_seo(self, page: str, fields: dict):
+        await self.seo_collection.update_one(
+            {"page": page},
+            {"$set": fields, "$setOnInsert": {"id": str(uuid.uuid4())}},
+            upsert=True
+        )
+
+    async def list_payment(self):
+        return await self.payment_collection.find({}).to_list(10)
+
+    async def upsert_payment(self, gateway: str, fields: dict):
+        await self.payment_collection.update_one(
+            {"gateway": gateway},
+            {"$set": fields, "$setOnInsert": {"id": str(uuid.uuid4())}},
+            upsert=True
+        )
+
+class MotorAdminRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get_by_username(self, username: str):
+        return await self.collection.find_one({"username": username})
+
+    async def create(self, admin: dict):
+        await self.collection.insert_one(dict(admin))
+
+class MotorRevocationRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def revoke(self, key: str, fields: dict):
+        """Create or overwrite the revocation entry stored under key"""
+        await self.collection.update_one({"_id": key}, {"$set": fields}, upsert=True)
+
+    async def get(self, key: str):
+        return await self.collection.find_one({"_id": key})
+
+    def keys(self, now: datetime, since: datetime = None):
+        """Keys of unexpired entries revoked at or after since, oldest first,
+        as an async iterator of {"_id", "revokedAt"} documents"""
+        query = {"expiresAt": {"$gt": now}}
+        if since is not None:
+            query["revokedAt"] = {"$gte": since}
+        return self.collection.find(query, {"_id": 1, "revokedAt": 1}).sort("revokedAt", 1)
+
+# ==================== In-memory implementations ====================
+
+def _get_path(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+def _set_path(doc: dict, path: str, value):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+class MemoryTable:
+    """Documents keyed by one field, with unique and non-unique secondary
+    indexes kept in step on every write.
+
+    The key and the unique fields must match the collection's unique indexes
+    in database._index_declarations, so both engines accept and reject the
+    same writes.
+
+    Every read returns a deep copy, like a database round trip would, so
+    callers can never mutate stored state by accident.
+    """
+
+    def __init__(self, key: str, unique=(), indexed=()):
+        self.key = key
+        self.rows = {}
+        self.unique = {field: {} for field in unique}
+        self.indexed = {field: defaultdict(set) for field in indexed}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _check_unique(self, doc: dict, ignore=None):
+        for field, index in self.unique.items():
+            value = _get_path(doc, field)
+            owner = index.get(value)
+            if value is not None and owner is not None and owner != ignore:
+                raise DuplicateKeyError(f"E11000 duplicate key error: {field} {value!r}", DUPLICATE_KEY)
+
+    def _index(self, doc: dict):
+        key = doc[self.key]
+        for field, index in self.unique.items():
+            value = _get_path(doc, field)
+            if value is not None:
+                index[value] = key
+        for field, index in self.indexed.items():
+            index[_get_path(doc, field)].add(key)
+
+    def _unindex(self, doc: dict):
+        key = doc[self.key]
+        for field, index in self.unique.items():
+            index.pop(_get_path(doc, field), None)
+        for field, index in self.indexed.items():
+            keys = index.get(_get_path(doc, field))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[_get_path(doc, field)]
+
+    def insert(self, doc: dict):
+        # Like Mongo, every document gets an ObjectId _id
+        doc = {"_id": ObjectId(), **copy.deepcopy(doc)}
+        if doc[self.key] in self.rows:
+            raise DuplicateKeyError(f"E11000 duplicate key error: {self.key} {doc[self.key]!r}", DUPLICATE_KEY)
+        self._check_unique(doc)
+        self.rows[doc[self.key]] = doc
+        self._index(doc)
+        return doc
+
+    def get(self, key):
+        doc = self.rows.get(key)
+        return copy.deepcopy(doc) if doc is not None else None
+
+    def key_for(self, field: str, value):
+        """Primary key of the row whose unique field equals value"""
+        return self.unique[field].get(value)
+
+    def keys_for(self, field: str, value):
+        return set(self.indexed[field].get(value, ()))
+
+    def all(self):
+        return [copy.deepcopy(doc) for doc in self.rows.values()]
+
+    def update(self, key, fields: dict):
+        """Set fields (dotted paths allowed) on a row; returns the new row"""
+        current = self.rows.get(key)
+        if current is None:
+            return None
+        updated = copy.deepcopy(current)
+        for path, value in fields.items():
+            _set_path(updated, path, copy.deepcopy(value))
+        self._check_unique(updated, ignore=key)
+        self._unindex(current)
+        self.rows[key] = updated
+        self._index(updated)
+        return copy.deepcopy(updated)
+
+    def delete(self, key) -> bool:
+        doc = self.rows.pop(key, None)
+        if doc is None:
+            return False
+        self._unindex(doc)
+        return True
+
+def _project(doc: dict, fields=None, exclude=("_id",)):
+    if doc is None:
+        return None
+    if fields is not None:
+        return {field: doc[field] for field in fields if field in doc}
+    return {k: v for k, v in doc.items() if k not in exclude}
+
+class MemoryUserRepository:
+    def __init__(self):
+        # Keyed by id; _id is an ObjectId, as in Mongo, for admin keyset paging
+        self.table = MemoryTable("id", unique=("email",), indexed=("plan",))
+        self._order = []
+
+    async def get(self, user_id: str):
+        return _project(self.table.get(user_id), exclude=("_id", "password"))
+
+    async def get_by_email(self, email: str):
+        key = self.table.key_for("email", email)
+        return self.table.get(key) if key is not None else None
+
+    async def exists(self, user_id: str) -> bool:
+        return user_id in self.table.rows
+
+    async def create(self, user: dict):
+        doc = self.table.insert(user)
+        bisect.insort(self._order, (doc["_id"], doc["id"]))
+
+    async def set_fields(self, user_id: str, fields: dict) -> bool:
+        return self.table.update(user_id, fields) is not None
+
+    async def consume_credit(self, user_id: str, kind: str, amount: int, plans: dict, now: datetime):
+        import ledger
+        user = self.table.rows.get(user_id)
+        if user is None:
+            return None
+        credits = ledger.spend_credits(user, kind, amount, plans, now)
+        if credits is None:
+            return None
+        return _project(self.table.update(user_id, {"credits": credits}), exclude=("_id", "password"))
+
+    async def refund_credit(self, user_id: str, kind: str, amount: int):
+        import ledger
+        user = self.table.rows.get(user_id)
+        if user is not None:
+            self.table.update(user_id, {"credits": ledger.refund_credits(user["credits"], kind, amount)})
+
+    def _matching(self, after=None, plan=None, created_from=None, created_to=None, email_prefix=None):
+        field = user_sort_field(email_prefix, created_from, created_to)
+        start = bisect.bisect_right(self._order, (after, chr(0x10FFFF))) if after is not None and not field else 0
+        plan_keys = self.table.keys_for("plan", plan) if plan else None
+        matching = []
+        for _id, key in self._order[start:]:
+            if plan_keys is not None and key not in plan_keys:
+                continue
+            user = self.table.rows.get(key)
+            if user is None:
+                continue
+            if created_from and user["createdAt"] < created_from:
+                continue
+            if created_to and user["createdAt"] >= created_to:
+                continue
+            if email_prefix and not user["email"].startswith(email_prefix):
+                continue
+            if not field:
+                yield user
+            elif after is None or (user[field], user["_id"]) > tuple(after):
+                matching.append(user)
+        yield from sorted(matching, key=lambda user: (user[field], user["_id"]))
+
+    async def iterate(self, fields=ADMIN_USER_FIELDS, batch_size: int = 1000, **filters):
+        for user in self._matching(**filters):
+            yield copy.deepcopy(_project(user, fields))
+
+    async def list_page(self, limit: int, fields=ADMIN_USER_FIELDS, **filters):
+        page = []
+        for user in self._matching(**filters):
+            page.append(copy.deepcopy(_project(user, fields)))
+            if len(page) == limit:
+                break
+        return page
+
+class MemoryPlanRepository:
+    def __init__(self):
+        self.table = MemoryTable("id", indexed=("isActive",))
+
+    async def list(self, active_only: bool = False, read_mostly: bool = False):
+        if not active_only:
+            return self.table.all()
+        active = self.table.keys_for("isActive", True)
+        # Insertion order, as a Mongo collection scan would return them
+        return [self.table.get(key) for key in self.table.rows if key in active]
+
+    async def versions(self, active_only: bool = True):
+        return [
+            {"id": plan["id"], "updatedAt": plan.get("updatedAt")}
+            for plan in await self.list(active_only)
+        ]
+
+    async def limits(self):
+        fields = [field for field in PLAN_LIMITS_PROJECTION if field != "_id"]
+        return [_project(plan, fields) for plan in self.table.all()]
+
+    async def get(self, plan_id: str):
+        return self.table.get(plan_id)
+
+    async def count(self) -> int:
+        return len(self.table)
+
+    async def create(self, plan: dict):
+        self.table.insert(plan)
+
+    async def create_many(self, plans):
+        for plan in plans:
+            self.table.insert(plan)
+
+    async def update(self, plan_id: str, fields: dict) -> bool:
+        return self.table.update(plan_id, fields) is not None
+
+    async def delete(self, plan_id: str) -> bool:
+        return self.table.delete(plan_id)
+
+class MemoryHistoryRepository:
+    def __init__(self):
+        self.table = MemoryTable("id", indexed=("userId",))
+        # Per-user (timestamp, id) keys in ascending order, for keyset paging
+        self._timeline = defaultdict(list)
+        self.results = {}
+
+    async def insert_many(self, entries):
+        for entry in entries:
+            if entry["id"] in self.table.rows:
+                continue
+            self.table.insert(entry)
+            bisect.insort(self._timeline[entry["userId"]], (entry["timestamp"], entry["id"]))
+
+    async def get(self, search_id: str, user_id: str):
+        entry = self.table.rows.get(search_id)
+        if entry is None or entry["userId"] != user_id:
+            return None
+        return copy.deepcopy(entry)
+
+    async def find_many(self, search_ids, user_id: str):
+        found = []
+        for search_id in search_ids:
+            entry = self.table.rows.get(search_id)
+            if entry is not None and entry["userId"] == user_id:
+                found.append(copy.deepcopy(_project(entry, ("id", "exports"))))
+        return found
+
+    async def list_page(self, user_id: str, limit: int, before=None, read_mostly: bool = True):
+        timeline = self._timeline.get(user_id, [])
+        end = bisect.bisect_left(timeline, before) if before else len(timeline)
+        keys = timeline[max(end - limit, 0):end]
+        return [_project(self.table.rows[key], HISTORY_LIST_FIELDS) for _, key in reversed(keys)]
+
+    async def claim_exports(self, search_ids, user_id: str, fmt: str) -> list:
+        claimed = []
+        for search_id in search_ids:
+            entry = self.table.rows.get(search_id)
+            if entry is not None and entry["userId"] == user_id and fmt not in entry.get("exports", []):
+                self.table.update(search_id, {"exports": entry.get("exports", []) + [fmt]})
+                claimed.append(search_id)
+        return claimed
+
+    async def release_exports(self, search_ids, user_id: str, fmt: str):
+        for search_id in search_ids:
+            entry = self.table.rows.get(search_id)
+            if entry is not None and entry["userId"] == user_id and fmt in entry.get("exports", []):
+                self.table.update(search_id, {"exports": [f for f in entry["exports"] if f != fmt]})
+
+    async def put_results(self, docs):
+        for doc in docs:
+            self.results.setdefault(doc["_id"], doc)
+
+    async def get_results(self, hash_: str):
+        return self.results.get(hash_)
+
+class MemorySettingsRepository:
+    def __init__(self):
+        self.seo = MemoryTable("page")
+        self.payment = MemoryTable("gateway")
+
+    async def list_seo(self):
+        return self.seo.all()
+
+    async def get_seo(self, page: str, read_mostly: bool = False):
+        return self.seo.get(page)
+
+    async def seo_version(self, page: str):
+        settings = self.seo.rows.get(page)
+        return _project(settings, ("id", "updatedAt")) if settings else None
+
+    async def count_seo(self) -> int:
+        return len(self.seo)
+
+    async def create_seo_many(self, settings):
+        for s in settings:
+            self.seo.insert(s)
+
+    async def upsert_seo(self, page: str, fields: dict):
+        if self.seo.update(page, fields) is None:
+            self.seo.insert({"id": str(uuid.uuid4()), **fields, "page": page})
+
+    async def list_payment(self):
+        return self.payment.all()
+
+    async def upsert_payment(self, gateway: str, fields: dict):
+        if self.payment.update(gateway, fields) is None:
+            self.payment.insert({"id": str(uuid.uuid4()), **fields, "gateway": gateway})
+
+class MemoryAdminRepository:
+    def __init__(self):
+        self.table = MemoryTable("username")
+
+    async def get_by_username(self, username: str):
+        return self.table.get(username)
+
+    async def create(self, admin: dict):
+        self.table.insert(admin)
+
+class MemoryRevocationRepository:
+    def __init__(self):
+        self.table = MemoryTable("_id")
+
+    async def revoke(self, key: str, fields: dict):
+        if self.table.update(key, fields) is None:
+            self.table.insert({**fields, "_id": key})
+
+    async def get(self, key: str):
+        return self.table.get(key)
+
+    async def keys(self, now: datetime, since: datetime = None):
+        # Stand-in for the TTL index: drop expired entries as they are seen
+        for key in [key for key, doc in self.table.rows.items() if doc["expiresAt"] <= now]:
+            self.table.delete(key)
+        docs = sorted(self.table.rows.values(), key=lambda doc: doc["revokedAt"])
+        for doc in docs:
+            if since is None or doc["revokedAt"] >= since:
+                yield {"_id": doc["_id"], "revokedAt": doc["revokedAt"]}
+
+# ==================== Wiring ====================
+
+class Repositories:
+    """The active set of repositories.
+
+    Modules hold on to the shared `repos` object rather than to individual
+    repositories, so use_backend() takes effect everywhere.
+    """
+
+    def __init__(self, backend: str):
+        self.use_backend(backend)
+
+    def use_backend(self, backend: str):
+        if backend == "mongo":
+            self.users = MotorUserRepository(users_collection)
+            self.plans = MotorPlanRepository(pricing_plans_collection, pricing_plans_read_collection)
+            self.history = MotorHistoryRepository(
+                search_history_collection, search_history_read_collection, search_results_collection
+            )
+            self.settings = MotorSettingsRepository(
+                seo_settings_collection, seo_settings_read_collection, payment_settings_collection
+            )
+            self.admins = MotorAdminRepository(admins_collection)
+            self.revocations = MotorRevocationRepository(revoked_tokens_collection)
+        elif backend == "memory":
+            self.users = MemoryUserRepository()
+            self.plans = MemoryPlanRepository()
+            self.history = MemoryHistoryRepository()
+            self.settings = MemorySettingsRepository()
+            self.admins = MemoryAdminRepository()
+            self.revocations = MemoryRevocationRepository()
+        else:
+            raise ValueError(f"Unknown repository backend: {backend}")
+        self.backend = backend
+
+repos = Repositories(REPOSITORY_BACKEND)
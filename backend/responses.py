@@ -0,0 +1,34 @@
+from fastapi.responses import JSONResponse
+import pydantic_core
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+def _default(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+def dumps(content) -> bytes:
+    """Encode to compact JSON bytes. datetimes from Mongo are written as ISO
+    8601 directly, without a jsonable_encoder pass."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return pydantic_core.to_json(content, fallback=str)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, falling back to pydantic-core"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def fast_response(content, status_code: int = 200, headers: dict = None):
+    """Send a trusted object as JSON without FastAPI's response_model pass.
+
+    Handlers returning a Response instance skip FastAPI's re-validation and
+    jsonable_encoder walk; use this only for objects built by this service
+    (models we just constructed or documents we projected ourselves).
+    """
+    return FastJSONResponse(content=content, status_code=status_code, headers=headers)
@@ -0,0 +1,69 @@
+from bson import Binary
+from datetime import datetime
+import hashlib
+import json
+import logging
+import zlib
+import os
+
+from repositories import repos
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# "zlib", "zstd" (needs the zstandard package) or "none"
+RESULT_COMPRESSION = os.environ.get('RESULT_COMPRESSION', 'zlib')
+
+if RESULT_COMPRESSION == "zstd" and zstandard is None:
+    logger.warning("zstandard is not installed, storing search results with zlib")
+    RESULT_COMPRESSION = "zlib"
+
+def _canonical_json(results: dict) -> bytes:
+    return json.dumps(results, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+def _compress(data: bytes):
+    if RESULT_COMPRESSION == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    if RESULT_COMPRESSION == "zlib":
+        return zlib.compress(data, 6)
+    return data
+
+def _decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this search result")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if encoding == "zlib":
+        return zlib.decompress(data)
+    return data
+
+def result_document(results: dict):
+    """Build the content-addressed search_results document for a result payload"""
+    data = _canonical_json(results)
+    stored = _compress(data)
+    return {
+        "_id": hashlib.sha256(data).hexdigest(),
+        "data": Binary(stored),
+        "encoding": RESULT_COMPRESSION,
+        "size": len(data),
+        "storedSize": len(stored),
+        "createdAt": datetime.utcnow()
+    }
+
+async def load_results(hash_: str):
+    doc = await repos.history.get_results(hash_)
+    if doc is None:
+        return None
+    return json.loads(_decompress(bytes(doc["data"]), doc.get("encoding", "none")))
+
+async def history_results(entry: dict):
+    """Return the result payload of a search_history entry, old or new layout"""
+    if "results" in entry:
+        return entry["results"]
+    if entry.get("resultHash"):
+        return await load_results(entry["resultHash"])
+    return None
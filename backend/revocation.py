@@ -0,0 +1,256 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import os
+
+from repositories import repos
+from metrics import revocation_checks
+
+logger = logging.getLogger(__name__)
+
+# Revoked tokens are stored in Mongo until the token would have expired anyway
+# and mirrored per worker in a Bloom filter, so the common case (a token that
+# was never revoked) is answered without a database round trip.
+REVOCATION_BLOOM_CAPACITY = int(os.environ.get('REVOCATION_BLOOM_CAPACITY', 100000))
+REVOCATION_BLOOM_ERROR_RATE = float(os.environ.get('REVOCATION_BLOOM_ERROR_RATE', 0.001))
+# How quickly other workers see a revocation
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', 5))
+# Full rebuilds drop entries whose tokens have expired since the last one
+REVOCATION_REBUILD_SECONDS = float(os.environ.get('REVOCATION_REBUILD_SECONDS', 3600))
+# Incremental refreshes re-read this much history, covering clock skew between
+# the workers that stamp revokedAt
+REVOCATION_CLOCK_SKEW_SECONDS = float(os.environ.get('REVOCATION_CLOCK_SKEW_SECONDS', 5))
+# Bloom hits are confirmed against the database; confirmed answers are kept
+# briefly, and dropped as soon as a refresh sees that key change
+REVOCATION_LOOKUP_CACHE_SIZE = int(os.environ.get('REVOCATION_LOOKUP_CACHE_SIZE', 10000))
+REVOCATION_LOOKUP_CACHE_TTL = float(os.environ.get('REVOCATION_LOOKUP_CACHE_TTL', 60))
+
+def token_key(jti: str) -> str:
+    return f"jti:{jti}"
+
+def user_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Sized for `capacity` keys at `error_rate` false positives; the k probe
+    positions come from one blake2b digest by double hashing.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        added = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        # Re-adding a key sets no new bits, so count stays close to the number
+        # of distinct keys even though refreshes overlap
+        if added:
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class RevocationList:
+    """Per-worker view of revoked tokens.
+
+    Entries are keyed "jti:<jti>" for a single token, or "user:<id>" for
+    every token of a user issued before `issuedBefore` (log out everywhere).
+    A background task pulls entries revoked since the last refresh into the
+    filter and periodically rebuilds it from scratch.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, refresh_seconds: float, rebuild_seconds: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.bloom = BloomFilter(capacity, error_rate)
+        self._lookups = OrderedDict()
+        self._since = None
+        self._rebuilt_at = 0.0
+        self._rebuilding = False
+        self._revoked_during_rebuild = []
+        self._task = None
+        self.refreshes = 0
+        self.errors = 0
+
+    # ---------- lifecycle ----------
+
+    async def start(self):
+        await self.rebuild()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Revocations made on other workers are not seen until the
+                # next successful refresh
+                self.errors += 1
+                logger.error("Token revocation refresh failed: %r", e)
+
+    # ---------- filter maintenance ----------
+
+    def _mark(self, key: str):
+        self.bloom.add(key)
+        self._lookups.pop(key, None)
+        if self._rebuilding:
+            self._revoked_during_rebuild.append(key)
+
+    async def rebuild(self):
+        """Replace the filter with one built from every unexpired entry"""
+        now = datetime.utcnow()
+        self._rebuilding = True
+        try:
+            keys = [doc["_id"] async for doc in repos.revocations.keys(now)]
+            bloom = BloomFilter(max(self.capacity, len(keys) * 2), self.error_rate)
+            for key in keys + self._revoked_during_rebuild:
+                bloom.add(key)
+        finally:
+            self._rebuilding = False
+            self._revoked_during_rebuild = []
+        self.bloom = bloom
+        self._lookups.clear()
+        self._since = now
+        self._rebuilt_at = time.monotonic()
+        logger.info("Token revocation filter rebuilt with %d entries", bloom.count)
+
+    async def refresh(self):
+        """Add entries revoked since the last refresh, rebuilding when the
+        filter is due or has filled up"""
+        if (
+            self._since is None
+            or time.monotonic() - self._rebuilt_at > self.rebuild_seconds
+            or self.bloom.count > self.bloom.capacity
+        ):
+            await self.rebuild()
+            return
+        now = datetime.utcnow()
+        since = self._since - timedelta(seconds=REVOCATION_CLOCK_SKEW_SECONDS)
+        async for doc in repos.revocations.keys(now, since):
+            self._mark(doc["_id"])
+        self._since = now
+        self.refreshes += 1
+
+    # ---------- revoking ----------
+
+    async def revoke_token(self, payload: dict):
+        """Revoke one token by its jti until the token expires"""
+        jti = payload.get("jti")
+        if not jti:
+            # Tokens issued before jti was added can only be revoked per user
+            await self.revoke_user(payload["sub"])
+            return
+        key = token_key(jti)
+        await repos.revocations.revoke(key, {
+            "userId": payload.get("sub"),
+            "revokedAt": datetime.utcnow(),
+            "expiresAt": datetime.utcfromtimestamp(payload["exp"])
+        })
+        self._mark(key)
+
+    async def revoke_user(self, user_id: str):
+        """Revoke every token issued to user_id so far"""
+        from auth import ACCESS_TOKEN_EXPIRE_DAYS
+        now = datetime.utcnow()
+        key = user_key(user_id)
+        await repos.revocations.revoke(key, {
+            "userId": user_id,
+            # Compared with the token's iat, in seconds since the epoch
+            "issuedBefore": time.time(),
+            "revokedAt": now,
+            # By then every token covered by this entry has expired
+            "expiresAt": now + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
+        })
+        self._mark(key)
+
+    # ---------- checking ----------
+
+    async def _lookup(self, key: str):
+        now = time.monotonic()
+        cached = self._lookups.get(key)
+        if cached is not None:
+            entry, expires_at = cached
+            if expires_at > now:
+                self._lookups.move_to_end(key)
+                return entry
+            del self._lookups[key]
+        entry = await repos.revocations.get(key)
+        self._lookups[key] = (entry, now + REVOCATION_LOOKUP_CACHE_TTL)
+        if len(self._lookups) > REVOCATION_LOOKUP_CACHE_SIZE:
+            self._lookups.popitem(last=False)
+        return entry
+
+    async def is_revoked(self, payload: dict) -> bool:
+        jti = payload.get("jti")
+        user_id = payload.get("sub")
+        checks = []
+        if jti and token_key(jti) in self.bloom:
+            checks.append(token_key(jti))
+        if user_id and user_key(user_id) in self.bloom:
+            checks.append(user_key(user_id))
+        if not checks:
+            revocation_checks.inc("clear")
+            return False
+
+        for key in checks:
+            entry = await self._lookup(key)
+            if entry is None:
+                continue
+            if "issuedBefore" not in entry or payload.get("iat", 0) < entry["issuedBefore"]:
+                revocation_checks.inc("revoked")
+                return True
+        revocation_checks.inc("confirmed_clear")
+        return False
+
+    async def check(self, payload: dict):
+        if await self.is_revoked(payload):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    def stats(self):
+        return {
+            "entries": self.bloom.count,
+            "capacity": self.bloom.capacity,
+            "bits": self.bloom.size,
+            "hashes": self.bloom.hashes,
+            "cachedLookups": len(self._lookups),
+            "refreshes": self.refreshes,
+            "errors": self.errors
+        }
+
+revocation_list = RevocationList(
+    REVOCATION_BLOOM_CAPACITY, REVOCATION_BLOOM_ERROR_RATE,
+    REVOCATION_REFRESH_SECONDS, REVOCATION_REBUILD_SECONDS
+)
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import re
+import time
+import unicodedata
+import os
+
+from database import search_cache_collection
+from models import SearchResult
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_TTL = float(os.environ.get('SEARCH_CACHE_TTL', 600))
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 5000))
+# Share results between workers through Mongo in addition to the local LRU
+SEARCH_CACHE_SHARED = os.environ.get('SEARCH_CACHE_SHARED', 'false').lower() == 'true'
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SUFFIXES = (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", ""))
+
+def _stem(token: str) -> str:
+    """Very light suffix stripping so "tips" and "tip" share a cache entry"""
+    for suffix, replacement in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            if suffix == "s" and token.endswith("ss"):
+                return token
+            return token[:-len(suffix)] + replacement
+    return token
+
+def normalize_query(query: str) -> str:
+    text = unicodedata.normalize("NFKC", query).casefold()
+    text = _NON_WORD.sub(" ", text)
+    return " ".join(_stem(token) for token in text.split())
+
+def cache_key(query: str, results_per_category: int, now: float = None) -> str:
+    """Key on normalized query, plan result size and the current time window"""
+    window = int((now or time.time()) // SEARCH_CACHE_TTL)
+    return f"{normalize_query(query)}|{results_per_category}|{window}"
+
+class SearchCache:
+    """Two-tier cache of search results with single-flight fetching.
+
+    Concurrent identical searches share one upstream fetch; results are kept
+    in a per-worker LRU and, optionally, in a Mongo collection shared by all
+    workers. Partial results are never cached.
+    """
+
+    def __init__(self, ttl: float, size: int, shared: bool):
+        self.ttl = ttl
+        self.size = size
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get_local(self, key: str):
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+        result, expires_at = cached
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _put_local(self, key: str, result: SearchResult):
+        self._entries[key] = (result, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    async def _get_shared(self, key: str):
+        try:
+            doc = await search_cache_collection.find_one(
+                {"_id": key, "expiresAt": {"$gt": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.warning("Shared search cache read failed: %r", e)
+            return None
+        return SearchResult(**doc["results"]) if doc else None
+
+    async def _put_shared(self, key: str, result: SearchResult):
+        try:
+            await search_cache_collection.replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "results": result.model_dump(),
+                    "expiresAt": datetime.utcnow() + timedelta(seconds=self.ttl)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning("Shared search cache write failed: %r", e)
+
+    async def get_or_fetch(self, query: str, results_per_category: int, fetch):
+        """Return cached results for the query, or await fetch() once for all callers.
+
+        The fetch runs as its own task and every caller, the first included,
+        waits on it through a shield: a caller that is cancelled (say, its
+        client disconnected) leaves the fetch running for the others.
+        """
+        key = cache_key(query, results_per_category)
+        result = self._get_local(key)
+        if result is not None:
+            self.memory_hits += 1
+            return result
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._load(key, fetch))
+            task.add_done_callback(_retrieve_exception)
+            self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, fetch):
+        try:
+            result = await self._get_shared(key) if self.shared else None
+            if result is not None:
+                self.shared_hits += 1
+            else:
+                self.misses += 1
+                result = await fetch()
+                if not result.partial and self.shared:
+                    await self._put_shared(key, result)
+            if not result.partial:
+                self._put_local(key, result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.memory_hits + self.shared_hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inFlight": len(self._in_flight),
+            "memoryHits": self.memory_hits,
+            "sharedHits": self.shared_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hitRate": (lookups - self.misses) / lookups if lookups else 0.0
+        }
+
+def _retrieve_exception(task: asyncio.Task):
+    # Every waiter may have been cancelled; don't log the failure as unhandled
+    if not task.cancelled():
+        task.exception()
+
+search_cache = SearchCache(SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE, SEARCH_CACHE_SHARED)
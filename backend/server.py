@@ -1,4 +1,4 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from pathlib import Path
@@ -10,18 +10,55 @@ from models import (
     UserCreate, UserLogin, UserResponse, AuthResponse,
     PricingPlan, PricingPlanCreate,
     SearchRequest, SearchResult, ExportRequest, ExportResponse,
+    BulkExportRequest, ExportJobResponse,
+    SearchHistoryPage, SearchHistoryDetail,
     AdminLogin, AdminAuthResponse,
     PaymentSettings, PaymentSettingsUpdate,
     SEOSettings, SEOSettingsUpdate,
-    CreditUpdate, InsightItem, ContentIdea
+    CreditUpdate
 )
-from auth import hash_password, verify_password, create_access_token, get_current_user, get_current_admin
-from database import (
-    users_collection, pricing_plans_collection, search_history_collection,
-    payment_settings_collection, seo_settings_collection, admins_collection,
-    init_database, close_database
+from auth import (
+    hash_password_async, verify_password_async, create_access_token,
+    get_current_user, get_current_admin, get_metrics_reader, get_token_payload,
+    shutdown_password_pool, password_pool_stats, preload as preload_auth
 )
+from revocation import revocation_list
+from database import db, init_database, close_database, warm_up_pool, pool_listener
+from repositories import repos, user_sort_field
+from cache import (
+    public_cache, conditional_json_response, cached_json_response, watch_invalidations,
+    version_etag, body_etag, serialize_json, CachedBody, CACHE_CHANGE_STREAMS
+)
+from principals import get_current_user_doc, invalidate_user
+from ledger import (
+    consume_credit, refund_credit, get_plan_limits, invalidate_plan_limits,
+    effective_credits, DEFAULT_PLAN_LIMITS
+)
+from providers import (
+    search_platforms, render_for_query, close_providers, ProviderUnavailable,
+    preload as preload_providers
+)
+from search_cache import search_cache
+from history_writer import history_writer
+from result_store import history_results
+from exporter import normalize_format, find_search, charge_exports, export_response, shutdown_export_pool
+from export_jobs import (
+    export_workers, enqueue_job, find_job, job_response, bundle_path, EXPORT_JOB_MAX_SEARCHES
+)
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from responses import FastJSONResponse, fast_response
+from ratelimit import rate_limit_middleware
+from profiler import profile, PROFILE_MAX_SECONDS
+from metrics import (
+    METRICS_ENABLED, registry, metrics_middleware, metrics_response, monitor_event_loop_lag
+)
+from bson import ObjectId
+from bson.errors import InvalidId
 from datetime import datetime
+from typing import Optional
+import asyncio
+import base64
+import json
 import uuid
 
 ROOT_DIR = Path(__file__).parent
@@ -31,19 +68,53 @@ load_dotenv(ROOT_DIR / '.env')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _log_preload_failure(future):
+    # The import is retried, and fails loudly, on first use
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Background preload failed", exc_info=future.exception())
+
 # Lifespan context manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await init_database()
     logger.info("Database initialized")
+    await revocation_list.start()
+    if repos.backend == "mongo":
+        await warm_up_pool()
+    await history_writer.start()
+    if repos.backend == "mongo":
+        # Export jobs are queued in Mongo whatever the repository backend
+        export_workers.start()
+    watcher = None
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag()) if METRICS_ENABLED else None
+    if CACHE_CHANGE_STREAMS:
+        watcher = asyncio.create_task(watch_invalidations(
+            db,
+            {"pricing_plans": "pricing:", "seo_settings": "seo:"},
+            callbacks=[invalidate_plan_limits]
+        ))
+    # Deferred imports load in the background so the worker starts serving
+    # sooner and the first login does not pay for them
+    for preload in (preload_auth, preload_providers):
+        asyncio.get_running_loop().run_in_executor(None, preload).add_done_callback(_log_preload_failure)
     yield
     # Shutdown
+    if watcher:
+        watcher.cancel()
+    if lag_monitor:
+        lag_monitor.cancel()
+    await revocation_list.stop()
+    await export_workers.stop()
+    await history_writer.stop()
     await close_database()
     logger.info("Database connection closed")
+    shutdown_password_pool()
+    shutdown_export_pool()
+    await close_providers()
 
 # Create the main app
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -53,13 +124,13 @@ api_router = APIRouter(prefix="/api")
 @api_router.post("/auth/register", response_model=AuthResponse)
 async def register(user_data: UserCreate):
     # Check if user exists
-    existing_user = await users_collection.find_one({"email": user_data.email})
+    existing_user = await repos.users.get_by_email(user_data.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
     user_dict = user_data.dict()
-    user_dict["password"] = hash_password(user_data.password)
+    user_dict["password"] = await hash_password_async(user_data.password)
     user_dict["id"] = str(uuid.uuid4())
     user_dict["role"] = "user"
     user_dict["plan"] = "Free"
@@ -75,7 +146,7 @@ async def register(user_data: UserCreate):
     user_dict["createdAt"] = datetime.utcnow()
     user_dict["updatedAt"] = datetime.utcnow()
     
-    await users_collection.insert_one(user_dict)
+    await repos.users.create(user_dict)
     
     # Create token
     token = create_access_token({"sub": user_dict["id"], "role": user_dict["role"]})
@@ -90,12 +161,12 @@ async def register(user_data: UserCreate):
         credits=user_dict["credits"]
     )
     
-    return AuthResponse(token=token, user=user_response)
+    return fast_response(AuthResponse(token=token, user=user_response))
 
 @api_router.post("/auth/login", response_model=AuthResponse)
 async def login(credentials: UserLogin):
-    user = await users_collection.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user["password"]):
+    user = await repos.users.get_by_email(credentials.email)
+    if not user or not await verify_password_async(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Create token
@@ -111,39 +182,41 @@ async def login(credentials: UserLogin):
         credits=user["credits"]
     )
     
-    return AuthResponse(token=token, user=user_response)
+    return fast_response(AuthResponse(token=token, user=user_response))
+
+@api_router.post("/auth/logout")
+async def logout(payload: dict = Depends(get_token_payload)):
+    await revocation_list.revoke_token(payload)
+    return {"success": True}
+
+@api_router.post("/auth/logout-all")
+async def logout_all(current_user: dict = Depends(get_current_user)):
+    await revocation_list.revoke_user(current_user["id"])
+    return {"success": True}
 
 @api_router.get("/auth/me", response_model=UserResponse)
-async def get_me(current_user: dict = Depends(get_current_user)):
-    user = await users_collection.find_one({"id": current_user["id"]})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    return UserResponse(
+async def get_me(user: dict = Depends(get_current_user_doc)):
+    return fast_response(UserResponse(
         id=user["id"],
         name=user["name"],
         email=user["email"],
         role=user["role"],
         plan=user["plan"],
-        credits=user["credits"]
-    )
+        credits=effective_credits(user, await get_plan_limits())
+    ))
 
 # ==================== User Routes ====================
 
 @api_router.get("/users/credits")
-async def get_credits(current_user: dict = Depends(get_current_user)):
-    user = await users_collection.find_one({"id": current_user["id"]})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    return user["credits"]
+async def get_credits(user: dict = Depends(get_current_user_doc)):
+    return fast_response(effective_credits(user, await get_plan_limits()))
 
 @api_router.post("/users/upgrade")
 async def upgrade_plan(plan_data: dict, current_user: dict = Depends(get_current_user)):
     plan_id = plan_data.get("planId")
     
     # Get the plan
-    plan = await pricing_plans_collection.find_one({"id": plan_id})
+    plan = await repos.plans.get(plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
     
@@ -158,16 +231,12 @@ async def upgrade_plan(plan_data: dict, current_user: dict = Depends(get_current
         "lastResetDate": datetime.utcnow()
     }
     
-    await users_collection.update_one(
-        {"id": current_user["id"]},
-        {
-            "$set": {
-                "plan": plan["name"],
-                "credits": new_credits,
-                "updatedAt": datetime.utcnow()
-            }
-        }
-    )
+    await repos.users.set_fields(current_user["id"], {
+        "plan": plan["name"],
+        "credits": new_credits,
+        "updatedAt": datetime.utcnow()
+    })
+    invalidate_user(current_user["id"])
     
     return {"success": True, "plan": plan["name"]}
 
@@ -175,140 +244,160 @@ async def upgrade_plan(plan_data: dict, current_user: dict = Depends(get_current
 
 @api_router.post("/insights/search", response_model=SearchResult)
 async def search_insights(search_data: SearchRequest, current_user: dict = Depends(get_current_user)):
-    # Get user
-    user = await users_collection.find_one({"id": current_user["id"]})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Check if user has credits
-    if user["credits"]["searchesRemaining"] <= 0:
-        raise HTTPException(status_code=403, detail="No search credits remaining")
-    
-    # Mock search results (replace with actual API integration)
-    results = SearchResult(
-        painPoints=[
-            InsightItem(
-                id=str(uuid.uuid4()),
-                platform="Reddit",
-                content=f"Finding consistent {search_data.query} content ideas is exhausting",
-                engagement=342,
-                source="r/ContentCreation"
-            ),
-            InsightItem(
-                id=str(uuid.uuid4()),
-                platform="X",
-                content=f"Struggling to understand {search_data.query} audience preferences",
-                engagement=156,
-                source="@CreatorTips"
-            ),
-            InsightItem(
-                id=str(uuid.uuid4()),
-                platform="YouTube",
-                content=f"Low engagement on {search_data.query} content despite regular posting",
-                engagement=89,
-                source="Creator Community"
+    # Check and deduct a search credit in one atomic update
+    user = await consume_credit(current_user["id"], "searches")
+    
+    # Refund the credit if anything fails before the results are handed back
+    try:
+        # Query all platforms concurrently, sized by the user's plan
+        plans = await get_plan_limits()
+        limits = plans.get(user["plan"], DEFAULT_PLAN_LIMITS)
+        results_per_category = limits.get("resultsPerCategory", DEFAULT_PLAN_LIMITS["resultsPerCategory"])
+        try:
+            results = await search_cache.get_or_fetch(
+                search_data.query,
+                results_per_category,
+                lambda: search_platforms(search_data.query, results_per_category)
             )
-        ],
-        trendingIdeas=[
-            InsightItem(
-                id=str(uuid.uuid4()),
-                platform="Reddit",
-                content=f"AI-powered {search_data.query} analysis tools",
-                trendScore=95,
-                source="r/Marketing"
-            ),
-            InsightItem(
-                id=str(uuid.uuid4()),
-                platform="X",
-                content=f"Multi-platform {search_data.query} audience insights",
-                trendScore=87,
-                source="@TechTrends"
-            ),
-            InsightItem(
-                id=str(uuid.uuid4()),
-                platform="YouTube",
-                content=f"Real-time {search_data.query} social listening",
-                trendScore=82,
-                source="Marketing Insights"
-            )
-        ],
-        contentIdeas=[
-            ContentIdea(
-                id=str(uuid.uuid4()),
-                title=f"How to validate {search_data.query} ideas before creating",
-                description="A step-by-step guide based on audience discussions",
-                platforms=["Reddit", "X", "YouTube"]
-            ),
-            ContentIdea(
-                id=str(uuid.uuid4()),
-                title=f"Understanding your {search_data.query} audience pain points",
-                description="Tools and techniques for audience research",
-                platforms=["Reddit", "X"]
-            ),
-            ContentIdea(
-                id=str(uuid.uuid4()),
-                title=f"Creating {search_data.query} content that converts",
-                description="Data-driven content strategy",
-                platforms=["YouTube", "X"]
-            )
-        ]
-    )
-    
-    # Save search history
-    search_history = {
-        "id": str(uuid.uuid4()),
-        "userId": current_user["id"],
-        "query": search_data.query,
-        "results": results.dict(),
-        "timestamp": datetime.utcnow()
-    }
-    await search_history_collection.insert_one(search_history)
-    
-    # Deduct credit
-    await users_collection.update_one(
-        {"id": current_user["id"]},
-        {
-            "$inc": {
-                "credits.searchesRemaining": -1,
-                "credits.searchesUsedToday": 1
-            }
+        except ProviderUnavailable:
+            raise HTTPException(status_code=503, detail="Insight sources are temporarily unavailable")
+        # Cached results are shared with every query that normalizes alike
+        results = render_for_query(results, search_data.query)
+        
+        # Save search history
+        # Written in batches off the request path
+        search_history = {
+            "id": str(uuid.uuid4()),
+            "userId": current_user["id"],
+            "query": search_data.query,
+            "timestamp": datetime.utcnow()
         }
+        await history_writer.add(search_history, results.dict(exclude={"searchId"}))
+        
+        return fast_response(results.model_copy(update={"searchId": search_history["id"]}))
+    except BaseException:
+        await refund_credit(current_user["id"], "searches")
+        raise
+
+HISTORY_PAGE_MAX = 100
+
+def encode_history_cursor(item: dict) -> str:
+    raw = json.dumps([item["timestamp"].isoformat(), item["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_history_cursor(cursor: str):
+    try:
+        timestamp, search_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), search_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@api_router.get("/insights/history", response_model=SearchHistoryPage)
+async def list_search_history(
+    limit: int = Query(20, ge=1, le=HISTORY_PAGE_MAX),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Newest-first list of the caller's searches, without result payloads"""
+    # Entries just flushed may not have replicated yet, so read them back
+    # from the primary; otherwise the listing can come from a secondary
+    read_mostly = True
+    if history_writer.has_pending_for(current_user["id"]):
+        await history_writer.flush()
+        read_mostly = False
+    
+    items = await repos.history.list_page(
+        current_user["id"], limit,
+        before=decode_history_cursor(cursor) if cursor else None,
+        read_mostly=read_mostly
     )
     
-    return results
+    # Projected straight from Mongo, so it can skip model validation
+    return fast_response({
+        "items": items,
+        "nextCursor": encode_history_cursor(items[-1]) if len(items) == limit else None
+    })
+
+@api_router.get("/insights/history/{search_id}", response_model=SearchHistoryDetail)
+async def get_search_history(search_id: str, current_user: dict = Depends(get_current_user)):
+    search = await find_search(search_id, current_user["id"])
+    results = await history_results(search)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Search results not found")
+    
+    return fast_response({
+        "id": search["id"],
+        "query": search["query"],
+        "timestamp": search["timestamp"],
+        "results": {**results, "searchId": search["id"]}
+    })
 
 @api_router.post("/insights/export", response_model=ExportResponse)
 async def export_insights(export_data: ExportRequest, current_user: dict = Depends(get_current_user)):
-    # Get user
-    user = await users_collection.find_one({"id": current_user["id"]})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    fmt = normalize_format(export_data.format)
+    search = await find_search(export_data.searchId, current_user["id"])
     
-    # Check if user has credits
-    if user["credits"]["exportsRemaining"] <= 0:
-        raise HTTPException(status_code=403, detail="No export credits remaining")
+    # Charge once per search and format; later downloads are free
+    if fmt not in search.get("exports", []):
+        await charge_exports(current_user["id"], [search["id"]], fmt)
     
-    # Mock export URL
-    download_url = f"/downloads/{export_data.searchId}.{export_data.format.lower()}"
-    
-    # Deduct credit
-    await users_collection.update_one(
-        {"id": current_user["id"]},
-        {
-            "$inc": {
-                "credits.exportsRemaining": -1,
-                "credits.exportsUsedThisMonth": 1
-            }
-        }
-    )
+    download_url = f"/api/insights/downloads/{search['id']}.{fmt}"
     
     return ExportResponse(downloadUrl=download_url, success=True)
 
+@api_router.get("/insights/downloads/{search_id}.{fmt}")
+async def download_export(search_id: str, fmt: str, current_user: dict = Depends(get_current_user)):
+    fmt = normalize_format(fmt)
+    search = await find_search(search_id, current_user["id"])
+    if fmt not in search.get("exports", []):
+        raise HTTPException(status_code=403, detail="Export this search before downloading it")
+    
+    return await export_response(search, fmt)
+
+@api_router.post("/insights/export/jobs", response_model=ExportJobResponse, status_code=202)
+async def create_export_job(export_data: BulkExportRequest, current_user: dict = Depends(get_current_user)):
+    fmt = normalize_format(export_data.format)
+    search_ids = list(dict.fromkeys(export_data.searchIds))
+    if not search_ids:
+        raise HTTPException(status_code=400, detail="No searches to export")
+    if len(search_ids) > EXPORT_JOB_MAX_SEARCHES:
+        raise HTTPException(status_code=400, detail=f"At most {EXPORT_JOB_MAX_SEARCHES} searches per export")
+    
+    for search_id in search_ids:
+        if history_writer.is_pending(search_id):
+            await history_writer.flush()
+            break
+    searches = await repos.history.find_many(search_ids, current_user["id"])
+    if len(searches) != len(search_ids):
+        raise HTTPException(status_code=404, detail="Search not found")
+    
+    # Same accounting as export_insights: one credit per search and format
+    unpaid = [s["id"] for s in searches if fmt not in s.get("exports", [])]
+    charged = await charge_exports(current_user["id"], unpaid, fmt) if unpaid else []
+    
+    job = await enqueue_job(current_user["id"], search_ids, fmt, charged)
+    return job_response(job)
+
+@api_router.get("/insights/export/jobs/{job_id}", response_model=ExportJobResponse)
+async def get_export_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    return job_response(await find_job(job_id, current_user["id"]))
+
+@api_router.get("/insights/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await find_job(job_id, current_user["id"])
+    path = bundle_path(job["id"])
+    if job["status"] != "done" or not path.exists():
+        raise HTTPException(status_code=409, detail="Export job is not finished")
+    
+    return FileResponse(path, media_type="application/zip", filename=f"insights-export-{job['id']}.zip")
+
 # ==================== Pricing Routes ====================
 
-@api_router.get("/pricing/plans")
-async def get_pricing_plans():
-    plans = await pricing_plans_collection.find({"isActive": True}).to_list(100)
+async def probe_active_plans():
+    return version_etag(await repos.plans.versions(active_only=True))
+
+async def load_active_plans(read_mostly: bool = True):
+    plans = await repos.plans.list(active_only=True, read_mostly=read_mostly)
     return [
         {
             "id": plan.get("id", str(plan["_id"])),
@@ -325,14 +414,24 @@ async def get_pricing_plans():
             "isPopular": plan["isPopular"]
         }
         for plan in plans
-    ]
+    ], version_etag(plans)
+
+async def refill_public_pricing():
+    """Reload the public pricing page from the primary after a plan write"""
+    await public_cache.refill("pricing:active", lambda: load_active_plans(read_mostly=False))
+
+@api_router.get("/pricing/plans")
+async def get_pricing_plans(request: Request):
+    return await conditional_json_response(
+        request, "pricing:active", load_active_plans, probe_active_plans
+    )
 
 # ==================== Admin Authentication ====================
 
 @api_router.post("/admin/auth/login", response_model=AdminAuthResponse)
 async def admin_login(credentials: AdminLogin):
-    admin = await admins_collection.find_one({"username": credentials.username})
-    if not admin or not verify_password(credentials.password, admin["password"]):
+    admin = await repos.admins.get_by_username(credentials.username)
+    if not admin or not await verify_password_async(credentials.password, admin["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Create token
@@ -347,7 +446,7 @@ async def admin_login(credentials: AdminLogin):
 
 @api_router.get("/admin/pricing")
 async def admin_get_pricing(current_admin: dict = Depends(get_current_admin)):
-    plans = await pricing_plans_collection.find({}).to_list(100)
+    plans = await repos.plans.list()
     return [
         {
             "id": plan.get("id", str(plan["_id"])),
@@ -361,6 +460,7 @@ async def admin_get_pricing(current_admin: dict = Depends(get_current_admin)):
             "aiGenerations": plan["aiGenerations"],
             "exportsPerMonth": plan["exportsPerMonth"],
             "resultsPerCategory": plan["resultsPerCategory"],
+            "requestsPerMinute": plan.get("requestsPerMinute"),
             "isPopular": plan["isPopular"],
             "isActive": plan["isActive"]
         }
@@ -374,7 +474,9 @@ async def admin_create_pricing(plan_data: PricingPlanCreate, current_admin: dict
     plan_dict["createdAt"] = datetime.utcnow()
     plan_dict["updatedAt"] = datetime.utcnow()
     
-    await pricing_plans_collection.insert_one(plan_dict)
+    await repos.plans.create(plan_dict)
+    invalidate_plan_limits()
+    await refill_public_pricing()
     
     return plan_dict
 
@@ -383,21 +485,22 @@ async def admin_update_pricing(plan_id: str, plan_data: PricingPlanCreate, curre
     plan_dict = plan_data.dict()
     plan_dict["updatedAt"] = datetime.utcnow()
     
-    result = await pricing_plans_collection.update_one(
-        {"id": plan_id},
-        {"$set": plan_dict}
-    )
+    updated = await repos.plans.update(plan_id, plan_dict)
+    invalidate_plan_limits()
+    await refill_public_pricing()
     
-    if result.matched_count == 0:
+    if not updated:
         raise HTTPException(status_code=404, detail="Plan not found")
     
     return {"success": True, "id": plan_id}
 
 @api_router.delete("/admin/pricing/{plan_id}")
 async def admin_delete_pricing(plan_id: str, current_admin: dict = Depends(get_current_admin)):
-    result = await pricing_plans_collection.delete_one({"id": plan_id})
+    deleted = await repos.plans.delete(plan_id)
+    invalidate_plan_limits()
+    await refill_public_pricing()
     
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Plan not found")
     
     return {"success": True}
@@ -406,7 +509,7 @@ async def admin_delete_pricing(plan_id: str, current_admin: dict = Depends(get_c
 
 @api_router.get("/admin/payment-settings")
 async def admin_get_payment_settings(current_admin: dict = Depends(get_current_admin)):
-    settings = await payment_settings_collection.find({}).to_list(10)
+    settings = await repos.settings.list_payment()
     
     razorpay_settings = next((s for s in settings if s["gateway"] == "razorpay"), None)
     paypal_settings = next((s for s in settings if s["gateway"] == "paypal"), None)
@@ -427,17 +530,7 @@ async def admin_update_payment_settings(settings_data: PaymentSettingsUpdate, cu
     settings_dict = settings_data.dict()
     settings_dict["updatedAt"] = datetime.utcnow()
     
-    # Check if settings exist
-    existing = await payment_settings_collection.find_one({"gateway": settings_data.gateway})
-    
-    if existing:
-        await payment_settings_collection.update_one(
-            {"gateway": settings_data.gateway},
-            {"$set": settings_dict}
-        )
-    else:
-        settings_dict["id"] = str(uuid.uuid4())
-        await payment_settings_collection.insert_one(settings_dict)
+    await repos.settings.upsert_payment(settings_data.gateway, settings_dict)
     
     return {"success": True}
 
@@ -445,7 +538,7 @@ async def admin_update_payment_settings(settings_data: PaymentSettingsUpdate, cu
 
 @api_router.get("/admin/seo-settings")
 async def admin_get_seo_settings(current_admin: dict = Depends(get_current_admin)):
-    settings = await seo_settings_collection.find({}).to_list(100)
+    settings = await repos.settings.list_seo()
     return [
         {
             "id": s.get("id", str(s["_id"])),
@@ -459,12 +552,14 @@ async def admin_get_seo_settings(current_admin: dict = Depends(get_current_admin
         for s in settings
     ]
 
-@api_router.get("/seo-settings/{page}")
-async def get_seo_settings(page: str):
-    settings = await seo_settings_collection.find_one({"page": page})
+async def probe_seo_settings(page: str):
+    version = await repos.settings.seo_version(page)
+    return version_etag([version]) if version else None
+
+async def load_seo_settings(page: str, read_mostly: bool = True):
+    settings = await repos.settings.get_seo(page, read_mostly=read_mostly)
     if not settings:
-        raise HTTPException(status_code=404, detail="SEO settings not found for this page")
-    
+        return None
     return {
         "page": settings["page"],
         "title": settings["title"],
@@ -472,49 +567,107 @@ async def get_seo_settings(page: str):
         "keywords": settings.get("keywords", []),
         "canonical": settings["canonical"],
         "ogImage": settings.get("ogImage")
-    }
+    }, version_etag([settings])
+
+@api_router.get("/seo-settings/{page}")
+async def get_seo_settings(page: str, request: Request):
+    response = await conditional_json_response(
+        request, f"seo:{page}",
+        lambda: load_seo_settings(page), lambda: probe_seo_settings(page)
+    )
+    if response is None:
+        raise HTTPException(status_code=404, detail="SEO settings not found for this page")
+    
+    return response
 
 @api_router.put("/admin/seo-settings/{page}")
 async def admin_update_seo_settings(page: str, seo_data: SEOSettingsUpdate, current_admin: dict = Depends(get_current_admin)):
     seo_dict = seo_data.dict()
     seo_dict["updatedAt"] = datetime.utcnow()
     
-    # Check if settings exist
-    existing = await seo_settings_collection.find_one({"page": page})
-    
-    if existing:
-        await seo_settings_collection.update_one(
-            {"page": page},
-            {"$set": seo_dict}
-        )
-    else:
-        seo_dict["id"] = str(uuid.uuid4())
-        seo_dict["page"] = page
-        await seo_settings_collection.insert_one(seo_dict)
+    await repos.settings.upsert_seo(page, seo_dict)
+    await public_cache.refill(f"seo:{page}", lambda: load_seo_settings(page, read_mostly=False))
     
     return {"success": True, "page": page}
 
 # ==================== Admin User Management ====================
 
+ADMIN_USERS_MAX_PAGE = 1000
+
+def admin_user_row(user: dict):
+    return {
+        "id": user["id"],
+        "name": user["name"],
+        "email": user["email"],
+        "plan": user["plan"],
+        "credits": user["credits"],
+        "createdAt": user["createdAt"]
+    }
+
+def encode_user_cursor(user: dict, sort_field: Optional[str]) -> str:
+    if sort_field is None:
+        return str(user["_id"])
+    value = user[sort_field]
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value, str(user["_id"])]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_user_cursor(cursor: str, sort_field: Optional[str]):
+    """The repository's `after` key: an ObjectId, or (value, ObjectId) when
+    the listing is ordered by sort_field"""
+    try:
+        if sort_field is None:
+            return ObjectId(cursor)
+        value, _id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort_field == "createdAt":
+            value = datetime.fromisoformat(value)
+        return value, ObjectId(_id)
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @api_router.get("/admin/users")
-async def admin_get_users(current_admin: dict = Depends(get_current_admin)):
-    users = await users_collection.find({}).to_list(1000)
-    return [
-        {
-            "id": user["id"],
-            "name": user["name"],
-            "email": user["email"],
-            "plan": user["plan"],
-            "credits": user["credits"],
-            "createdAt": user["createdAt"]
-        }
-        for user in users
-    ]
+async def admin_get_users(
+    limit: int = Query(ADMIN_USERS_MAX_PAGE, ge=1, le=ADMIN_USERS_MAX_PAGE),
+    cursor: Optional[str] = None,
+    plan: Optional[str] = None,
+    createdFrom: Optional[datetime] = None,
+    createdTo: Optional[datetime] = None,
+    emailPrefix: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """List users using keyset pagination.
+
+    Users come in _id order, or by email then _id with emailPrefix, or by
+    createdAt then _id with a createdFrom/createdTo window, so each filter
+    pages along its own index. The next page's cursor is returned in the
+    X-Next-Cursor header and is only valid with the same filters. With
+    format=ndjson every matching user after the cursor is streamed, one
+    JSON object per line, in constant memory.
+    """
+    filters = {
+        "plan": plan,
+        "created_from": createdFrom,
+        "created_to": createdTo,
+        "email_prefix": emailPrefix
+    }
+    sort_field = user_sort_field(**filters)
+    filters["after"] = decode_user_cursor(cursor, sort_field) if cursor else None
+    
+    if format == "ndjson":
+        async def stream_users():
+            async for user in repos.users.iterate(batch_size=ADMIN_USERS_MAX_PAGE, **filters):
+                yield serialize_json(admin_user_row(user)) + b"\n"
+        return StreamingResponse(stream_users(), media_type="application/x-ndjson")
+    
+    page = await repos.users.list_page(limit, **filters)
+    headers = {}
+    if len(page) == limit:
+        headers["X-Next-Cursor"] = encode_user_cursor(page[-1], sort_field)
+    return fast_response([admin_user_row(user) for user in page], headers=headers)
 
 @api_router.put("/admin/users/{user_id}/credits")
 async def admin_update_user_credits(user_id: str, credit_data: CreditUpdate, current_admin: dict = Depends(get_current_admin)):
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
+    if not await repos.users.exists(user_id):
         raise HTTPException(status_code=404, detail="User not found")
     
     update_data = {}
@@ -526,26 +679,107 @@ async def admin_update_user_credits(user_id: str, credit_data: CreditUpdate, cur
         update_data["credits.exportsRemaining"] = credit_data.exportsRemaining
     
     if update_data:
-        await users_collection.update_one(
-            {"id": user_id},
-            {"$set": update_data}
-        )
+        await repos.users.set_fields(user_id, update_data)
+        invalidate_user(user_id)
     
     return {"success": True}
 
+@api_router.post("/admin/users/{user_id}/revoke-tokens")
+async def admin_revoke_user_tokens(user_id: str, current_admin: dict = Depends(get_current_admin)):
+    if not await repos.users.exists(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    await revocation_list.revoke_user(user_id)
+    return {"success": True}
+
+# ==================== Admin Cache Stats ====================
+
+@api_router.get("/admin/cache-stats")
+async def admin_get_cache_stats(current_admin: dict = Depends(get_current_admin)):
+    return {
+        "public": public_cache.stats(),
+        "search": search_cache.stats(),
+        "historyWriter": history_writer.stats(),
+        "mongoPool": pool_listener.stats(),
+        "tokenRevocation": revocation_list.stats()
+    }
+
+# ==================== Admin Profiling ====================
+
+@api_router.get("/admin/profile")
+async def admin_profile(
+    seconds: float = Query(5, gt=0, le=PROFILE_MAX_SECONDS),
+    interval: float = Query(0.005, ge=0.001, le=1),
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Sample this worker's stacks and dump its asyncio tasks"""
+    result = await profile(seconds, interval)
+    if result is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    if format == "collapsed":
+        return Response(
+            content=result["collapsed"],
+            media_type="text/plain; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="profile-{os.getpid()}.folded"'}
+        )
+    return fast_response(result)
+
+# ==================== Metrics ====================
+
+registry.gauge(
+    "cache_hit_ratio", "Hit ratio since startup",
+    lambda: {
+        ("public",): public_cache.stats()["hitRate"],
+        ("search",): search_cache.stats()["hitRate"],
+    },
+    ("cache",)
+)
+registry.gauge(
+    "cache_entries", "Entries held in memory",
+    lambda: {
+        ("public",): public_cache.stats()["entries"],
+        ("search",): search_cache.stats()["entries"],
+    },
+    ("cache",)
+)
+registry.gauge("search_in_flight", "Provider searches currently running",
+               lambda: search_cache.stats()["inFlight"])
+registry.gauge("history_writer_queue_depth", "Search history entries awaiting flush",
+               lambda: history_writer.stats()["queueDepth"])
+registry.gauge("history_writer_last_flush_seconds", "Duration of the latest history flush",
+               lambda: history_writer.stats()["lastFlushSeconds"])
+registry.gauge("token_revocation_entries", "Keys in the token revocation Bloom filter",
+               lambda: revocation_list.stats()["entries"])
+registry.gauge("password_pool_pending", "bcrypt calls running or queued",
+               lambda: password_pool_stats()["pending"])
+
+@api_router.get("/metrics", include_in_schema=False)
+async def metrics(reader: dict = Depends(get_metrics_reader)):
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return metrics_response()
+
 # ==================== Root Route ====================
 
+ROOT_BODY = serialize_json({"message": "InsightsSnap API v1.0"})
+ROOT_RESPONSE = CachedBody(ROOT_BODY, body_etag(ROOT_BODY), float("inf"))
+
 @api_router.get("/")
-async def root():
-    return {"message": "InsightsSnap API v1.0"}
+async def root(request: Request):
+    return cached_json_response(request, ROOT_RESPONSE)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+app.middleware("http")(rate_limit_middleware)
+if METRICS_ENABLED:
+    app.middleware("http")(metrics_middleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
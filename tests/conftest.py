@@ -0,0 +1,150 @@
+"""Shared pytest setup.
+
+The backend is imported from backend/ with the environment the load test
+uses. The `engine` fixture runs a test once per repository engine:
+
+    memory     the in-process repositories
+    mongomock  the Motor repositories on mongomock-motor (skipped when it is
+               not installed)
+    mongo      the Motor repositories on a real mongod, in a throwaway
+               database: TEST_MONGO_URL if set, otherwise a mongod started
+               for the session when one is on PATH, otherwise skipped
+"""
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import pytest
+
+from tests.loadtest import BACKEND_DIR
+
+os.environ.setdefault("DB_NAME", "pytest")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["CACHE_CHANGE_STREAMS"] = "false"
+os.environ["REPOSITORY_BACKEND"] = "memory"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+ENGINES = ("memory", "mongomock", "mongo")
+
+def use_motor_repositories(repos, db):
+    """Point every repository at db through the Motor implementations, so the
+    real queries and update pipelines are exercised"""
+    import repositories
+
+    repos.users = repositories.MotorUserRepository(db.users)
+    repos.plans = repositories.MotorPlanRepository(db.pricing_plans, db.pricing_plans)
+    repos.history = repositories.MotorHistoryRepository(db.search_history, db.search_history, db.search_results)
+    repos.settings = repositories.MotorSettingsRepository(db.seo_settings, db.seo_settings, db.payment_settings)
+    repos.admins = repositories.MotorAdminRepository(db.admins)
+    repos.revocations = repositories.MotorRevocationRepository(db.revoked_tokens)
+    repos.backend = "mongo"
+
+def declared_indexes():
+    """(collection name, IndexModels) pairs from ensure_indexes' declarations"""
+    from database import _index_declarations
+    return [(collection.name, models) for collection, models in _index_declarations().items()]
+
+def mongomock_database():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    for name, models in declared_indexes():
+        asyncio.run(db[name].create_indexes(models))
+    return db, lambda: None
+
+@pytest.fixture(scope="session")
+def mongo_url(tmp_path_factory):
+    """TEST_MONGO_URL, or a throwaway mongod on a free port for this session"""
+    if TEST_MONGO_URL:
+        yield TEST_MONGO_URL
+        return
+    mongod = shutil.which("mongod")
+    if not mongod:
+        pytest.skip("neither TEST_MONGO_URL nor a mongod binary is available")
+    from pymongo import MongoClient
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [mongod, "--dbpath", str(tmp_path_factory.mktemp("mongod")), "--port", str(port),
+         "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"mongodb://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                MongoClient(url, serverSelectionTimeoutMS=500).admin.command("ping")
+                break
+            except Exception:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    pytest.skip("the local mongod did not start")
+                time.sleep(0.2)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def mongo_database(url: str):
+    """A throwaway database on the mongod at url.
+
+    Motor binds a client to the event loop it is first used on, and each test
+    runs its own loop, so indexes are built and the database dropped with a
+    synchronous pymongo client instead.
+    """
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import MongoClient
+
+    name = f"pytest_{uuid.uuid4().hex[:12]}"
+    sync_client = MongoClient(url, serverSelectionTimeoutMS=2000)
+    for collection, models in declared_indexes():
+        sync_client[name][collection].create_indexes(models)
+
+    def drop():
+        sync_client.drop_database(name)
+        sync_client.close()
+
+    return AsyncIOMotorClient(url)[name], drop
+
+def skip_exhaustion_on_mongomock(engine: str):
+    """For tests that spend a credit balance below the amount asked for.
+
+    mongomock re-runs the filter against find_one_and_update's result, so an
+    update that leaves too few credits for another spend comes back as None,
+    unlike on mongod.
+    """
+    if engine == "mongomock":
+        pytest.skip("mongomock loses find_one_and_update results that no longer match the filter")
+
+@pytest.fixture(params=ENGINES)
+def engine(request):
+    """Name of the engine behind `repos` for this test; state starts empty"""
+    from ledger import invalidate_plan_limits
+    from principals import clear_user_cache
+    from repositories import repos
+
+    cleanup = lambda: None
+    if request.param == "memory":
+        repos.use_backend("memory")
+    else:
+        if request.param == "mongomock":
+            db, cleanup = mongomock_database()
+        else:
+            db, cleanup = mongo_database(request.getfixturevalue("mongo_url"))
+        use_motor_repositories(repos, db)
+    invalidate_plan_limits()
+    clear_user_cache()
+    try:
+        yield request.param
+    finally:
+        repos.use_backend("memory")
+        cleanup()
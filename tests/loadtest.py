@@ -0,0 +1,616 @@
+"""In-process load test for the backend.
+
+Drives server.app through httpx's ASGI transport against a local mongod (the
+default, MONGO_URL), an in-memory mongomock stand-in (--mongomock) or the
+in-process repositories (--backend memory), and reports throughput plus
+p50/p95/p99 latency per operation.
+
+Scenarios:
+    mix            realistic traffic: pricing page, /auth/me, search, export, login
+    login-burst    searches while login workers saturate the bcrypt pool
+    public         pricing/SEO/root, cold versus If-None-Match revalidation,
+                   with bytes on the wire
+    serialization  per-endpoint encoding cost, FastAPI's jsonable_encoder path
+                   versus responses.dumps
+    ranking        build_search_result over --candidates synthetic posts, for
+                   each plan's resultsPerCategory
+    history        /insights/history keyset paging over --history-rows entries
+                   of one user: first pages, pages deep in the history, and a
+                   walk through every page
+
+Results can be saved as a baseline and later runs compared against it:
+
+    python -m tests.loadtest --mongomock --save-baseline
+    python -m tests.loadtest --mongomock            # exits 1 on a regression
+
+Providers are replaced with synthetic ones (see --provider-latency) so runs
+never touch the network, and rate limiting is disabled unless
+--rate-limit is passed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "loadtest_baseline.json"
+
+SCENARIOS = ("mix", "login-burst", "public", "serialization", "ranking", "history")
+
+# Relative weights of each operation in the mixed workload
+MIX_WEIGHTS = {"pricing": 30, "me": 25, "search": 20, "seo": 10, "export": 10, "login": 5}
+
+QUERY_WORDS = [
+    "python", "fitness", "budget", "travel", "marketing", "crm", "notion", "coffee",
+    "podcast", "startup", "resume", "garden", "saas", "freelance", "camera", "keto"
+]
+POST_TEMPLATES = [
+    "How do I get better at {q}?",
+    "I hate how expensive {q} has become",
+    "Struggling with {q} for months, any advice",
+    "Top 10 {q} tools everyone is using this year",
+    "Why is {q} so confusing for beginners",
+    "Just launched a new {q} guide",
+    "Trending: {q} tips that actually work",
+]
+
+# ==================== Environment ====================
+
+def configure_environment(args):
+    """Set env vars the backend reads at import time; must run before import"""
+    os.environ.setdefault("DB_NAME", f"loadtest_{os.getpid()}")
+    os.environ["RATE_LIMIT_ENABLED"] = "true" if args.rate_limit else "false"
+    os.environ.setdefault("CACHE_CHANGE_STREAMS", "false")
+    os.environ["REPOSITORY_BACKEND"] = args.backend
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+def use_mongomock():
+    """Point every collection in database.py at an in-memory mongomock client.
+
+    Must run before server (or anything importing collections) is imported.
+    """
+    try:
+        import mongomock_motor
+    except ImportError:
+        sys.exit("--mongomock needs the mongomock-motor package")
+    import database
+
+    client = mongomock_motor.AsyncMongoMockClient()
+    database.client = client
+    database.db = client[os.environ["DB_NAME"]]
+    for attr, value in list(vars(database).items()):
+        if attr.endswith("_collection") and not callable(value):
+            setattr(database, attr, database.instrument_collection(database.db[value.name]))
+
+def install_synthetic_providers(latency: float):
+    """Replace provider HTTP calls with generated posts after a fixed delay"""
+    import providers
+
+    def synthetic_fetch(platform):
+        async def fetch(client, query, limit):
+            await asyncio.sleep(latency)
+            rng = random.Random(f"{platform}:{query}")
+            now = time.time()
+            return [
+                providers._candidate(
+                    platform, f"{query}-{i}", rng.choice(POST_TEMPLATES).format(q=query),
+                    f"{platform.lower()}-source-{rng.randint(1, 20)}",
+                    rng.randint(0, 5000), now - rng.randint(0, 30 * 86400)
+                )
+                for i in range(limit)
+            ]
+        return fetch
+
+    for provider in providers.provider_registry:
+        provider.fetch = synthetic_fetch(provider.platform)
+        provider.enabled = lambda: True
+
+# ==================== Stats ====================
+
+class OperationStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+
+    def record(self, seconds: float, ok: bool, size: int = 0):
+        self.latencies.append(seconds)
+        self.bytes += size
+        if not ok:
+            self.errors += 1
+
+def percentile(sorted_values, fraction: float):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize(stats: dict, elapsed: float = None):
+    """Collapse raw samples into {op: {count, errors, rps, p50, p95, p99, bytes}}.
+
+    Without elapsed, throughput is per operation: samples over the time spent
+    in that operation alone, as for sequential microbenchmarks.
+    """
+    summary = {}
+    for name, op in sorted(stats.items()):
+        latencies = sorted(op.latencies)
+        count = len(latencies)
+        window = elapsed if elapsed is not None else sum(latencies)
+        summary[name] = {
+            "count": count,
+            "errors": op.errors,
+            "rps": round(count / window, 2) if window else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "bytesPerRequest": round(op.bytes / count) if count else 0,
+        }
+    return summary
+
+def wire_size(response) -> int:
+    """Approximate bytes on the wire: status line, headers and body"""
+    headers = sum(len(k) + len(v) + 4 for k, v in response.headers.raw)
+    return len(f"HTTP/1.1 {response.status_code}\r\n") + headers + 2 + len(response.content)
+
+# ==================== Virtual users ====================
+
+class VirtualUser:
+    """One registered account with its own token and search history"""
+
+    def __init__(self, email: str, password: str):
+        self.email = email
+        self.password = password
+        self.token = None
+        self.search_ids = []
+        self.pricing_etag = None
+        self.rng = random.Random(email)
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def query(self) -> str:
+        return " ".join(self.rng.sample(QUERY_WORDS, 2))
+
+async def create_users(client, count: int):
+    users = []
+    for i in range(count):
+        user = VirtualUser(f"loadtest-{uuid.uuid4().hex[:8]}-{i}@example.com", "loadtest-password")
+        response = await client.post(
+            "/api/auth/register",
+            json={"name": f"Load Test {i}", "email": user.email, "password": user.password}
+        )
+        response.raise_for_status()
+        user.token = response.json()["token"]
+        users.append(user)
+    await grant_unlimited_credits(users)
+    return users
+
+async def grant_unlimited_credits(users):
+    """Move load-test accounts onto an inactive unlimited plan so credit
+    limits never turn the workload into a stream of 403s"""
+    from datetime import datetime
+    from ledger import UNLIMITED, invalidate_plan_limits
+    from principals import clear_user_cache
+    from repositories import repos
+
+    now = datetime.utcnow()
+    plan_name = f"Load Test {uuid.uuid4().hex[:8]}"
+    await repos.plans.create({
+        "id": str(uuid.uuid4()), "name": plan_name, "description": "", "price": 0,
+        "billing": "month", "features": [], "searchesPerDay": UNLIMITED,
+        "aiGenerations": UNLIMITED, "exportsPerMonth": UNLIMITED, "resultsPerCategory": 9,
+        "isPopular": False, "isActive": False, "createdAt": now, "updatedAt": now
+    })
+    for user in users:
+        account = await repos.users.get_by_email(user.email)
+        await repos.users.set_fields(account["id"], {
+            "plan": plan_name,
+            "credits.searchesRemaining": UNLIMITED,
+            "credits.exportsRemaining": UNLIMITED,
+            "credits.aiGenerationsRemaining": UNLIMITED,
+            "credits.lastResetDate": now
+        })
+    invalidate_plan_limits()
+    clear_user_cache()
+
+# ==================== Operations ====================
+
+async def op_login(client, user):
+    response = await client.post("/api/auth/login", json={"email": user.email, "password": user.password})
+    if response.status_code == 200:
+        user.token = response.json()["token"]
+    return response
+
+async def op_me(client, user):
+    return await client.get("/api/auth/me", headers=user.headers)
+
+async def op_search(client, user):
+    response = await client.post("/api/insights/search", json={"query": user.query()}, headers=user.headers)
+    if response.status_code == 200:
+        search_id = response.json().get("searchId")
+        if search_id:
+            user.search_ids.append(search_id)
+            del user.search_ids[:-20]
+    return response
+
+async def op_export(client, user):
+    if not user.search_ids:
+        return await op_search(client, user)
+    response = await client.post(
+        "/api/insights/export",
+        json={"searchId": user.rng.choice(user.search_ids), "format": "csv"},
+        headers=user.headers
+    )
+    if response.status_code != 200:
+        return response
+    return await client.get(response.json()["downloadUrl"], headers=user.headers)
+
+async def op_pricing(client, user):
+    headers = {"If-None-Match": user.pricing_etag} if user.pricing_etag and user.rng.random() < 0.5 else {}
+    response = await client.get("/api/pricing/plans", headers=headers)
+    user.pricing_etag = response.headers.get("etag", user.pricing_etag)
+    return response
+
+async def op_seo(client, user):
+    return await client.get("/api/seo-settings/home")
+
+OPERATIONS = {
+    "login": op_login,
+    "me": op_me,
+    "search": op_search,
+    "export": op_export,
+    "pricing": op_pricing,
+    "seo": op_seo,
+}
+
+async def run_workers(client, groups, duration: float):
+    """Run worker groups concurrently for duration seconds.
+
+    groups is a list of (worker count, {operation: weight}, users).
+    """
+    stats = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(weights, users, seed):
+        rng = random.Random(seed)
+        names = list(weights)
+        cumulative = list(weights.values())
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, cumulative)[0]
+            user = rng.choice(users)
+            started = time.perf_counter()
+            try:
+                response = await OPERATIONS[name](client, user)
+                ok = response.status_code < 400
+                size = wire_size(response)
+            except Exception:
+                ok, size = False, 0
+            stats.setdefault(name, OperationStats()).record(time.perf_counter() - started, ok, size)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        worker(weights, users, f"{index}:{n}")
+        for index, (count, weights, users) in enumerate(groups)
+        for n in range(count)
+    ))
+    return summarize(stats, time.perf_counter() - started)
+
+# ==================== Scenarios ====================
+
+async def scenario_mix(client, args):
+    users = await create_users(client, args.users)
+    return await run_workers(client, [(args.concurrency, MIX_WEIGHTS, users)], args.duration)
+
+async def scenario_login_burst(client, args):
+    """Search latency while a burst of logins keeps every bcrypt worker busy"""
+    users = await create_users(client, args.users)
+    result = await run_workers(client, [
+        (args.concurrency, {"search": 1}, users),
+        (args.login_workers, {"login": 1}, users),
+    ], args.duration)
+    from auth import password_pool_stats
+    result["passwordPool"] = password_pool_stats()
+    return result
+
+async def scenario_public(client, args):
+    """Marketing pages fetched cold versus revalidated with If-None-Match"""
+    stats = {}
+    etags = {}
+    paths = {"pricing": "/api/pricing/plans", "seo": "/api/seo-settings/home", "root": "/api/"}
+    for name, path in paths.items():
+        etags[name] = (await client.get(path)).headers.get("etag")
+
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            name = rng.choice(list(paths))
+            revalidate = rng.random() < 0.5 and etags[name]
+            headers = {"If-None-Match": etags[name]} if revalidate else {}
+            started = time.perf_counter()
+            response = await client.get(paths[name], headers=headers)
+            label = f"{name}-304" if revalidate else name
+            stats.setdefault(label, OperationStats()).record(
+                time.perf_counter() - started, response.status_code in (200, 304), wire_size(response)
+            )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+    return summarize(stats, time.perf_counter() - started)
+
+async def scenario_serialization(client, args):
+    """Encode representative payloads through FastAPI's default path and
+    through responses.dumps, timing each call"""
+    import json as stdlib_json
+    from datetime import datetime
+    from fastapi.encoders import jsonable_encoder
+    from repositories import repos
+    from models import UserResponse, AuthResponse
+    from providers import build_search_result, fetch_candidates
+    from responses import dumps
+
+    by_platform, failed = await fetch_candidates("python budget", 9)
+    user = UserResponse(
+        id=str(uuid.uuid4()), name="Load Test", email="loadtest@example.com", role="user",
+        plan="Standard", credits={"searchesRemaining": 50, "exportsRemaining": 30,
+                                  "lastResetDate": datetime.utcnow()},
+    )
+    payloads = {
+        "search": build_search_result("python budget", by_platform, 9, failed),
+        "auth": AuthResponse(token="x" * 180, user=user),
+        "pricing": [
+            {k: v for k, v in plan.items() if k != "_id"}
+            for plan in await repos.plans.list(active_only=True)
+        ],
+    }
+
+    def fastapi_path(payload):
+        return stdlib_json.dumps(
+            jsonable_encoder(payload), ensure_ascii=False, allow_nan=False,
+            indent=None, separators=(",", ":")
+        ).encode("utf-8")
+
+    stats = {}
+    for name, payload in payloads.items():
+        for label, encode in (("fastapi", fastapi_path), ("fast", dumps)):
+            op = stats.setdefault(f"{name}:{label}", OperationStats())
+            for _ in range(args.iterations):
+                began = time.perf_counter()
+                body = encode(payload)
+                op.record(time.perf_counter() - began, True, len(body))
+    return summarize(stats)
+
+async def scenario_ranking(client, args):
+    """Rank --candidates posts spread over every platform, timing each
+    build_search_result call"""
+    import providers
+
+    rng = random.Random("ranking")
+    now = time.time()
+    platforms = [provider.platform for provider in providers.provider_registry]
+    by_platform = {platform: [] for platform in platforms}
+    for i in range(args.candidates):
+        platform = platforms[i % len(platforms)]
+        query = rng.choice(QUERY_WORDS)
+        by_platform[platform].append(providers._candidate(
+            platform, f"{query}-{i}", rng.choice(POST_TEMPLATES).format(q=query),
+            f"{platform.lower()}-source-{rng.randint(1, 200)}",
+            int(rng.paretovariate(1.2) * 10), now - rng.randint(0, 30 * 86400)
+        ))
+
+    stats = {}
+    for results_per_category in (3, 9, 15):
+        op = stats.setdefault(f"{args.candidates}x{results_per_category}", OperationStats())
+        for _ in range(args.ranking_iterations):
+            began = time.perf_counter()
+            result = providers.build_search_result("ranking", by_platform, results_per_category)
+            op.record(time.perf_counter() - began, len(result.painPoints) <= results_per_category)
+    return summarize(stats)
+
+async def seed_history(user_id: str, rows: int, batch: int = 5000):
+    """Insert rows search_history entries for user_id, one second apart and
+    newest first; returns their (timestamp, id) keys"""
+    from datetime import datetime, timedelta
+    from repositories import repos
+
+    newest = datetime.utcnow().replace(microsecond=0)
+    keys = [(newest - timedelta(seconds=i), f"loadtest-{i:07d}") for i in range(rows)]
+    for start in range(0, rows, batch):
+        await repos.history.insert_many([
+            {"id": search_id, "userId": user_id, "query": QUERY_WORDS[i % len(QUERY_WORDS)], "timestamp": timestamp}
+            for i, (timestamp, search_id) in enumerate(keys[start:start + batch], start)
+        ])
+    return keys
+
+async def scenario_history(client, args):
+    """Keyset pagination cost against a --history-rows history: the first
+    page, pages starting anywhere in the history, and a full walk at the
+    largest page size. A page deep in the history should cost the same as
+    the first one."""
+    from repositories import repos
+    from server import HISTORY_PAGE_MAX, encode_history_cursor
+
+    (user,) = await create_users(client, 1)
+    account = await repos.users.get_by_email(user.email)
+    keys = await seed_history(account["id"], args.history_rows)
+
+    stats = {}
+
+    async def fetch_page(label, limit, cursor=None):
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        started = time.perf_counter()
+        response = await client.get("/api/insights/history", params=params, headers=user.headers)
+        stats.setdefault(label, OperationStats()).record(
+            time.perf_counter() - started, response.status_code == 200, wire_size(response)
+        )
+        return response
+
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            if rng.random() < 0.5:
+                await fetch_page("first-page", 20)
+            else:
+                timestamp, search_id = keys[rng.randrange(len(keys))]
+                await fetch_page("deep-page", 20, encode_history_cursor({"timestamp": timestamp, "id": search_id}))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+    result = summarize(stats, time.perf_counter() - started)
+
+    stats.clear()
+    cursor, seen = None, 0
+    while True:
+        page = (await fetch_page(f"walk-{HISTORY_PAGE_MAX}", HISTORY_PAGE_MAX, cursor)).json()
+        seen += len(page["items"])
+        cursor = page["nextCursor"]
+        if not cursor:
+            break
+    result.update(summarize(stats))
+    result["walk"] = f"{seen} of {len(keys)} entries"
+    return result
+
+SCENARIO_RUNNERS = {
+    "mix": scenario_mix,
+    "login-burst": scenario_login_burst,
+    "public": scenario_public,
+    "serialization": scenario_serialization,
+    "ranking": scenario_ranking,
+    "history": scenario_history,
+}
+
+# ==================== Baselines ====================
+
+def compare(results: dict, baseline: dict, tolerance: float, min_count: int):
+    """Return human-readable regressions of results against baseline.
+
+    An operation regresses when its p95 grows or its throughput drops by more
+    than tolerance. Operations with too few samples are skipped as noise.
+    """
+    regressions = []
+    for scenario, ops in results.items():
+        for name, current in ops.items():
+            previous = baseline.get(scenario, {}).get(name)
+            if not isinstance(current, dict) or not previous or "p95" not in current:
+                continue
+            if current["count"] < min_count or previous["count"] < min_count:
+                continue
+            if current["p95"] > previous["p95"] * (1 + tolerance):
+                regressions.append(
+                    f"{scenario}/{name}: p95 {previous['p95']}ms -> {current['p95']}ms"
+                )
+            if current["rps"] < previous["rps"] * (1 - tolerance):
+                regressions.append(
+                    f"{scenario}/{name}: throughput {previous['rps']}/s -> {current['rps']}/s"
+                )
+    return regressions
+
+def print_results(results: dict):
+    for scenario, ops in results.items():
+        print(f"\n== {scenario} ==")
+        print(f"{'operation':<18}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'bytes':>9}")
+        for name, op in ops.items():
+            if not isinstance(op, dict) or "p95" not in op:
+                print(f"{name}: {op}")
+                continue
+            print(
+                f"{name:<18}{op['count']:>8}{op['errors']:>8}{op['rps']:>10}"
+                f"{op['p50']:>10}{op['p95']:>10}{op['p99']:>10}{op['bytesPerRequest']:>9}"
+            )
+
+# ==================== Entry point ====================
+
+async def run(args):
+    import httpx
+    import server
+
+    results = {}
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            for scenario in args.scenario:
+                results[scenario] = await SCENARIO_RUNNERS[scenario](client, args)
+        if args.backend == "mongo" and not args.mongomock and args.drop_database:
+            import database
+            await database.client.drop_database(os.environ["DB_NAME"])
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="scenario to run; repeatable (default: all)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent virtual clients")
+    parser.add_argument("--users", type=int, default=10, help="accounts to register")
+    parser.add_argument("--login-workers", type=int, default=16,
+                        help="login workers in the login-burst scenario")
+    parser.add_argument("--iterations", type=int, default=2000,
+                        help="encodings per payload in the serialization scenario")
+    parser.add_argument("--candidates", type=int, default=10000,
+                        help="posts to rank in the ranking scenario")
+    parser.add_argument("--ranking-iterations", type=int, default=100,
+                        help="rankings per plan size in the ranking scenario")
+    parser.add_argument("--history-rows", type=int, default=100000,
+                        help="search history entries to page through in the history scenario")
+    parser.add_argument("--provider-latency", type=float, default=0.05,
+                        help="simulated provider response time in seconds")
+    parser.add_argument("--backend", choices=("mongo", "memory"), default="mongo",
+                        help="repository backend; memory runs the API without a database")
+    parser.add_argument("--mongomock", action="store_true",
+                        help="use an in-memory mongomock database instead of MONGO_URL")
+    parser.add_argument("--keep-database", dest="drop_database", action="store_false",
+                        help="keep the load-test database on mongod afterwards")
+    parser.add_argument("--rate-limit", action="store_true", help="leave rate limiting enabled")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative p95/throughput change before failing")
+    parser.add_argument("--min-count", type=int, default=50,
+                        help="ignore operations with fewer samples when comparing")
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    args = parser.parse_args(argv)
+    args.scenario = args.scenario or list(SCENARIOS)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    if args.mongomock:
+        use_mongomock()
+    install_synthetic_providers(args.provider_latency)
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True))
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance, args.min_count)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""Database benchmarks that need a real mongod (MONGO_URL).
+
+Each run works in a throwaway database (dropped afterwards unless
+--keep-database) and fills it with synthetic data first.
+
+Benchmarks:
+    indexes   hot-path user lookups (login by email, auth by id, admin
+              listing by plan) on --users synthetic users, before and after
+              ensure_indexes, with latency and documents examined
+    storage   search_history size with results stored inline versus in the
+              content-addressed result store, on --rows history entries that
+              share --distinct result payloads, converted by the real migration
+
+    python -m tests.mongo_benchmark indexes --users 1000000
+    python -m tests.mongo_benchmark storage --rows 10000000 --distinct 200000
+    python -m tests.mongo_benchmark indexes --users 20000 --mongomock   # smoke run
+
+--mongomock swaps in an in-memory database; it checks the harness runs, but
+its timings say nothing about mongod and it cannot explain queries.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from tests.loadtest import BACKEND_DIR, OperationStats, summarize, use_mongomock
+
+BATCH_SIZE = 10000
+PLANS = ("Free", "Standard", "Pro")
+POST_WORDS = (
+    "how", "do", "i", "get", "better", "at", "budget", "tools", "struggling", "with", "months",
+    "advice", "why", "is", "so", "confusing", "beginners", "new", "guide", "tips", "actually", "work"
+)
+
+def configure_environment(args):
+    """Point database.py at a throwaway database; must run before import"""
+    os.environ["DB_NAME"] = args.db_name or f"benchmark_{os.getpid()}"
+    os.environ["REPOSITORY_BACKEND"] = "mongo"
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+async def insert_batches(collection, make_doc, count: int, label: str):
+    started = time.perf_counter()
+    for offset in range(0, count, BATCH_SIZE):
+        await collection.insert_many(
+            [make_doc(i) for i in range(offset, min(offset + BATCH_SIZE, count))], ordered=False
+        )
+        print(f"\r{label}: {min(offset + BATCH_SIZE, count):,}/{count:,}", end="", flush=True)
+    print(f" in {time.perf_counter() - started:.1f}s")
+
+async def docs_examined(collection, query: dict):
+    """totalDocsExamined from explain, or None where explain is unsupported"""
+    try:
+        plan = await collection.find(query).limit(1).explain()
+    except Exception:
+        return None
+    return plan.get("executionStats", {}).get("totalDocsExamined")
+
+# ==================== indexes ====================
+
+def synthetic_user(i: int, now: datetime):
+    return {
+        "id": str(uuid.UUID(int=i)),
+        "name": f"User {i}",
+        "email": f"user{i}@example.com",
+        "password": "x" * 60,
+        "role": "user",
+        "plan": PLANS[i % len(PLANS)],
+        "credits": {"searchesRemaining": 5, "exportsRemaining": 3},
+        "createdAt": now - timedelta(seconds=i),
+    }
+
+async def time_lookups(collection, queries, label: str, stats: dict):
+    """Run each query as the API does: one document, or a 50-row page in _id order"""
+    op = stats.setdefault(label, OperationStats())
+    for query in queries:
+        began = time.perf_counter()
+        if label == "plan-page":
+            found = await collection.find(query, {"_id": 1}).sort("_id", 1).limit(50).to_list(50)
+        else:
+            found = await collection.find_one(query, {"_id": 1})
+        op.record(time.perf_counter() - began, bool(found))
+
+async def bench_indexes(args):
+    import database
+
+    users = database.users_collection
+    now = datetime.utcnow()
+    await insert_batches(users, lambda i: synthetic_user(i, now), args.users, "users")
+
+    rng = random.Random(0)
+    sample = [rng.randrange(args.users) for _ in range(args.lookups)]
+    lookups = {
+        "email": [{"email": f"user{i}@example.com"} for i in sample],
+        "id": [{"id": str(uuid.UUID(int=i))} for i in sample],
+        "plan-page": [{"plan": PLANS[i % len(PLANS)]} for i in sample],
+    }
+
+    results = {}
+    for phase in ("unindexed", "indexed"):
+        if phase == "indexed":
+            started = time.perf_counter()
+            await database.ensure_indexes()
+            print(f"ensure_indexes: {time.perf_counter() - started:.1f}s")
+        stats = {}
+        for name, queries in lookups.items():
+            # Without indexes a lookup scans the collection; a few samples are enough
+            await time_lookups(users, queries if phase == "indexed" else queries[:args.scan_lookups], name, stats)
+        results[phase] = summarize(stats)
+        for name, queries in lookups.items():
+            results[phase][name]["docsExamined"] = await docs_examined(users, queries[0])
+    return results
+
+# ==================== storage ====================
+
+def synthetic_results(rng: random.Random, per_category: int = 9):
+    def item(kind, n):
+        return {
+            "id": f"{kind}:{rng.getrandbits(48):x}",
+            "platform": rng.choice(("Reddit", "X", "YouTube")),
+            "content": " ".join(rng.choice(POST_WORDS) for _ in range(rng.randint(12, 30))),
+            "engagement": rng.randint(0, 5000) if kind == "pain" else None,
+            "trendScore": rng.randint(0, 100) if kind == "trend" else None,
+            "source": f"source-{rng.randint(1, 500)}",
+        }
+    return {
+        "painPoints": [item("pain", n) for n in range(per_category)],
+        "trendingIdeas": [item("trend", n) for n in range(per_category)],
+        "contentIdeas": [
+            {"id": f"idea:{n}", "title": "Your take on " + item("idea", n)["content"][:80],
+             "description": "A topic gaining traction", "platforms": ["Reddit"]}
+            for n in range(per_category)
+        ],
+    }
+
+async def collection_size(db, name: str):
+    """(data bytes, storage bytes) from collStats; storage is None where only
+    the BSON size of the documents can be summed (mongomock)"""
+    try:
+        stats = await db.command("collStats", name)
+        return stats["size"], stats["storageSize"]
+    except Exception:
+        import bson
+        return sum([len(bson.encode(doc)) async for doc in db[name].find()]), None
+
+async def bench_storage(args):
+    import database
+
+    rng = random.Random(0)
+    payloads = [synthetic_results(rng) for _ in range(min(args.distinct, args.rows))]
+    # Popular searches repeat far more often than the long tail
+    weights = [1 / (rank + 1) for rank in range(len(payloads))]
+    picks = rng.choices(range(len(payloads)), weights, k=args.rows)
+    now = datetime.utcnow()
+
+    def history_entry(i: int):
+        return {
+            "id": str(uuid.UUID(int=i)),
+            "userId": f"user-{i % 50000}",
+            "query": "synthetic query",
+            "results": payloads[picks[i]],
+            "timestamp": now - timedelta(seconds=i),
+        }
+
+    await insert_batches(database.search_history_collection, history_entry, args.rows, "history")
+    inline_size, inline_storage = await collection_size(database.db, "search_history")
+
+    started = time.perf_counter()
+    await database._dedupe_search_history()
+    migration_seconds = time.perf_counter() - started
+    history_size, history_storage = await collection_size(database.db, "search_history")
+    results_size, results_storage = await collection_size(database.db, "search_results")
+
+    def saved(before, *after):
+        if before is None or None in after:
+            return None
+        return f"{100 * (1 - sum(after) / before):.1f}%"
+
+    return {"storage": {
+        "rows": args.rows,
+        "distinctPayloads": len(set(picks)),
+        "migrationSeconds": round(migration_seconds, 1),
+        "inlineBytes": inline_size,
+        "inlineStorageBytes": inline_storage,
+        "historyBytes": history_size,
+        "historyStorageBytes": history_storage,
+        "resultStoreBytes": results_size,
+        "resultStoreStorageBytes": results_storage,
+        "bytesSaved": saved(inline_size, history_size, results_size),
+        "storageSaved": saved(inline_storage, history_storage, results_storage),
+    }}
+
+# ==================== Entry point ====================
+
+BENCHMARKS = {"indexes": bench_indexes, "storage": bench_storage}
+
+def print_results(results: dict):
+    for phase, ops in results.items():
+        if phase == "storage":
+            print("\n== storage ==")
+            for name, value in ops.items():
+                print(f"{name:<26}{value if value is not None else '-':>16}")
+            continue
+        print(f"\n== {phase} ==")
+        print(f"{'lookup':<18}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'examined':>12}")
+        for name, op in ops.items():
+            if not isinstance(op, dict) or "p95" not in op:
+                print(f"{name}: {op}")
+                continue
+            examined = op.get("docsExamined")
+            print(f"{name:<18}{op['count']:>8}{op['p50']:>10}{op['p95']:>10}{examined if examined is not None else '-':>12}")
+
+async def run(args):
+    import database
+
+    try:
+        return await BENCHMARKS[args.benchmark](args)
+    finally:
+        if args.drop_database:
+            await database.client.drop_database(os.environ["DB_NAME"])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--users", type=int, default=1000000, help="synthetic users for `indexes`")
+    parser.add_argument("--rows", type=int, default=10000000, help="history entries for `storage`")
+    parser.add_argument("--distinct", type=int, default=200000,
+                        help="distinct result payloads among the history entries")
+    parser.add_argument("--lookups", type=int, default=1000, help="indexed lookups per query shape")
+    parser.add_argument("--scan-lookups", type=int, default=20,
+                        help="lookups per query shape before indexes exist")
+    parser.add_argument("--db-name", help="database to use (default: benchmark_<pid>)")
+    parser.add_argument("--mongomock", action="store_true",
+                        help="use an in-memory mongomock database instead of MONGO_URL")
+    parser.add_argument("--keep-database", dest="drop_database", action="store_false",
+                        help="keep the benchmark database afterwards")
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    if args.mongomock:
+        use_mongomock()
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Worker startup benchmark based on `python -X importtime`.
+
+Imports backend/server.py in fresh interpreters, reports the median import
+time with the slowest modules, and fails when:
+
+- the median exceeds the budget (--budget-ms, or STARTUP_BUDGET_MS), or
+- a module that should be imported lazily (see DEFERRED_MODULES) shows up
+  at import time.
+
+    python -m tests.startup_benchmark
+    python -m tests.startup_benchmark --runs 10 --budget-ms 800 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+DEFAULT_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 1000))
+
+# Heavy dependencies that only specific requests need; auth.py and providers.py
+# import them on first use and preload them after startup
+DEFERRED_MODULES = ("passlib", "jose", "bcrypt", "ecdsa", "rsa", "numpy")
+
+def parse_importtime(stderr: str):
+    """Return [(module, self µs, cumulative µs, depth)] from importtime output.
+
+    Lines look like "import time:   634 |   52679 |     pymongo.uri_parser",
+    with two spaces of indentation per nesting level.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def measure_once(module: str):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, env=os.environ.copy()
+    )
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+def summarize(runs, module: str, top: int):
+    totals = []
+    cumulative = {}
+    for rows in runs:
+        for name, _, total_us, _ in rows:
+            if name == module:
+                totals.append(total_us / 1000)
+            cumulative.setdefault(name, []).append(total_us / 1000)
+    imported = set(cumulative)
+    slowest = sorted(
+        ((name, statistics.median(values)) for name, values in cumulative.items() if name != module),
+        key=lambda item: item[1], reverse=True
+    )[:top]
+    return {
+        "module": module,
+        "runs": len(runs),
+        "medianMs": round(statistics.median(totals), 1),
+        "minMs": round(min(totals), 1),
+        "maxMs": round(max(totals), 1),
+        "slowest": [{"module": name, "cumulativeMs": round(ms, 1)} for name, ms in slowest],
+        "eagerDeferred": sorted(
+            name for name in imported
+            if name.split(".")[0] in DEFERRED_MODULES
+        ),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="server", help="module to import")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--json", type=Path, help="also write the summary to this file")
+    args = parser.parse_args(argv)
+
+    # One untimed run so bytecode compilation is not counted
+    measure_once(args.module)
+    summary = summarize([measure_once(args.module) for _ in range(args.runs)], args.module, args.top)
+
+    print(f"import {args.module}: median {summary['medianMs']}ms "
+          f"(min {summary['minMs']}, max {summary['maxMs']}, {summary['runs']} runs)")
+    print(f"\n{'module':<48}{'cumulative ms':>14}")
+    for row in summary["slowest"]:
+        print(f"{row['module']:<48}{row['cumulativeMs']:>14}")
+    if args.json:
+        args.json.write_text(json.dumps(summary, indent=2))
+
+    failures = []
+    if summary["medianMs"] > args.budget_ms:
+        failures.append(f"median {summary['medianMs']}ms exceeds the {args.budget_ms}ms budget")
+    if summary["eagerDeferred"]:
+        failures.append("imported at startup but should be deferred: " + ", ".join(summary["eagerDeferred"]))
+    if failures:
+        print("\nStartup regressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"\nWithin the {args.budget_ms}ms budget")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
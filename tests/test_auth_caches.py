@@ -0,0 +1,106 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+@pytest.fixture
+def token_cache(monkeypatch):
+    """The JWT cache, emptied, plus a count of real signature checks"""
+    import auth
+    from jose import jwt
+
+    auth.clear_token_cache()
+    decodes = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decodes.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(jwt, "decode", counting_decode)
+    yield decodes
+    auth.clear_token_cache()
+
+def test_repeat_tokens_skip_the_signature_check(token_cache):
+    from auth import create_access_token, decode_token
+
+    token = create_access_token({"sub": "user-1", "role": "user"})
+    first, second = decode_token(token), decode_token(token)
+    assert first == second
+    assert token_cache == [token]
+
+def test_cached_tokens_never_outlive_their_exp(token_cache, monkeypatch):
+    import auth
+    from auth import create_access_token, decode_token
+
+    token = create_access_token({"sub": "user-1", "role": "user"}, expires_delta=timedelta(seconds=30))
+    payload = decode_token(token)
+    _, cached_until = auth._token_cache[token]
+    assert cached_until <= payload["exp"] < time.time() + auth.TOKEN_CACHE_TTL
+
+    # Past exp the cached payload is dropped and the token decoded again
+    monkeypatch.setattr(auth.time, "time", lambda: payload["exp"] + 1)
+    decode_token(token)
+    assert token_cache == [token, token]
+
+# ==================== user cache ====================
+
+def me_after(*requests, token: str):
+    """Send requests (method, path, json, token), then return GET /auth/me"""
+    import httpx
+    import server
+
+    async def send():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for method, path, body, as_token in requests:
+                response = await client.request(method, path, json=body, headers={"Authorization": f"Bearer {as_token}"})
+                assert response.status_code == 200, response.text
+            return (await client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"})).json()
+
+    return asyncio.run(send())
+
+@pytest.fixture
+def account(engine):
+    """A Free user, with their token, whose document is already cached"""
+    from auth import create_access_token
+    from repositories import repos
+
+    user = {
+        "id": str(uuid.uuid4()), "name": "Cache Test", "email": f"{uuid.uuid4().hex}@example.com",
+        "password": "x", "role": "user", "plan": "Free", "createdAt": datetime.utcnow(),
+        "credits": {
+            "searchesRemaining": 5, "searchesUsedToday": 0, "exportsRemaining": 3, "exportsUsedThisMonth": 0,
+            "aiGenerationsRemaining": 3, "aiGenerationsUsedToday": 0, "lastResetDate": datetime.utcnow(),
+        },
+    }
+    asyncio.run(repos.users.create(user))
+    token = create_access_token({"sub": user["id"], "role": "user"})
+    assert me_after(token=token)["plan"] == "Free"
+    return user, token
+
+def test_upgrading_shows_the_new_plan_at_once(account):
+    from repositories import repos
+
+    user, token = account
+    now = datetime.utcnow()
+    asyncio.run(repos.plans.create({
+        "id": "plan-pro", "name": "Pro", "description": "", "price": 10, "billing": "month", "features": [],
+        "searchesPerDay": 50, "aiGenerations": 20, "exportsPerMonth": 30, "resultsPerCategory": 9,
+        "isPopular": False, "isActive": True, "createdAt": now, "updatedAt": now,
+    }))
+
+    me = me_after(("POST", "/api/users/upgrade", {"planId": "plan-pro"}, token), token=token)
+    assert me["plan"] == "Pro"
+    assert me["credits"]["searchesRemaining"] == 50
+
+def test_admin_credit_writes_show_at_once(account):
+    from auth import create_access_token
+
+    user, token = account
+    admin = create_access_token({"sub": "admin-1", "role": "admin"})
+
+    me = me_after(("PUT", f"/api/admin/users/{user['id']}/credits", {"searchesRemaining": 42}, admin), token=token)
+    assert me["credits"]["searchesRemaining"] == 42
@@ -0,0 +1,204 @@
+"""Credit ledger: no request may spend a credit the user does not have.
+
+The proof that matters is the Motor engine against a real mongod, where the
+consumes genuinely interleave on the server. It runs whenever TEST_MONGO_URL
+is set or a mongod binary is on PATH, and is skipped otherwise. Without
+either, the memory engine cannot race (it never awaits between the read and
+the write), and mongomock applies operations one at a time; there the
+pipeline's filter is still checked through the stored balance, and
+test_consume_is_one_conditional_update checks the update is never split into
+a read and a write.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import skip_exhaustion_on_mongomock
+
+CONCURRENT_REQUESTS = 2000
+
+def new_user(credits: dict, plan: str = "Free"):
+    return {
+        "id": str(uuid.uuid4()),
+        "name": "Ledger Test",
+        "email": f"{uuid.uuid4().hex}@example.com",
+        "password": "x",
+        "role": "user",
+        "plan": plan,
+        "credits": credits,
+        "createdAt": datetime.utcnow(),
+    }
+
+async def consume_concurrently(user_id: str, kind: str, attempts: int):
+    """Fire attempts consumes at once; returns (successes, status codes of failures)"""
+    from fastapi import HTTPException
+    from ledger import consume_credit
+
+    outcomes = await asyncio.gather(
+        *(consume_credit(user_id, kind) for _ in range(attempts)), return_exceptions=True
+    )
+    failures = [o for o in outcomes if isinstance(o, BaseException)]
+    for failure in failures:
+        if not isinstance(failure, HTTPException):
+            raise failure
+    return len(outcomes) - len(failures), {f.status_code for f in failures}
+
+@pytest.mark.parametrize("balance", [0, 1, 7, 50])
+def test_concurrent_consumes_spend_exactly_the_balance(engine, balance):
+    from repositories import repos
+
+    user = new_user({
+        "searchesRemaining": balance, "searchesUsedToday": 0,
+        "exportsRemaining": 0, "exportsUsedThisMonth": 0,
+        "lastResetDate": datetime.utcnow(),
+    })
+
+    async def run():
+        await repos.users.create(user)
+        successes, statuses = await consume_concurrently(user["id"], "searches", CONCURRENT_REQUESTS)
+        return successes, statuses, await repos.users.get(user["id"])
+
+    successes, statuses, stored = asyncio.run(run())
+    if engine == "mongomock":
+        # The update spending the last credit is reported as a 403 there
+        # (see skip_exhaustion_on_mongomock), so only the balance is exact
+        assert successes <= balance
+    else:
+        assert successes == balance
+    assert statuses == {403}
+    assert stored["credits"]["searchesRemaining"] == 0
+    assert stored["credits"]["searchesUsedToday"] == balance
+
+def test_concurrent_consumes_after_a_due_reset_spend_the_plan_limit(engine):
+    from ledger import DEFAULT_PLAN_LIMITS
+    from repositories import repos
+
+    skip_exhaustion_on_mongomock(engine)
+    # Yesterday's balance is spent; the first consume today refills it
+    user = new_user({
+        "searchesRemaining": 0, "searchesUsedToday": 9,
+        "exportsRemaining": 0, "exportsUsedThisMonth": 0,
+        "lastResetDate": datetime.utcnow() - timedelta(days=1),
+    }, plan="No Such Plan")
+
+    async def run():
+        await repos.users.create(user)
+        successes, _ = await consume_concurrently(user["id"], "searches", CONCURRENT_REQUESTS)
+        return successes, await repos.users.get(user["id"])
+
+    successes, stored = asyncio.run(run())
+    assert successes == DEFAULT_PLAN_LIMITS["searchesPerDay"]
+    assert stored["credits"]["searchesRemaining"] == 0
+    assert stored["credits"]["searchesUsedToday"] == DEFAULT_PLAN_LIMITS["searchesPerDay"]
+
+def test_unlimited_balance_is_never_exhausted(engine):
+    from ledger import UNLIMITED
+    from repositories import repos
+
+    user = new_user({
+        "searchesRemaining": UNLIMITED, "searchesUsedToday": 0,
+        "exportsRemaining": UNLIMITED, "exportsUsedThisMonth": 0,
+        "lastResetDate": datetime.utcnow(),
+    }, plan="Pro")
+
+    async def run():
+        await repos.users.create(user)
+        successes, _ = await consume_concurrently(user["id"], "exports", CONCURRENT_REQUESTS)
+        return successes, await repos.users.get(user["id"])
+
+    successes, stored = asyncio.run(run())
+    assert successes == CONCURRENT_REQUESTS
+    assert stored["credits"]["exportsRemaining"] == UNLIMITED
+    assert stored["credits"]["exportsUsedThisMonth"] == CONCURRENT_REQUESTS
+
+def test_refund_restores_a_consumed_credit(engine):
+    from ledger import consume_credit, refund_credit
+    from repositories import repos
+
+    skip_exhaustion_on_mongomock(engine)
+    user = new_user({
+        "searchesRemaining": 1, "searchesUsedToday": 0,
+        "exportsRemaining": 0, "exportsUsedThisMonth": 0,
+        "lastResetDate": datetime.utcnow(),
+    })
+
+    async def run():
+        await repos.users.create(user)
+        await consume_credit(user["id"], "searches")
+        await refund_credit(user["id"], "searches")
+        successes, _ = await consume_concurrently(user["id"], "searches", CONCURRENT_REQUESTS)
+        return successes
+
+    assert asyncio.run(run()) == 1
+
+def test_consume_is_one_conditional_update(engine):
+    """The check and the deduction must be a single server-side update"""
+    from ledger import consume_credit
+    from repositories import repos
+
+    if engine == "memory":
+        pytest.skip("the memory engine has no collection to watch")
+    collection = repos.users.collection
+    calls = []
+
+    class Recording:
+        def __getattr__(self, name):
+            calls.append(name)
+            return getattr(collection, name)
+
+    user = new_user({
+        "searchesRemaining": 5, "searchesUsedToday": 0,
+        "exportsRemaining": 0, "exportsUsedThisMonth": 0,
+        "lastResetDate": datetime.utcnow(),
+    })
+
+    async def run():
+        await repos.users.create(user)
+        repos.users.collection = Recording()
+        try:
+            await consume_credit(user["id"], "searches")
+        finally:
+            repos.users.collection = collection
+
+    asyncio.run(run())
+    assert calls == ["find_one_and_update"]
+
+def test_failed_search_refunds_its_credit(engine, monkeypatch):
+    """Anything failing after the charge, here a stopped history writer"""
+    import httpx
+    import server
+    from auth import create_access_token
+    from models import SearchResult
+    from repositories import repos
+
+    user = new_user({
+        "searchesRemaining": 3, "searchesUsedToday": 0,
+        "exportsRemaining": 0, "exportsUsedThisMonth": 0,
+        "lastResetDate": datetime.utcnow(),
+    })
+
+    async def fetch(query, results_per_category):
+        return SearchResult(painPoints=[], trendingIdeas=[], contentIdeas=[])
+
+    async def stopped(entry, results):
+        raise RuntimeError("history writer is stopped")
+
+    monkeypatch.setattr(server, "search_platforms", fetch)
+    monkeypatch.setattr(server.history_writer, "add", stopped)
+
+    async def run():
+        await repos.users.create(user)
+        transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/api/insights/search", json={"query": f"refund {uuid.uuid4().hex}"},
+                headers={"Authorization": f"Bearer {create_access_token({'sub': user['id'], 'role': 'user'})}"},
+            )
+        return response.status_code, await repos.users.get(user["id"])
+
+    status, stored = asyncio.run(run())
+    assert status == 500
+    assert stored["credits"]["searchesRemaining"] == 3
+    assert stored["credits"]["searchesUsedToday"] == 0
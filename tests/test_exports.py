@@ -0,0 +1,176 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from tests.conftest import skip_exhaustion_on_mongomock
+
+def make_user(exports_remaining: int):
+    return {
+        "id": "user-1", "name": "Export Test", "email": "export@example.com", "password": "x",
+        "role": "user", "plan": "Free", "createdAt": datetime.utcnow(),
+        "credits": {
+            "searchesRemaining": 0, "searchesUsedToday": 0,
+            "exportsRemaining": exports_remaining, "exportsUsedThisMonth": 0,
+            "lastResetDate": datetime.utcnow(),
+        },
+    }
+
+def history_entry(i: int):
+    return {"id": f"search-{i}", "userId": "user-1", "query": "budget", "timestamp": datetime.utcnow()}
+
+async def charge_concurrently(search_ids, attempts: int):
+    from exporter import charge_exports
+    outcomes = await asyncio.gather(
+        *(charge_exports("user-1", search_ids, "csv") for _ in range(attempts)), return_exceptions=True
+    )
+    return sum(1 for outcome in outcomes if not isinstance(outcome, BaseException))
+
+def test_racing_first_exports_are_charged_once(engine):
+    from repositories import repos
+
+    skip_exhaustion_on_mongomock(engine)
+
+    async def scenario():
+        await repos.users.create(make_user(5))
+        await repos.history.insert_many([history_entry(1), history_entry(2)])
+        # Every request read the searches before any of them claimed
+        await charge_concurrently(["search-1", "search-2"], 20)
+        await charge_concurrently(["search-1"], 20)
+        return await repos.users.get("user-1"), await repos.history.find_many(["search-1", "search-2"], "user-1")
+
+    user, searches = asyncio.run(scenario())
+    assert user["credits"]["exportsRemaining"] == 3
+    assert user["credits"]["exportsUsedThisMonth"] == 2
+    assert sorted(s["exports"] for s in searches) == [["csv"], ["csv"]]
+
+def test_export_without_credits_claims_nothing(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.users.create(make_user(1))
+        await repos.history.insert_many([history_entry(1), history_entry(2)])
+        succeeded = await charge_concurrently(["search-1", "search-2"], 5)
+        return succeeded, await repos.history.find_many(["search-1", "search-2"], "user-1")
+
+    succeeded, searches = asyncio.run(scenario())
+    assert succeeded == 0
+    assert all("exports" not in s for s in searches)
+
+def test_csv_starts_with_the_header():
+    from exporter import CSV_HEADER, csv_chunks
+
+    results = {
+        "painPoints": [{"platform": "Reddit", "content": "I hate budgets", "engagement": 3, "source": "r/x"}],
+        "trendingIdeas": [],
+        "contentIdeas": [{"platforms": ["Reddit"], "title": "Answering", "description": "A problem"}],
+    }
+    lines = b"".join(csv_chunks(results)).decode().splitlines()
+    assert lines[0] == ",".join(CSV_HEADER)
+    assert lines[1:] == ["painPoints,Reddit,,I hate budgets,3,,r/x", "contentIdeas,Reddit,Answering,A problem,,,"]
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    import exporter
+    monkeypatch.setattr(exporter, "EXPORT_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(exporter, "EXPORT_CACHE_TTL_HOURS", 1)
+    monkeypatch.setattr(exporter, "EXPORT_CACHE_MAX_MB", 3 / 1024)
+    return tmp_path
+
+def cached_file(directory, name: str, kilobytes: int, age_seconds: float):
+    path = directory / name
+    path.write_bytes(b"x" * 1024 * kilobytes)
+    used = time.time() - age_seconds
+    os.utime(path, (used, used))
+    return path
+
+def test_prune_drops_expired_then_least_recently_used(cache_dir):
+    from exporter import prune_export_cache
+
+    cached_file(cache_dir, "newest.csv", 1, 10)
+    cached_file(cache_dir, "newer.pdf", 1, 20)
+    cached_file(cache_dir, "older.csv", 1, 30)
+    cached_file(cache_dir, "oldest.csv", 1, 40)
+    cached_file(cache_dir, "expired.pdf", 1, 7200)
+    cached_file(cache_dir, "rendering.csv.abc.tmp", 50, 5)
+    cached_file(cache_dir, "crashed.csv.def.tmp", 1, 7200)
+    (cache_dir / "jobs").mkdir()
+
+    assert prune_export_cache() == 3
+    assert sorted(p.name for p in cache_dir.iterdir()) == [
+        "jobs", "newer.pdf", "newest.csv", "older.csv", "rendering.csv.abc.tmp"
+    ]
+
+def test_cache_hits_count_as_use(cache_dir):
+    from exporter import export_response, prune_export_cache
+
+    cached_file(cache_dir, "search-1.csv", 2, 30)
+    cached_file(cache_dir, "search-2.csv", 2, 20)
+
+    asyncio.run(export_response({"id": "search-1", "query": "budget"}, "csv"))
+    prune_export_cache()
+    assert [p.name for p in cache_dir.iterdir()] == ["search-1.csv"]
+
+@pytest.fixture
+def job_queue(engine, tmp_path, monkeypatch):
+    """Export jobs on a mongomock collection, bundles under tmp_path"""
+    import export_jobs
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(export_jobs, "export_jobs_collection", mongomock_motor.AsyncMongoMockClient().db.export_jobs)
+    monkeypatch.setattr(export_jobs, "JOB_DIR", tmp_path / "jobs")
+    return export_jobs
+
+def run_bulk_export(job_queue, monkeypatch, results_for):
+    """Charge and enqueue search-1..3 like the endpoint, then let one worker
+    run the job with results_for(entry) standing in for the stored results"""
+    from exporter import charge_exports
+    from repositories import repos
+
+    async def stored_results(entry):
+        return results_for(entry)
+
+    monkeypatch.setattr(job_queue, "history_results", stored_results)
+    search_ids = ["search-1", "search-2", "search-3"]
+
+    async def scenario():
+        # Enough to stay above the charge, see skip_exhaustion_on_mongomock
+        await repos.users.create(make_user(6))
+        await repos.history.insert_many([history_entry(1), history_entry(2), history_entry(3)])
+        charged = await charge_exports("user-1", search_ids, "csv")
+        job = await job_queue.enqueue_job("user-1", search_ids, "csv", charged)
+        worker = asyncio.create_task(job_queue._worker("worker-1"))
+        while (await job_queue.find_job(job["id"], "user-1"))["status"] in ("queued", "running"):
+            await asyncio.sleep(0.01)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        return (
+            await job_queue.find_job(job["id"], "user-1"),
+            (await repos.users.get("user-1"))["credits"]["exportsRemaining"],
+            {s["id"]: s.get("exports", []) for s in await repos.history.find_many(search_ids, "user-1")},
+        )
+
+    return asyncio.run(scenario())
+
+def test_failed_jobs_refund_every_charged_search(job_queue, monkeypatch):
+    def results_for(entry):
+        if entry["id"] == "search-2":
+            raise RuntimeError("result store unreachable")
+        return {"painPoints": [], "contentIdeas": []}
+
+    job, exports_remaining, exports = run_bulk_export(job_queue, monkeypatch, results_for)
+    assert job["status"] == "failed"
+    assert exports_remaining == 6
+    assert exports == {"search-1": [], "search-2": [], "search-3": []}
+    assert list(job_queue.JOB_DIR.iterdir()) == []
+
+def test_searches_gone_at_build_time_are_refunded(job_queue, monkeypatch):
+    def results_for(entry):
+        return None if entry["id"] == "search-2" else {"painPoints": [], "contentIdeas": []}
+
+    job, exports_remaining, exports = run_bulk_export(job_queue, monkeypatch, results_for)
+    assert job["status"] == "done"
+    assert exports_remaining == 4
+    assert exports == {"search-1": ["csv"], "search-2": [], "search-3": ["csv"]}
+    assert [p.name for p in job_queue.JOB_DIR.iterdir()] == [f"{job['id']}.zip"]
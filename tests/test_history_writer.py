@@ -0,0 +1,123 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+@pytest.fixture
+def repos():
+    from repositories import repos
+    repos.use_backend("memory")
+    yield repos
+    repos.use_backend("memory")
+
+def make_writer(spool_dir=None):
+    from history_writer import HistoryWriter
+    return HistoryWriter(batch_size=10, flush_interval=60, buffer_limit=100, spool_dir=spool_dir)
+
+def record(i: int, user_id: str = "user-1"):
+    entry = {"id": f"search-{i}", "userId": user_id, "query": f"query {i}", "timestamp": datetime(2026, 1, 1)}
+    results = {"painPoints": [], "trendingIdeas": [], "contentIdeas": [], "n": i}
+    return entry, results
+
+def fail_inserts(monkeypatch, repos, error_for):
+    """Make history inserts raise error_for(entries) when it returns an error"""
+    insert_many = repos.history.insert_many
+
+    async def failing(entries):
+        error = error_for(entries)
+        if error is not None:
+            raise error
+        await insert_many(entries)
+
+    monkeypatch.setattr(repos.history, "insert_many", failing)
+
+def stored_ids(repos):
+    return sorted(repos.history.table.rows)
+
+def test_live_workers_segments_are_not_replayed(tmp_path, monkeypatch, repos):
+    owner, newcomer = make_writer(tmp_path), make_writer(tmp_path)
+    outage = {"on": True}
+    fail_inserts(monkeypatch, repos, lambda entries: AutoReconnect("down") if outage["on"] else None)
+
+    async def scenario():
+        await owner.start()
+        for i in range(3):
+            await owner.add(*record(i))
+        with pytest.raises(AutoReconnect):
+            await owner.flush()
+        segments = list(tmp_path.glob("*.segment"))
+
+        # A worker starting meanwhile must leave the owner's segment alone
+        outage["on"] = False
+        await newcomer.start()
+        replayed = stored_ids(repos)
+
+        await owner.flush()
+        await owner.stop()
+        await newcomer.stop()
+        return segments, replayed
+
+    segments, replayed = asyncio.run(scenario())
+    assert len(segments) == 1
+    assert replayed == []
+    assert stored_ids(repos) == ["search-0", "search-1", "search-2"]
+    assert list(tmp_path.glob("history-*")) == []
+
+def test_orphaned_spools_and_segments_are_replayed(tmp_path, repos):
+    from bson import json_util
+
+    for i, suffix in enumerate((".spool", ".segment")):
+        entry, results = record(i)
+        (tmp_path / f"history-1-{i}{suffix}").write_text(json_util.dumps({"entry": entry, "results": results}) + "\n")
+
+    async def scenario():
+        writer = make_writer(tmp_path)
+        await writer.start()
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert stored_ids(repos) == ["search-0", "search-1"]
+    assert list(tmp_path.glob("history-*")) == []
+
+def test_poison_records_are_dead_lettered(tmp_path, monkeypatch, repos):
+    writer = make_writer(tmp_path)
+    fail_inserts(monkeypatch, repos, lambda entries: (
+        ValueError("unwritable") if any(e["id"] == "search-1" for e in entries) else None
+    ))
+
+    async def scenario():
+        await writer.start()
+        for i in range(4):
+            await writer.add(*record(i))
+        await writer.flush()
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert stored_ids(repos) == ["search-0", "search-2", "search-3"]
+    assert writer.stats()["deadLettered"] == 1
+    assert not writer.has_pending_for("user-1")
+    (dead_letter,) = tmp_path.glob("dead-letter-*.jsonl")
+    (line,) = dead_letter.read_text().splitlines()
+    assert json.loads(line)["record"]["entry"]["id"] == "search-1"
+
+def test_transient_failures_keep_records_queued(monkeypatch, repos):
+    writer = make_writer()
+    fail_inserts(monkeypatch, repos, lambda entries: AutoReconnect("down"))
+
+    async def scenario():
+        await writer.start()
+        for i in range(3):
+            await writer.add(*record(i))
+        with pytest.raises(AutoReconnect):
+            await writer.flush()
+        stats = writer.stats()
+        monkeypatch.undo()
+        await writer.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["queueDepth"] == 3
+    assert stats["deadLettered"] == 0
+    assert stored_ids(repos) == ["search-0", "search-1", "search-2"]
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+class FakeCursor:
+    """Motor cursor stand-in whose documents each take delay to arrive"""
+
+    def __init__(self, documents, delay: float):
+        self.documents = documents
+        self.delay = delay
+
+    async def _iterate(self):
+        for document in self.documents:
+            await asyncio.sleep(self.delay)
+            yield document
+
+    def __aiter__(self):
+        return self._iterate()
+
+def latency_series(collection: str, operation: str):
+    from metrics import mongo_latency
+    _, total, count = mongo_latency._series.get((collection, operation), (None, 0.0, 0))
+    return total, count
+
+def test_cursor_iteration_is_timed_once_without_the_consumer():
+    from metrics import InstrumentedCursor
+
+    cursor = InstrumentedCursor(FakeCursor([1, 2, 3], 0.01), "pytest_iteration", "find")
+
+    async def consume():
+        documents = []
+        async for document in cursor:
+            documents.append(document)
+            await asyncio.sleep(0.05)
+        return documents
+
+    assert asyncio.run(consume()) == [1, 2, 3]
+    total, count = latency_series("pytest_iteration", "find")
+    assert count == 1
+    assert 0.03 <= total < 0.15
+
+@pytest.fixture
+def scrape(monkeypatch):
+    """GET /api/metrics with a bearer token; the scrape token is scrape-secret"""
+    import httpx
+    import auth
+    import server
+
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "scrape-secret")
+
+    async def get(token):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            headers = {"Authorization": f"Bearer {token}"} if token else {}
+            return (await client.get("/api/metrics", headers=headers)).status_code
+
+    return lambda token=None: asyncio.run(get(token))
+
+def test_metrics_need_an_admin_or_the_scrape_token(scrape):
+    from auth import create_access_token
+
+    assert scrape() == 403
+    assert scrape(create_access_token({"sub": "user-1", "role": "user"})) == 403
+    assert scrape("wrong-secret") == 401
+
+def test_admins_and_scrapers_read_metrics(scrape):
+    from auth import create_access_token
+
+    assert scrape(create_access_token({"sub": "admin-1", "role": "admin"})) == 200
+    assert scrape("scrape-secret") == 200
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+@pytest.fixture
+def blocked_pool(monkeypatch):
+    """A one-thread pool admitting two calls, whose bcrypt calls block until
+    the returned event is set"""
+    import auth
+
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(auth, "_password_executor", executor)
+    monkeypatch.setattr(auth, "PASSWORD_POOL_MAX_QUEUE", 2)
+
+    def hash_password(password):
+        release.wait(5)
+        return f"hashed:{password}"
+
+    def verify_password(plain_password, hashed_password):
+        release.wait(5)
+        return hashed_password == f"hashed:{plain_password}"
+
+    monkeypatch.setattr(auth, "hash_password", hash_password)
+    monkeypatch.setattr(auth, "verify_password", verify_password)
+    yield release
+    release.set()
+    executor.shutdown(wait=True)
+
+def test_saturated_pool_sheds_load_then_recovers(blocked_pool):
+    from auth import hash_password_async, password_pool_stats, verify_password_async
+
+    async def scenario():
+        running = asyncio.create_task(hash_password_async("a"))
+        queued = asyncio.create_task(verify_password_async("b", "hashed:b"))
+        await asyncio.sleep(0.05)
+        pending = password_pool_stats()["pending"]
+
+        rejected = []
+        for call in (hash_password_async("c"), verify_password_async("c", "hashed:c")):
+            with pytest.raises(HTTPException) as error:
+                await call
+            rejected.append((error.value.status_code, error.value.headers["Retry-After"]))
+
+        blocked_pool.set()
+        drained = await asyncio.gather(running, queued)
+        return pending, rejected, drained, password_pool_stats()["pending"], await hash_password_async("d")
+
+    pending, rejected, drained, pending_after, recovered = asyncio.run(scenario())
+    assert pending == 2
+    assert rejected == [(503, "1"), (503, "1")]
+    assert drained == ["hashed:a", True]
+    assert pending_after == 0
+    assert recovered == "hashed:d"
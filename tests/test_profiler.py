@@ -0,0 +1,109 @@
+import asyncio
+import re
+import threading
+
+import pytest
+
+# Frames may contain spaces (default thread names do); the count follows the last one
+COLLAPSED_LINE = re.compile(r"^[^;]+(;[^;]+)* \d+$")
+
+@pytest.fixture
+def busy_thread():
+    """A thread spinning in spin() until the test finishes"""
+    done = threading.Event()
+
+    def spin():
+        while not done.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=spin, name="busy", daemon=True)
+    thread.start()
+    yield thread
+    done.set()
+    thread.join()
+
+def test_sampled_stacks_collapse_to_one_line_per_stack(busy_thread):
+    from profiler import collapsed_text, sample_stacks
+
+    stacks, rounds = sample_stacks(0.2, 0.005)
+    lines = collapsed_text(stacks).splitlines()
+
+    assert rounds > 0
+    assert all(COLLAPSED_LINE.match(line) for line in lines)
+    busy = [line for line in lines if line.startswith("busy;")]
+    assert busy and all(";test_profiler:busy_thread.<locals>.spin" in line for line in busy)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in busy) == rounds
+    counts = [int(line.rsplit(" ", 1)[1]) for line in lines]
+    assert counts == sorted(counts, reverse=True)
+
+def test_task_dump_classifies_marked_waits():
+    from metrics import waiting_on
+    from profiler import dump_tasks
+
+    async def blocked_on_mongo(release):
+        with waiting_on("mongo", "users.find_one"):
+            await release.wait()
+
+    async def unmarked(release):
+        await release.wait()
+
+    async def scenario():
+        release = asyncio.Event()
+        waiting = [
+            asyncio.create_task(blocked_on_mongo(release), name="mongo-task"),
+            asyncio.create_task(unmarked(release), name="other-task"),
+        ]
+        await asyncio.sleep(0.01)
+        dump = dump_tasks()
+        release.set()
+        await asyncio.gather(*waiting)
+        return dump
+
+    dump = asyncio.run(scenario())
+    tasks = {task["name"]: task for task in dump["tasks"]}
+
+    assert dump["summary"] == {"mongo": 1, "other": 1, "running": 1}
+    mongo = tasks["mongo-task"]
+    assert mongo["state"] == "mongo"
+    assert mongo["waitingOn"] == "users.find_one"
+    assert mongo["waitedSeconds"] >= 0.005
+    assert mongo["stack"][0].endswith("blocked_on_mongo")
+    assert tasks["other-task"]["state"] == "other"
+    assert tasks["other-task"]["waitingOn"] is None
+
+@pytest.fixture
+def get_profile():
+    """GET /api/admin/profile as role with the given query parameters"""
+    import httpx
+    import server
+    from auth import create_access_token
+
+    async def get(role, params):
+        token = create_access_token({"sub": f"{role}-1", "role": role})
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(
+                "/api/admin/profile", params=params, headers={"Authorization": f"Bearer {token}"}
+            )
+
+    return lambda role, **params: asyncio.run(get(role, params))
+
+def test_profile_endpoint_returns_collapsed_stacks(busy_thread, get_profile):
+    response = get_profile("admin", seconds=0.2, format="collapsed")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.headers["content-disposition"].endswith('.folded"')
+    lines = response.text.splitlines()
+    assert lines and all(COLLAPSED_LINE.match(line) for line in lines)
+    assert any(line.startswith("busy;") for line in lines)
+
+def test_profile_endpoint_json_includes_the_task_dump(get_profile):
+    body = get_profile("admin", seconds=0.2).json()
+
+    assert body["samples"] > 0
+    assert all(COLLAPSED_LINE.match(line) for line in body["collapsed"].splitlines())
+    assert body["asyncio"]["summary"]["running"] == 1
+
+def test_profile_endpoint_needs_an_admin(get_profile):
+    assert get_profile("user", seconds=0.2).status_code == 403
@@ -0,0 +1,187 @@
+"""Provider fan-out against local stub HTTP servers that inject latency and
+failures, so timeouts, circuit breakers and partial results are exercised
+over real sockets"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+class StubPlatform:
+    """Serves Reddit, X and YouTube search responses from a local port.
+
+    `delay` (seconds) and `status` apply to every request until changed;
+    `requests` records (path, query parameters) of each one.
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self.status = 200
+        self.posts = 5
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                stub.requests.append((url.path, parse_qs(url.query)))
+                time.sleep(stub.delay)
+                if stub.status != 200:
+                    self.send_error(stub.status)
+                    return
+                body = json.dumps(stub.payload(url.path)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def payload(self, path: str):
+        now = time.time()
+        if path == "/search.json":
+            return {"data": {"children": [
+                {"data": {"id": f"p{i}", "title": f"How do I fix problem {i}?", "subreddit": "help",
+                          "score": 10 * i, "num_comments": i, "created_utc": now - 3600 * i}}
+                for i in range(self.posts)
+            ]}}
+        if path == "/2/tweets/search/recent":
+            return {
+                "data": [
+                    {"id": f"t{i}", "text": f"Trending tip {i}", "author_id": "a",
+                     "public_metrics": {"like_count": i}, "created_at": "2026-01-01T00:00:00Z"}
+                    for i in range(self.posts)
+                ],
+                "includes": {"users": [{"id": "a", "username": "someone"}]},
+            }
+        if path == "/youtube/v3/search":
+            return {"items": [
+                {"id": {"videoId": f"v{i}"}, "snippet": {"title": f"Guide {i}", "channelTitle": "Channel"}}
+                for i in range(self.posts)
+            ]}
+        if path == "/youtube/v3/videos":
+            return {"items": [{"id": f"v{i}", "statistics": {"likeCount": str(i)}} for i in range(self.posts)]}
+        return {}
+
+@pytest.fixture
+def stubs(monkeypatch):
+    """One stub server per platform, wired into the provider registry"""
+    import providers
+
+    servers = {name: StubPlatform() for name in ("Reddit", "X", "YouTube")}
+    registry = [
+        providers.RedditProvider(base_url=servers["Reddit"].url, timeout=0.5),
+        providers.XProvider(base_url=servers["X"].url, bearer_token="token", timeout=0.5),
+        providers.YouTubeProvider(base_url=servers["YouTube"].url, api_key="key", timeout=0.5),
+    ]
+    for provider in registry:
+        provider.breaker.failure_threshold = 2
+        provider.breaker.reset_seconds = 0.2
+    monkeypatch.setattr(providers, "provider_registry", registry)
+    yield servers, {provider.platform: provider for provider in registry}
+    for server in servers.values():
+        server.close()
+
+def search(query: str = "budget", results_per_category: int = 6):
+    import providers
+
+    async def scenario():
+        try:
+            return await providers.search_platforms(query, results_per_category)
+        finally:
+            # The shared client belongs to this test's event loop
+            await providers.close_providers()
+
+    return asyncio.run(scenario())
+
+def test_every_platform_answers(stubs):
+    result = search()
+    assert not result.partial
+    assert {item.platform for item in result.painPoints + result.trendingIdeas} <= {"Reddit", "X", "YouTube"}
+    assert result.painPoints and result.trendingIdeas and result.contentIdeas
+
+def test_slow_platform_is_dropped_within_its_budget(stubs):
+    servers, _ = stubs
+    servers["YouTube"].delay = 1
+
+    started = time.monotonic()
+    result = search()
+    assert time.monotonic() - started < 0.9
+    assert result.partial
+    assert result.failedSources == ["YouTube"]
+
+def test_failing_platform_opens_its_breaker_then_recovers(stubs):
+    servers, registry = stubs
+    servers["X"].status = 503
+
+    for _ in range(2):
+        assert search().failedSources == ["X"]
+    assert registry["X"].breaker.state == "open"
+
+    # While open the platform is skipped without a request
+    calls = len(servers["X"].requests)
+    assert search().failedSources == ["X"]
+    assert len(servers["X"].requests) == calls
+
+    # After the reset interval one trial goes through and closes the breaker
+    servers["X"].status = 200
+    time.sleep(0.25)
+    assert not search().partial
+    assert registry["X"].breaker.state == "closed"
+
+def test_every_platform_failing_raises(stubs):
+    import providers
+
+    servers, _ = stubs
+    for server in servers.values():
+        server.status = 500
+    with pytest.raises(providers.ProviderUnavailable):
+        search()
+
+def test_cancelled_trial_releases_the_half_open_breaker(stubs):
+    import providers
+
+    servers, registry = stubs
+    breaker = registry["Reddit"].breaker
+    breaker.opened_at = time.monotonic() - 1
+    servers["Reddit"].delay = 0.3
+
+    async def cancel_mid_request():
+        task = asyncio.create_task(providers.search_platforms("budget", 6))
+        await asyncio.sleep(0.1)
+        assert breaker.trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await providers.close_providers()
+
+    asyncio.run(cancel_mid_request())
+    assert not breaker.trial_in_flight
+    assert breaker.allow()
+
+def test_per_platform_share_counts_enabled_providers_only(stubs, monkeypatch):
+    servers, registry = stubs
+    monkeypatch.setattr(registry["X"], "bearer_token", None)
+    monkeypatch.setattr(registry["YouTube"], "api_key", None)
+    servers["Reddit"].posts = 30
+
+    result = search(results_per_category=6)
+    # Reddit alone fills every slot and is asked to over-fetch for all of them
+    (_, params), = servers["Reddit"].requests
+    assert params["limit"] == ["24"]
+    assert len(result.painPoints) == 6
+    assert not servers["X"].requests and not servers["YouTube"].requests
@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+def make_cache():
+    from cache import ResponseCache
+    return ResponseCache(ttl=60)
+
+def loader(value, delay: float = 0, calls=None):
+    async def load():
+        if calls is not None:
+            calls.append(value)
+        await asyncio.sleep(delay)
+        return {"version": value}, f'"{value}"'
+    return load
+
+def test_refill_wins_over_a_stale_load_in_progress():
+    cache = make_cache()
+
+    async def scenario():
+        # A reader misses right after the write and reads a lagging secondary
+        reader = asyncio.create_task(cache.get_or_load("pricing:active", loader("stale", delay=0.05)))
+        await asyncio.sleep(0)
+        await cache.refill("pricing:active", loader("fresh"))
+        await reader
+        return await cache.get_or_load("pricing:active", loader("unused"))
+
+    entry = asyncio.run(scenario())
+    assert json.loads(entry.body) == {"version": "fresh"}
+    assert entry.etag == '"fresh"'
+
+def test_failed_refill_leaves_the_entry_invalidated():
+    cache = make_cache()
+
+    async def failing():
+        raise RuntimeError("primary unreachable")
+
+    async def scenario():
+        await cache.get_or_load("seo:home", loader("old"))
+        assert await cache.refill("seo:home", failing) is None
+        calls = []
+        entry = await cache.get_or_load("seo:home", loader("reloaded", calls=calls))
+        return entry, calls
+
+    entry, calls = asyncio.run(scenario())
+    assert calls == ["reloaded"]
+    assert json.loads(entry.body) == {"version": "reloaded"}
@@ -0,0 +1,90 @@
+import random
+
+import numpy as np
+import pytest
+
+def reference_top_k(indices, scores, k: int):
+    """Highest scores first, ties to the earlier candidate"""
+    return sorted(indices, key=lambda i: (-scores[i], i))[:max(k, 0)]
+
+@pytest.mark.parametrize("seed", range(20))
+def test_top_k_matches_sorting(seed):
+    from ranking import top_k
+
+    rng = random.Random(seed)
+    # Few distinct scores, so most cut-offs fall inside a run of ties
+    scores = np.array([rng.randint(0, 4) / 4 for _ in range(60)])
+    indices = np.array(rng.sample(range(60), rng.randint(0, 60)), dtype=np.int64)
+    for k in (0, 1, 3, 10, len(indices), len(indices) + 5):
+        assert top_k(indices, scores, k).tolist() == reference_top_k(indices.tolist(), scores, k)
+
+def test_ties_at_the_cut_off_go_to_the_earlier_candidate():
+    from ranking import top_k
+
+    scores = np.array([0.5, 0.9, 0.5, 0.5, 0.1, 0.5])
+    indices = np.array([5, 4, 3, 2, 1, 0])
+    assert top_k(indices, scores, 3).tolist() == [1, 0, 2]
+
+def candidate(platform: str, i: int, engagement: int, pain: bool):
+    return {
+        "id": f"{platform}-{i}", "platform": platform, "content": ("pain " if pain else "idea ") + str(i),
+        "source": "s", "engagement": engagement, "createdAt": 1_700_000_000.0,
+    }
+
+def is_pain(content: str) -> bool:
+    return content.startswith("pain")
+
+def reference_rank(by_platform: dict, results_per_category: int, now: float):
+    """rank() spelled out with sorted(), on the same scores"""
+    from ranking import CandidateColumns, score
+
+    columns = CandidateColumns(by_platform, is_pain)
+    _, pain_rank, trend_rank = score(columns, now)
+    per_platform = max(results_per_category // len(columns.segments), 1)
+    pains, trends, ideas = [], [], []
+    for start, end in columns.segments:
+        segment = range(start, end)
+        platform_pains = reference_top_k([i for i in segment if columns.is_pain[i]], pain_rank, per_platform)
+        rest = [i for i in segment if i not in platform_pains]
+        platform_trends = reference_top_k(rest, trend_rank, per_platform)
+        pains += platform_pains
+        trends += platform_trends
+        ideas += platform_pains[:1] + platform_trends[:max(per_platform - 1, 0)]
+
+    def ids(indices):
+        return [columns.candidates[i]["id"] for i in indices]
+
+    return (
+        ids(reference_top_k(pains, pain_rank, results_per_category)),
+        ids(reference_top_k(trends, trend_rank, results_per_category)),
+        ids(ideas[:results_per_category]),
+    )
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("results_per_category", [1, 3, 9, 15])
+def test_rank_matches_sorting_and_respects_platform_quotas(seed, results_per_category):
+    from ranking import rank
+
+    rng = random.Random(seed)
+    platforms = ["Reddit", "X", "YouTube"]
+    by_platform = {
+        platform: [
+            candidate(platform, i, rng.choice([0, 5, 50, 500]), rng.random() < 0.5)
+            for i in range(rng.randint(0, 30))
+        ]
+        for platform in platforms
+    }
+    now = 1_700_000_000.0 + 3600
+
+    result = rank(by_platform, results_per_category, is_pain, now)
+    if not any(by_platform.values()):
+        assert result == ([], [], [])
+        return
+    assert tuple([c["id"] for c in category] for category in result) == reference_rank(
+        by_platform, results_per_category, now
+    )
+    per_platform = max(results_per_category // len(platforms), 1)
+    for category in result:
+        assert len(category) <= results_per_category
+        for platform in platforms:
+            assert sum(c["platform"] == platform for c in category) <= per_platform
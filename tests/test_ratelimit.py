@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+
+@pytest.fixture
+def limiter(monkeypatch):
+    import ratelimit
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_IP_PER_MINUTE", 2)
+    monkeypatch.setattr(ratelimit, "bucket_store", ratelimit.MemoryBucketStore())
+    return ratelimit
+
+def request(method: str, path: str, headers=()):
+    return Request({
+        "type": "http", "method": method, "path": path, "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        "client": ("203.0.113.7", 443), "server": ("api", 443), "scheme": "https",
+    })
+
+def statuses(limiter, method: str, path: str, times: int = 5, headers=()):
+    async def call_next(request):
+        return Response("ok")
+
+    async def scenario():
+        return [
+            (await limiter.rate_limit_middleware(request(method, path, headers), call_next)).status_code
+            for _ in range(times)
+        ]
+
+    return asyncio.run(scenario())
+
+@pytest.mark.parametrize("path", ["/api/", "/api/pricing/plans", "/api/seo-settings/home"])
+def test_anonymous_public_gets_share_no_ip_bucket(limiter, path):
+    assert statuses(limiter, "GET", path) == [200] * 5
+
+def test_other_anonymous_requests_are_limited_per_ip(limiter):
+    assert statuses(limiter, "POST", "/api/pricing/plans") == [200, 200, 429, 429, 429]
+    assert statuses(limiter, "GET", "/api/insights/history") == [429] * 5
+
+def test_public_gets_can_be_limited(limiter, monkeypatch):
+    monkeypatch.setattr(limiter, "RATE_LIMIT_PUBLIC_GETS", True)
+    assert statuses(limiter, "GET", "/api/pricing/plans") == [200, 200, 429, 429, 429]
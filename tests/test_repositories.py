@@ -0,0 +1,279 @@
+"""Contract tests: every repository engine must behave the same way"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+def run(coro):
+    return asyncio.run(coro)
+
+def without_id(docs):
+    return [{k: v for k, v in doc.items() if k != "_id"} for doc in docs]
+
+def make_user(i: int, **fields):
+    return {
+        "id": f"user-{i}",
+        "name": f"User {i}",
+        "email": f"user{i}@example.com",
+        "password": "hash",
+        "role": "user",
+        "plan": "Free",
+        "credits": {"searchesRemaining": 5},
+        "createdAt": datetime(2026, 1, 1) + timedelta(days=i),
+        **fields,
+    }
+
+# ==================== users ====================
+
+def test_user_reads_hide_the_password_except_for_login(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.users.create(make_user(1))
+        return await repos.users.get("user-1"), await repos.users.get_by_email("user1@example.com")
+
+    user, login = run(scenario())
+    assert "password" not in user and "_id" not in user
+    assert user["email"] == "user1@example.com"
+    assert login["password"] == "hash"
+
+def test_user_email_and_id_are_unique(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.users.create(make_user(1))
+        with pytest.raises(DuplicateKeyError):
+            await repos.users.create(make_user(2, email="user1@example.com"))
+        with pytest.raises(DuplicateKeyError):
+            await repos.users.create(make_user(3, id="user-1"))
+        return await repos.users.exists("user-2"), await repos.users.exists("user-3")
+
+    assert run(scenario()) == (False, False)
+
+def test_user_set_fields(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.users.create(make_user(1))
+        assert await repos.users.set_fields("user-1", {"plan": "Pro", "credits.searchesRemaining": 9})
+        assert not await repos.users.set_fields("missing", {"plan": "Pro"})
+        return await repos.users.get("user-1")
+
+    user = run(scenario())
+    assert user["plan"] == "Pro"
+    assert user["credits"] == {"searchesRemaining": 9}
+
+def test_user_pages_follow_creation_order_and_filters(engine):
+    from repositories import repos
+
+    async def scenario():
+        for i in range(10):
+            await repos.users.create(make_user(i, plan="Pro" if i % 2 else "Free"))
+        first = await repos.users.list_page(4, fields=("_id", "id"))
+        second = await repos.users.list_page(4, fields=("_id", "id"), after=first[-1]["_id"])
+        pro = await repos.users.list_page(10, fields=("id",), plan="Pro")
+        window = await repos.users.list_page(
+            10, fields=("id",), created_from=datetime(2026, 1, 3), created_to=datetime(2026, 1, 6)
+        )
+        prefix = await repos.users.list_page(10, fields=("id",), email_prefix="user1")
+        iterated = [user["id"] async for user in repos.users.iterate(fields=("id",), plan="Free")]
+        return first, second, pro, window, prefix, iterated
+
+    first, second, pro, window, prefix, iterated = run(scenario())
+    assert [u["id"] for u in first + second] == [f"user-{i}" for i in range(8)]
+    assert pro == [{"id": f"user-{i}"} for i in (1, 3, 5, 7, 9)]
+    assert window == [{"id": f"user-{i}"} for i in (2, 3, 4)]
+    assert prefix == [{"id": "user-1"}]
+    assert iterated == [f"user-{i}" for i in (0, 2, 4, 6, 8)]
+
+def test_filtered_user_pages_follow_the_filtered_field(engine):
+    from repositories import repos, user_sort_field
+
+    async def page_through(**filters):
+        field, ids, after = user_sort_field(**filters), [], None
+        while True:
+            page = await repos.users.list_page(2, after=after, **filters)
+            ids += [user["id"] for user in page]
+            if len(page) < 2:
+                return ids
+            after = (page[-1][field], page[-1]["_id"])
+
+    async def scenario():
+        # Created out of email and signup order; alice and dave signed up at once
+        signups = {"carol": 10, "alice": 8, "dave": 8, "bob": 7, "erin": 9}
+        for i, (name, day) in enumerate(signups.items()):
+            await repos.users.create(make_user(i, email=f"team.{name}@example.com", createdAt=datetime(2026, 1, day)))
+        await repos.users.create(make_user(5, email="zed@example.com"))
+        return await page_through(email_prefix="team."), await page_through(created_from=datetime(2026, 1, 7))
+
+    by_email, by_signup = run(scenario())
+    assert by_email == ["user-1", "user-3", "user-0", "user-2", "user-4"]
+    assert by_signup == ["user-3", "user-1", "user-2", "user-4", "user-0"]
+
+# ==================== plans ====================
+
+def test_plans_may_share_a_name(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.plans.create_many([
+            {"id": "a", "name": "Pro", "isActive": True, "searchesPerDay": 10},
+            {"id": "b", "name": "Pro", "isActive": False, "searchesPerDay": 20},
+        ])
+        with pytest.raises(DuplicateKeyError):
+            await repos.plans.create({"id": "a", "name": "Other", "isActive": True})
+        return await repos.plans.count(), await repos.plans.list(active_only=True)
+
+    count, active = run(scenario())
+    assert count == 2
+    assert [plan["id"] for plan in active] == ["a"]
+
+def test_plan_updates_and_limits(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.plans.create({"id": "a", "name": "Free", "isActive": True, "searchesPerDay": 5, "price": 0})
+        await repos.plans.create({"id": "b", "name": "Pro", "isActive": True, "searchesPerDay": -1, "price": 9})
+        assert await repos.plans.update("a", {"searchesPerDay": 7, "isActive": False})
+        assert not await repos.plans.update("missing", {"searchesPerDay": 1})
+        assert await repos.plans.delete("b")
+        assert not await repos.plans.delete("b")
+        return await repos.plans.get("a"), await repos.plans.list(active_only=True), await repos.plans.limits()
+
+    plan, active, limits = run(scenario())
+    assert plan["searchesPerDay"] == 7
+    assert active == []
+    assert limits == [{"name": "Free", "searchesPerDay": 7}]
+
+# ==================== history ====================
+
+def history_entry(i: int, user_id: str = "user-1", **fields):
+    return {
+        "id": f"search-{i:03d}",
+        "userId": user_id,
+        "query": f"query {i}",
+        "resultHash": f"hash-{i}",
+        "timestamp": datetime(2026, 1, 1) + timedelta(minutes=i // 2),
+        **fields,
+    }
+
+def test_history_insert_skips_written_ids(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.history.insert_many([history_entry(1), history_entry(2)])
+        await repos.history.insert_many([history_entry(2, query="replayed"), history_entry(3)])
+        return await repos.history.get("search-002", "user-1"), await repos.history.list_page("user-1", 10)
+
+    entry, page = run(scenario())
+    assert entry["query"] == "query 2"
+    assert len(page) == 3
+
+def test_history_is_private_to_its_user(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.history.insert_many([history_entry(1), history_entry(2, user_id="user-2")])
+        return (
+            await repos.history.get("search-001", "user-2"),
+            await repos.history.find_many(["search-001", "search-002"], "user-1"),
+        )
+
+    entry, found = run(scenario())
+    assert entry is None
+    assert without_id(found) == [{"id": "search-001"}]
+
+def test_history_pages_are_newest_first_with_a_keyset_cursor(engine):
+    from repositories import repos
+
+    async def scenario():
+        # Pairs of entries share a timestamp, so the id breaks ties
+        await repos.history.insert_many([history_entry(i) for i in range(7)])
+        pages, before = [], None
+        while True:
+            page = await repos.history.list_page("user-1", 3, before=before)
+            if not page:
+                return pages
+            pages.append([entry["id"] for entry in page])
+            before = (page[-1]["timestamp"], page[-1]["id"])
+
+    pages = run(scenario())
+    assert pages == [
+        ["search-006", "search-005", "search-004"],
+        ["search-003", "search-002", "search-001"],
+        ["search-000"],
+    ]
+
+def test_history_exports_and_results(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.history.insert_many([history_entry(1), history_entry(2), history_entry(3, user_id="user-2")])
+        claims = [
+            await repos.history.claim_exports(["search-001"], "user-1", "csv"),
+            await repos.history.claim_exports(["search-001", "search-002"], "user-1", "csv"),
+            # Another user's search is never claimed
+            await repos.history.claim_exports(["search-003"], "user-1", "csv"),
+        ]
+        await repos.history.put_results([{"_id": "hash-1", "painPoints": ["first"]}])
+        await repos.history.put_results([{"_id": "hash-1", "painPoints": ["second"]}])
+        return (
+            claims,
+            await repos.history.find_many(["search-001", "search-002"], "user-1"),
+            await repos.history.get_results("hash-1"),
+            await repos.history.get_results("hash-2"),
+        )
+
+    claims, found, stored, missing = run(scenario())
+    assert claims == [["search-001"], ["search-002"], []]
+    assert sorted((entry["id"], entry["exports"]) for entry in found) == [
+        ("search-001", ["csv"]), ("search-002", ["csv"])
+    ]
+    assert stored["painPoints"] == ["first"]
+    assert missing is None
+
+# ==================== settings, admins, revocations ====================
+
+def test_seo_upsert_keeps_the_id(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.settings.upsert_seo("home", {"title": "One"})
+        created = await repos.settings.get_seo("home")
+        await repos.settings.upsert_seo("home", {"title": "Two"})
+        return created, await repos.settings.get_seo("home"), await repos.settings.count_seo()
+
+    created, updated, count = run(scenario())
+    assert updated["title"] == "Two"
+    assert updated["id"] == created["id"]
+    assert count == 1
+
+def test_admin_usernames_are_unique(engine):
+    from repositories import repos
+
+    async def scenario():
+        await repos.admins.create({"username": "root", "password": "hash"})
+        with pytest.raises(DuplicateKeyError):
+            await repos.admins.create({"username": "root", "password": "other"})
+        return await repos.admins.get_by_username("root")
+
+    assert run(scenario())["password"] == "hash"
+
+def test_revocation_keys_skip_expired_and_older_entries(engine):
+    from repositories import repos
+
+    # Real time: mongomock applies the TTL index as documents are read
+    now = datetime.utcnow()
+
+    async def scenario():
+        await repos.revocations.revoke("jti:old", {"revokedAt": now - timedelta(hours=2), "expiresAt": now + timedelta(days=1)})
+        await repos.revocations.revoke("jti:new", {"revokedAt": now - timedelta(minutes=1), "expiresAt": now + timedelta(days=1)})
+        await repos.revocations.revoke("jti:expired", {"revokedAt": now - timedelta(days=2), "expiresAt": now - timedelta(days=1)})
+        every = [doc["_id"] async for doc in repos.revocations.keys(now)]
+        recent = [doc["_id"] async for doc in repos.revocations.keys(now, since=now - timedelta(hours=1))]
+        return every, recent
+
+    every, recent = run(scenario())
+    assert every == ["jti:old", "jti:new"]
+    assert recent == ["jti:new"]
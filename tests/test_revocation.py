@@ -0,0 +1,147 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+def make_user():
+    return {
+        "id": f"user-{uuid.uuid4().hex[:8]}", "name": "Revocation Test", "email": f"{uuid.uuid4().hex}@example.com",
+        "password": "x", "role": "user", "plan": "Free", "createdAt": datetime.utcnow(),
+        "credits": {"searchesRemaining": 1, "searchesUsedToday": 0, "lastResetDate": datetime.utcnow()},
+    }
+
+def user_token(user_id: str) -> str:
+    from auth import create_access_token
+    return create_access_token({"sub": user_id, "role": "user"})
+
+def bearer(token: str):
+    return {"Authorization": f"Bearer {token}"}
+
+# ==================== Bloom filter ====================
+
+def test_bloom_has_no_false_negatives_and_stays_near_its_error_rate():
+    from revocation import BloomFilter
+
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    members = [f"jti:{i}" for i in range(1000)]
+    for key in members:
+        bloom.add(key)
+    false_positives = sum(f"jti:other-{i}" in bloom for i in range(20000))
+
+    assert all(key in bloom for key in members)
+    assert false_positives / 20000 < 0.02
+    # m = -n ln p / ln(2)^2 bits, k = m/n ln 2 probes
+    assert bloom.size == 9585
+    assert bloom.hashes == 7
+
+def test_bloom_counts_distinct_keys():
+    from revocation import BloomFilter
+
+    bloom = BloomFilter(capacity=100, error_rate=0.001)
+    for _ in range(3):
+        bloom.add("user:1")
+    bloom.add("user:2")
+    assert bloom.count == 2
+    assert "user:3" not in bloom
+
+# ==================== Revocation list ====================
+
+@pytest.fixture
+def revocations(engine):
+    """The worker's revocation list, rebuilt from the engine's empty store"""
+    from revocation import revocation_list
+    asyncio.run(revocation_list.rebuild())
+    return revocation_list
+
+def test_bloom_false_positives_fall_through_to_the_store(revocations, monkeypatch):
+    from repositories import repos
+    from revocation import token_key
+
+    payload = {"sub": "user-1", "jti": "never-revoked", "iat": time.time()}
+    # Another key hashing onto the same bits would look exactly like this
+    revocations.bloom.add(token_key("never-revoked"))
+    lookups = []
+    get = repos.revocations.get
+
+    async def recording_get(key):
+        lookups.append(key)
+        return await get(key)
+
+    monkeypatch.setattr(repos.revocations, "get", recording_get)
+    assert asyncio.run(revocations.is_revoked(payload)) is False
+    assert lookups == [token_key("never-revoked")]
+
+def test_other_workers_see_a_revocation_after_refresh(revocations):
+    from revocation import RevocationList
+
+    other_worker = RevocationList(1000, 0.001, refresh_seconds=60, rebuild_seconds=3600)
+    payload = {"sub": "user-1", "jti": uuid.uuid4().hex, "iat": time.time(), "exp": time.time() + 3600}
+
+    async def scenario():
+        await other_worker.rebuild()
+        await revocations.revoke_token(payload)
+        seen = [await revocations.is_revoked(payload), await other_worker.is_revoked(payload)]
+        await other_worker.refresh()
+        return seen + [await other_worker.is_revoked(payload)]
+
+    assert asyncio.run(scenario()) == [True, False, True]
+
+# ==================== Endpoints ====================
+
+def call(*requests):
+    """Send (method, path, token) requests in order; returns their statuses"""
+    import httpx
+    import server
+
+    async def send():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [
+                (await client.request(method, path, headers=bearer(token))).status_code
+                for method, path, token in requests
+            ]
+
+    return asyncio.run(send())
+
+def create(user):
+    from repositories import repos
+    asyncio.run(repos.users.create(user))
+    return user
+
+def test_logout_revokes_only_that_token(revocations):
+    user = create(make_user())
+    token, other = user_token(user["id"]), user_token(user["id"])
+
+    assert call(
+        ("GET", "/api/auth/me", token),
+        ("POST", "/api/auth/logout", token),
+        ("GET", "/api/auth/me", token),
+        ("GET", "/api/auth/me", other),
+    ) == [200, 200, 401, 200]
+
+def test_logout_all_revokes_tokens_issued_before_it(revocations):
+    user = create(make_user())
+    earlier, current = user_token(user["id"]), user_token(user["id"])
+
+    assert call(("POST", "/api/auth/logout-all", current)) == [200]
+    later = user_token(user["id"])
+    assert call(
+        ("GET", "/api/auth/me", earlier),
+        ("GET", "/api/auth/me", current),
+        ("GET", "/api/auth/me", later),
+    ) == [401, 401, 200]
+
+def test_admins_revoke_every_token_of_a_user(revocations):
+    from auth import create_access_token
+
+    user = create(make_user())
+    token = user_token(user["id"])
+    admin = create_access_token({"sub": "admin-1", "role": "admin"})
+
+    assert call(
+        ("POST", f"/api/admin/users/{user['id']}/revoke-tokens", admin),
+        ("GET", "/api/auth/me", token),
+        ("POST", "/api/admin/users/no-such-user/revoke-tokens", admin),
+    ) == [200, 401, 404]
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+def make_cache():
+    from search_cache import SearchCache
+    return SearchCache(ttl=60, size=10, shared=False)
+
+def make_result(description: str = "A {query} topic gaining traction on Reddit (r/help)"):
+    from models import ContentIdea, SearchResult
+    return SearchResult(
+        painPoints=[], trendingIdeas=[],
+        contentIdeas=[ContentIdea(id="idea:1", title="Your take on: tips", description=description, platforms=["Reddit"])],
+    )
+
+class SlowFetch:
+    """fetch() stand-in that counts calls and finishes when released"""
+
+    def __init__(self, outcome=None):
+        self.calls = 0
+        self.outcome = outcome if outcome is not None else make_result()
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+def test_cancelling_the_first_caller_does_not_cancel_the_others():
+    cache = make_cache()
+
+    async def scenario():
+        fetch = SlowFetch()
+        leader = asyncio.create_task(cache.get_or_fetch("budget tips", 3, fetch))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get_or_fetch("budget tips", 3, fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        fetch.release.set()
+        results = await asyncio.gather(*waiters)
+        assert leader.cancelled()
+        return fetch.calls, results
+
+    calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert all(result == make_result() for result in results)
+    assert cache.stats()["coalesced"] == 3
+
+def test_fetch_outlives_every_caller_and_fills_the_cache():
+    cache = make_cache()
+
+    async def scenario():
+        fetch = SlowFetch()
+        caller = asyncio.create_task(cache.get_or_fetch("budget tips", 3, fetch))
+        await asyncio.sleep(0)
+        caller.cancel()
+        fetch.release.set()
+        while cache.stats()["inFlight"]:
+            await asyncio.sleep(0)
+        return await cache.get_or_fetch("budget tips", 3, fetch), fetch.calls
+
+    result, calls = asyncio.run(scenario())
+    assert result == make_result()
+    assert calls == 1
+    assert cache.stats()["memoryHits"] == 1
+
+def test_failure_reaches_every_caller_and_is_not_cached():
+    cache = make_cache()
+
+    async def scenario():
+        fetch = SlowFetch(RuntimeError("upstream down"))
+        callers = [asyncio.create_task(cache.get_or_fetch("budget tips", 3, fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        fetch.release.set()
+        outcomes = await asyncio.gather(*callers, return_exceptions=True)
+        retry = SlowFetch()
+        retry.release.set()
+        return outcomes, await cache.get_or_fetch("budget tips", 3, retry), fetch.calls
+
+    outcomes, result, calls = asyncio.run(scenario())
+    assert calls == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert result == make_result()
+
+def test_cached_results_are_rendered_for_each_query():
+    from providers import render_for_query
+
+    cache = make_cache()
+
+    async def scenario():
+        fetch = SlowFetch()
+        fetch.release.set()
+        first = render_for_query(await cache.get_or_fetch("Budget tips!", 3, fetch), "Budget tips!")
+        second = render_for_query(await cache.get_or_fetch("budget tip", 3, fetch), "budget tip")
+        return first, second, fetch.calls
+
+    first, second, calls = asyncio.run(scenario())
+    assert calls == 1
+    assert first.contentIdeas[0].description == "A Budget tips! topic gaining traction on Reddit (r/help)"
+    assert second.contentIdeas[0].description == "A budget tip topic gaining traction on Reddit (r/help)"
+
+@pytest.mark.parametrize("query", ["my {query} budget", "100% {braces}"])
+def test_rendering_treats_the_query_as_plain_text(query):
+    from providers import render_for_query
+
+    rendered = render_for_query(make_result(), query)
+    assert rendered.contentIdeas[0].description == f"A {query} topic gaining traction on Reddit (r/help)"